@@ -1,15 +1,24 @@
+import os
 import json
-import numpy as np
 from typing import List, Dict
 import re
-from rank_bm25 import BM25Okapi
-from functools import lru_cache
+from src.bm25_index import BM25Index
+from src.retrieval_cache import RetrievalCache
 
 class RAGModule:
-    def __init__(self, example_db_path='question.json'):
-        """初始化RAG模块（关键词检索版）"""
+    def __init__(self, example_db_path='question.json', cache_path=None, cache_size=1000, index_path=''):
+        """
+        初始化RAG模块（关键词检索版）
+
+        Args:
+            index_path: BM25 索引文件，默认是示例库旁的 <示例库>_bm25.npz；None 表示不持久化
+        """
         self.example_db = self._load_examples(example_db_path)
-        self._preprocess_keywords()
+        if index_path == '':
+            index_path = os.path.splitext(example_db_path)[0] + '_bm25.npz'
+        self._preprocess_keywords(index_path)
+        # 示例库内容变化时检索缓存自然失效
+        self.cache = RetrievalCache(f"bm25:{self.bm25.corpus_hash}", cache_size, cache_path)
 
     def _load_examples(self, path: str) -> List[Dict]:
         """加载示例数据库"""
@@ -25,17 +34,16 @@ class RAGModule:
         tokens = re.findall(r"\b\w+\b|!=|>=|<=|==|=|>|<|\+|-|\*|/|\(|\)", text.lower())
         return [t for t in tokens if len(t) > 1 or t in {'=', '>', '<', '(', ')'}]
 
-    def _preprocess_keywords(self):
-        """预处理关键词索引"""
+    def _preprocess_keywords(self, index_path=None):
+        """预处理关键词索引（示例库未变化时直接加载磁盘上的索引）"""
         # 准备检索文本 (问题+证据)
         self.example_texts = [
             f"{ex.get('question', '')} {ex.get('evidence', '')}"
             for ex in self.example_db
         ]
         
-        # BM25初始化
-        tokenized_corpus = [self._sql_tokenizer(text) for text in self.example_texts]
-        self.bm25 = BM25Okapi(tokenized_corpus)
+        # BM25初始化：按语料哈希复用已持久化的倒排索引
+        self.bm25 = BM25Index.load_or_build(index_path, self.example_texts, tokenizer=self._sql_tokenizer)
 
     def _extract_full_examples(self, prompt: str) -> List[Dict]:
         """从prompt中提取完整的SQL示例片段（保持原样）"""
@@ -59,10 +67,9 @@ class RAGModule:
                 })
         return examples
 
-    @lru_cache(maxsize=1000)
     def retrieve(self, query: str, top_k: int = 1, min_similarity: float = 0.4) -> List[Dict]:
         """
-        检索相似示例并返回完整的SQL示例片段（接口保持不变）
+        检索相似示例并返回完整的SQL示例片段（接口保持不变，结果经缓存，返回值是独立副本）
         
         Args:
             query: 查询文本
@@ -72,6 +79,15 @@ class RAGModule:
         Returns:
             包含完整SQL示例片段的检索结果列表（格式与原来完全相同）
         """
+        key = self.cache.make_key(query, top_k, min_similarity)
+        results = self.cache.get(key)
+        if results is None:
+            results = self._retrieve(query, top_k, min_similarity)
+            self.cache.put(key, results)
+        return results
+
+    def _retrieve(self, query: str, top_k: int, min_similarity: float) -> List[Dict]:
+        """关键词检索（不经缓存）"""
         self._print_header(f"RAG查询: {query}")
 
         # 中文分词处理
@@ -80,26 +96,24 @@ class RAGModule:
         if not tokenized_query:
             return []
 
-        # 计算BM25分数
-        doc_scores = self.bm25.get_scores(tokenized_query)
-        
-        # 归一化到0-1范围以保持与原来相似度的一致性
-        max_score = max(doc_scores) if max(doc_scores) > 0 else 1
-        normalized_scores = doc_scores / max_score
+        # 倒排索引只对包含查询词的文档打分，直接取前 top_k 个
+        top_indices, top_scores = self.bm25.search(tokenized_query, top_k)
 
-        top_indices = np.argsort(doc_scores)[-top_k:][::-1]
+        # 归一化到0-1范围以保持与原来相似度的一致性（第一名即全体最高分）
+        max_score = top_scores[0] if len(top_scores) and top_scores[0] > 0 else 1
+        normalized_scores = top_scores / max_score
         results = []
 
         print("\n最佳匹配示例:")
-        for i in top_indices:
-            if normalized_scores[i] > min_similarity:
+        for i, score in zip(top_indices, normalized_scores):
+            if score > min_similarity:
                 example = self.example_db[i]
                 # 提取该prompt中的所有完整SQL示例（保持原样）
                 sql_examples = self._extract_full_examples(example.get('prompt', ''))
 
                 if sql_examples:
                     result = {
-                        'similarity': round(float(normalized_scores[i]), 4),  # 保持4位小数
+                        'similarity': round(float(score), 4),  # 保持4位小数
                         'original_question': example.get('question', ''),
                         'evidence': example.get('evidence', ''),
                         'db_id': example.get('db_id', ''),
@@ -131,7 +145,7 @@ class RAGModule:
         tokenized_examples = [self._sql_tokenizer(text) for text in example_texts]
         
         # 临时创建BM25索引
-        temp_bm25 = BM25Okapi(tokenized_examples)
+        temp_bm25 = BM25Index.build(tokenized_examples)
         doc_scores = temp_bm25.get_scores(tokenized_query)
         
         # 归一化分数
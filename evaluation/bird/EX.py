@@ -1,46 +1,45 @@
+import os
 import sys
+import time
 import json
 import argparse
-import sqlite3
-import multiprocessing as mp
-from func_timeout import func_timeout, FunctionTimedOut
+# sql_engine / timing_engine 由 bird 与 spider 共用，放在上一级 evaluation 目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_engine import (MEMORY_LIMIT_MB, ROW_CAP, QueryTimeout, compare_results, deadline, get_connection,
+                        print_cpu_report, run_grouped)
 
 def load_json(dir):
     with open(dir, 'r', encoding='utf8') as j:
         contents = json.loads(j.read())
     return contents
 
-def result_callback(result):
-    exec_result.append(result)
-
-def execute_sql(predicted_sql, ground_truth, db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def execute_sql(predicted_sql, ground_truth, db_path, meta_time_out, row_cap=ROW_CAP):
+    # 复用工作进程内缓存的只读连接
+    conn = get_connection(db_path)
     try:
-        cursor.execute(predicted_sql)
-        predicted_res = cursor.fetchall()
-        cursor.execute(ground_truth)
-        ground_truth_res = cursor.fetchall()
-        return 1 if set(predicted_res) == set(ground_truth_res) else 0
+        # 超时由 SQLite 进度回调中断，不再另起线程
+        with deadline(conn, meta_time_out):
+            # 流式比较，金标准结果库命中时不再执行金标准 SQL
+            return 1 if compare_results(conn, predicted_sql, ground_truth, db_path, row_cap) else 0
+    except QueryTimeout:
+        raise
     except Exception as e:
         print(f"SQL Error: {e}")
         return 0
-    finally:
-        conn.close()
 
-def execute_model(predicted_sql, ground_truth, db_place, idx, meta_time_out):
+def execute_model(predicted_sql, ground_truth, db_place, idx, meta_time_out, row_cap=ROW_CAP):
+    start = time.process_time_ns()
     try:
-        res = func_timeout(meta_time_out, execute_sql,
-                         args=(predicted_sql, ground_truth, db_place))
+        res = execute_sql(predicted_sql, ground_truth, db_place, meta_time_out, row_cap)
     except KeyboardInterrupt:
         sys.exit(0)
-    except FunctionTimedOut:
+    except QueryTimeout:
         print(f"Timeout on SQL {idx}: {predicted_sql[:100]}...")
         res = 0
     except Exception as e:
         print(f"Error on SQL {idx}: {e}")
         res = 0
-    return {'sql_idx': idx, 'res': res}
+    return {'sql_idx': idx, 'res': res, 'cpu_time': (time.process_time_ns() - start) / 1e9}
 
 def package_sqls(sql_path, db_root_path, mode='gpt', data_mode='dev'):
     clean_sqls = []
@@ -66,21 +65,11 @@ def package_sqls(sql_path, db_root_path, mode='gpt', data_mode='dev'):
             db_path_list.append(f"{db_root_path}{db_name}/{db_name}.sqlite")
     return clean_sqls, db_path_list
 
-def run_sqls_parallel(sqls, db_places, num_cpus=1, meta_time_out=30.0):
-    pool = mp.Pool(processes=num_cpus)
-    results = []
-    for i, sql_pair in enumerate(sqls):
-        predicted_sql, ground_truth = sql_pair
-        results.append(
-            pool.apply_async(
-                execute_model,
-                args=(predicted_sql, ground_truth, db_places[i], i, meta_time_out),
-                callback=result_callback
-            )
-        )
-    pool.close()
-    pool.join()
-    return [r.get() for r in results]
+def run_sqls_parallel(sqls, db_places, num_cpus=1, meta_time_out=30.0, gold_cache=None,
+                      memory_limit_mb=MEMORY_LIMIT_MB, row_cap=ROW_CAP):
+    # 按 db_id 分组分发，结果按 sql_idx 写回，返回顺序与 sqls 一致
+    return run_grouped(execute_model, sqls, db_places, num_cpus=num_cpus, gold_cache=gold_cache,
+                       memory_limit_mb=memory_limit_mb, meta_time_out=meta_time_out, row_cap=row_cap)
 
 def sort_results(list_of_dicts):
     return sorted(list_of_dicts, key=lambda x: x['sql_idx'])
@@ -140,10 +129,12 @@ if __name__ == '__main__':
     parser.add_argument('--mode_predict', type=str, default='gpt')
     parser.add_argument('--difficulty', type=str, default='simple')
     parser.add_argument('--diff_json_path', type=str, required=True)
+    parser.add_argument('--gold_cache', type=str, default='./outputs/gold_cache.sqlite')  # 空字符串表示不缓存金标准结果
+    parser.add_argument('--memory_limit_mb', type=int, default=MEMORY_LIMIT_MB)  # 每个工作进程的 SQLite 堆内存上限，0 表示不限
+    parser.add_argument('--row_cap', type=int, default=ROW_CAP)  # 预测 SQL 最多读取的行数，0 表示不限
+    parser.add_argument('--cpu_report', type=int, default=10)  # 打印 CPU 时间最长的前 N 条查询，0 表示不打印
     args = parser.parse_args()
     
-    exec_result = []
-    
     pred_queries, db_paths = package_sqls(
         args.predicted_sql_path,
         args.db_root_path,
@@ -163,7 +154,10 @@ if __name__ == '__main__':
         query_pairs,
         db_places=db_paths,
         num_cpus=args.num_cpus,
-        meta_time_out=args.meta_time_out
+        meta_time_out=args.meta_time_out,
+        gold_cache=args.gold_cache or None,
+        memory_limit_mb=args.memory_limit_mb,
+        row_cap=args.row_cap
     )
     exec_result = sort_results(exec_result)
     
@@ -175,4 +169,6 @@ if __name__ == '__main__':
     score_lists = [simple_acc, moderate_acc, challenging_acc, acc]
     print_data(score_lists, count_lists)
     print('===========================================================================================')
+    if args.cpu_report:
+        print_cpu_report(exec_result, args.cpu_report)
     print("Finished evaluation")
@@ -1,93 +1,46 @@
 import os
 import sys
 import json
-import numpy as np
 import argparse
-import sqlite3
 import multiprocessing as mp
-from func_timeout import func_timeout, FunctionTimedOut
-import time
 import math
-from contextlib import closing
-from tqdm import tqdm  # 进度条支持
+# sql_engine / timing_engine 由 bird 与 spider 共用，放在上一级 evaluation 目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_engine import MEMORY_LIMIT_MB, ROW_CAP, QueryTimeout, compare_results, deadline, get_connection, run_grouped
+from timing_engine import MIN_ITERATIONS, is_untimed, measure_time_ratio, print_timing_report
 
-# 全局变量改为类封装
-class QueryEvaluator:
-    def __init__(self):
-        self.exec_result = []
-        self.lock = mp.Lock()
-    
-    def result_callback(self, result):
-        with self.lock:
-            self.exec_result.append(result)
-
-def clean_abnormal(input):
-    """剔除3σ以外的异常值"""
-    input = np.asarray(input)
-    if len(input) == 0:
-        return []
-    mean = np.mean(input, axis=0)
-    std = np.std(input, axis=0)
-    return input[(input < mean + 3 * std) & (input > mean - 3 * std)].tolist()
-
-def execute_sql(sql, db_path, max_retry=3):
-    """带重试机制的SQL执行"""
-    for _ in range(max_retry):
-        try:
-            with closing(sqlite3.connect(db_path)) as conn:
-                cursor = conn.cursor()
-                start_time = time.perf_counter_ns()  # 更精确的计时
-                cursor.execute(sql)
-                return time.perf_counter_ns() - start_time
-        except sqlite3.OperationalError as e:
-            if "locked" in str(e) and _ < max_retry - 1:
-                time.sleep(0.1)
-                continue
-            raise
-    return 0
-
-def iterated_execute_sql(predicted_sql, ground_truth, db_path, iterate_num=5):
+def iterated_execute_sql(predicted_sql, ground_truth, db_path, idx, iterate_num=5, meta_time_out=30.0,
+                         min_iterations=MIN_ITERATIONS, row_cap=ROW_CAP):
     """带结果验证的迭代执行"""
-    # 先验证结果正确性
-    with closing(sqlite3.connect(db_path)) as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute(predicted_sql)
-            predicted_res = cursor.fetchall()
-            cursor.execute(ground_truth)
-            ground_truth_res = cursor.fetchall()
-            if set(predicted_res) != set(ground_truth_res):
-                return 0.0
-        except:
-            return 0.0
-    
-    # 性能测试
-    diff_list = []
-    for _ in range(iterate_num):
-        try:
-            pred_time = execute_sql(predicted_sql, db_path)
-            truth_time = execute_sql(ground_truth, db_path)
-            if pred_time > 0 and truth_time > 0:
-                diff_list.append(truth_time / pred_time)
-        except:
-            continue
-    
-    processed_diff = clean_abnormal(diff_list)
-    return sum(processed_diff) / len(processed_diff) if processed_diff else 0.0
+    # 复用工作进程内缓存的只读连接，先验证结果正确性
+    conn = get_connection(db_path)
+    try:
+        with deadline(conn, meta_time_out):
+            if not compare_results(conn, predicted_sql, ground_truth, db_path, row_cap):
+                return 0.0, (0.0, 0.0), 0
+    except QueryTimeout:
+        raise
+    except Exception:
+        return 0.0, (0.0, 0.0), 0
+
+    # 性能测试：预热、随机交替计时，置信区间足够窄时提前停止
+    # 预热加计时总共不超过 meta_time_out 秒（与原先整对 SQL 的时限同一量级），而不是 meta_time_out * iterate_num
+    return measure_time_ratio(conn, predicted_sql, ground_truth, iterate_num, meta_time_out,
+                              budget=meta_time_out, min_iterations=min_iterations, seed=idx)
 
-def execute_model(args):
+def execute_model(predicted_sql, ground_truth, db_place, idx, iterate_num=5, meta_time_out=30.0,
+                  min_iterations=MIN_ITERATIONS, row_cap=ROW_CAP):
     """适配多进程的封装函数"""
-    predicted_sql, ground_truth, db_place, idx, iterate_num, single_timeout = args
     try:
-        time_ratio = func_timeout(single_timeout, iterated_execute_sql,
-                                args=(predicted_sql, ground_truth, db_place, iterate_num))
-    except FunctionTimedOut:
+        time_ratio, ci, iterations = iterated_execute_sql(predicted_sql, ground_truth, db_place, idx, iterate_num,
+                                                          meta_time_out, min_iterations, row_cap)
+    except QueryTimeout:
         sys.stderr.write(f"\nTimeout on query {idx}: {predicted_sql[:50]}...\n")
-        time_ratio = 0
+        time_ratio, ci, iterations = 0, (0.0, 0.0), 0
     except Exception as e:
         sys.stderr.write(f"\nError on query {idx}: {str(e)}\n")
-        time_ratio = 0
-    return {'sql_idx': idx, 'time_ratio': time_ratio}
+        time_ratio, ci, iterations = 0, (0.0, 0.0), 0
+    return {'sql_idx': idx, 'time_ratio': time_ratio, 'ci': ci, 'iterations': iterations}
 
 def package_sqls(sql_path, db_root_path, mode='gpt', data_mode='dev'):
     """SQL加载优化"""
@@ -113,25 +66,20 @@ def package_sqls(sql_path, db_root_path, mode='gpt', data_mode='dev'):
     
     return clean_sqls, db_path_list
 
-def run_sqls_parallel(evaluator, sqls, db_places, num_cpus=4, iterate_num=5, meta_time_out=30.0):
-    """优化后的并行执行"""
-    ctx = mp.get_context('spawn')
-    task_args = [
-        (pred_sql, gt_sql, db_place, i, iterate_num, meta_time_out/iterate_num)
-        for i, (pred_sql, gt_sql, db_place) in enumerate(zip(sqls[0], sqls[1], db_places))
-    ]
-    
-    with ctx.Pool(processes=num_cpus) as pool:
-        results = list(tqdm(
-            pool.imap(execute_model, task_args),
-            total=len(task_args),
-            desc="Evaluating queries"
-        ))
-        for r in results:
-            evaluator.result_callback(r)
+def run_sqls_parallel(sqls, db_places, num_cpus=4, iterate_num=5, meta_time_out=30.0, gold_cache=None,
+                      memory_limit_mb=MEMORY_LIMIT_MB, min_iterations=MIN_ITERATIONS, row_cap=ROW_CAP):
+    """按数据库分组并行执行，每个工作进程绑定一个 CPU，结果按 sql_idx 顺序返回"""
+    return run_grouped(
+        execute_model, list(zip(sqls[0], sqls[1])), db_places,
+        num_cpus=num_cpus, gold_cache=gold_cache, memory_limit_mb=memory_limit_mb,
+        pin_cpu=True, progress=True,
+        iterate_num=iterate_num, meta_time_out=meta_time_out,
+        min_iterations=min_iterations, row_cap=row_cap
+    )
 
 def compute_ves(results):
-    """计算速度评分"""
+    """计算速度评分（budget 内未能计时的正确查询不参与平均）"""
+    results = [r for r in results if not is_untimed(r)]
     if not results:
         return 0.0
     return sum(math.sqrt(r['time_ratio']) for r in results) * 100 / len(results)
@@ -191,15 +139,17 @@ def main():
     parser.add_argument('--data_mode', type=str, default='dev')
     parser.add_argument('--db_root_path', type=str, required=True)
     parser.add_argument('--num_cpus', type=int, default=max(1, mp.cpu_count()-1))
-    parser.add_argument('--meta_time_out', type=float, default=30.0)
-    parser.add_argument('--iterate_num', type=int, default=5)
+    parser.add_argument('--meta_time_out', type=float, default=30.0)  # 单条 SQL 的时限，也是每对 SQL 计时（含预热）的总时长上限
+    parser.add_argument('--iterate_num', type=int, default=5)  # 每条查询最多计时轮数
+    parser.add_argument('--min_iterations', type=int, default=MIN_ITERATIONS)  # 至少计时轮数，之后置信区间足够窄即停止
     parser.add_argument('--mode_gt', type=str, default='gt')
     parser.add_argument('--mode_predict', type=str, default='gpt')
     parser.add_argument('--diff_json_path', type=str, required=True)
+    parser.add_argument('--gold_cache', type=str, default='./outputs/gold_cache.sqlite')  # 空字符串表示不缓存金标准结果
+    parser.add_argument('--memory_limit_mb', type=int, default=MEMORY_LIMIT_MB)  # 每个工作进程的 SQLite 堆内存上限，0 表示不限
+    parser.add_argument('--row_cap', type=int, default=ROW_CAP)  # 预测 SQL 最多读取的行数，0 表示不限
     args = parser.parse_args()
     
-    evaluator = QueryEvaluator()
-    
     print("Loading SQL queries...")
     pred_queries, db_paths = package_sqls(
         args.predicted_sql_path, args.db_root_path, 
@@ -211,18 +161,22 @@ def main():
     )
     
     print(f"Evaluating {len(pred_queries)} queries with {args.num_cpus} cores...")
-    run_sqls_parallel(
-        evaluator,
+    exec_result = run_sqls_parallel(
         (pred_queries, gt_queries),
         db_paths,
         num_cpus=args.num_cpus,
         iterate_num=args.iterate_num,
-        meta_time_out=args.meta_time_out
+        meta_time_out=args.meta_time_out,
+        gold_cache=args.gold_cache or None,
+        memory_limit_mb=args.memory_limit_mb,
+        min_iterations=args.min_iterations,
+        row_cap=args.row_cap
     )
     
     print("\nCalculating results...")
-    scores, counts = compute_ves_by_diff(evaluator.exec_result, args.diff_json_path)
+    scores, counts = compute_ves_by_diff(exec_result, args.diff_json_path)
     print_results(scores, counts)
+    print_timing_report(exec_result, args.iterate_num)
 
 if __name__ == '__main__':
     main()
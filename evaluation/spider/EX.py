@@ -1,9 +1,12 @@
+import os
 import sys
+import time
 import json
 import argparse
-import sqlite3
-import multiprocessing as mp
-from func_timeout import func_timeout, FunctionTimedOut
+# sql_engine / timing_engine 由 bird 与 spider 共用，放在上一级 evaluation 目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_engine import (MEMORY_LIMIT_MB, ROW_CAP, QueryTimeout, compare_results, deadline, get_connection,
+                        print_cpu_report, run_grouped)
 
 
 def load_json(dir):
@@ -12,37 +15,32 @@ def load_json(dir):
     return contents
 
 
-def result_callback(result):
-    exec_result.append(result)
-
-
-def execute_sql(predicted_sql, ground_truth, db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute(predicted_sql)
-    predicted_res = cursor.fetchall()
-    cursor.execute(ground_truth)
-    ground_truth_res = cursor.fetchall()
+def execute_sql(predicted_sql, ground_truth, db_path, meta_time_out, row_cap=ROW_CAP):
+    # 复用工作进程内缓存的只读连接
+    conn = get_connection(db_path)
     res = 0
-    if set(predicted_res) == set(ground_truth_res):
-        res = 1
+    # 超时由 SQLite 进度回调中断，不再另起线程
+    with deadline(conn, meta_time_out):
+        # 流式比较，金标准结果库命中时不再执行金标准 SQL
+        if compare_results(conn, predicted_sql, ground_truth, db_path, row_cap):
+            res = 1
     return res
 
 
-def execute_model(predicted_sql, ground_truth, db_place, idx, meta_time_out):
+def execute_model(predicted_sql, ground_truth, db_place, idx, meta_time_out, row_cap=ROW_CAP):
+    start = time.process_time_ns()
     try:
-        res = func_timeout(meta_time_out, execute_sql,
-                           args=(predicted_sql, ground_truth, db_place))
+        res = execute_sql(predicted_sql, ground_truth, db_place, meta_time_out, row_cap)
     except KeyboardInterrupt:
         sys.exit(0)
-    except FunctionTimedOut:
+    except QueryTimeout:
         result = [(f'timeout',)]
         res = 0
     except Exception as e:
         result = [(f'error',)]
         res = 0
 
-    result = {'sql_idx': idx, 'res': res}
+    result = {'sql_idx': idx, 'res': res, 'cpu_time': (time.process_time_ns() - start) / 1e9}
     return result
 
 
@@ -69,14 +67,11 @@ def package_sqls(sql_path, db_root_path, mode='gpt', data_mode='dev'):
     return clean_sqls, db_path_list
 
 
-def run_sqls_parallel(sqls, db_places, num_cpus=1, meta_time_out=30.0):
-    pool = mp.Pool(processes=num_cpus)
-    for i, sql_pair in enumerate(sqls):
-        predicted_sql, ground_truth = sql_pair
-        pool.apply_async(execute_model, args=(predicted_sql, ground_truth, db_places[i], i, meta_time_out),
-                         callback=result_callback)
-    pool.close()
-    pool.join()
+def run_sqls_parallel(sqls, db_places, num_cpus=1, meta_time_out=30.0, gold_cache=None,
+                      memory_limit_mb=MEMORY_LIMIT_MB, row_cap=ROW_CAP):
+    # 按 db_id 分组分发，结果按 sql_idx 写回，返回顺序与 sqls 一致
+    return run_grouped(execute_model, sqls, db_places, num_cpus=num_cpus, gold_cache=gold_cache,
+                       memory_limit_mb=memory_limit_mb, meta_time_out=meta_time_out, row_cap=row_cap)
 
 
 def sort_results(list_of_dicts):
@@ -155,16 +150,20 @@ if __name__ == '__main__':
     args_parser.add_argument('--mode_predict', type=str, default='gpt')
     args_parser.add_argument('--difficulty', type=str, default='simple')
     args_parser.add_argument('--diff_json_path', type=str, default='')
+    args_parser.add_argument('--gold_cache', type=str, default='./outputs/gold_cache.sqlite')  # 空字符串表示不缓存金标准结果
+    args_parser.add_argument('--memory_limit_mb', type=int, default=MEMORY_LIMIT_MB)  # 每个工作进程的 SQLite 堆内存上限，0 表示不限
+    args_parser.add_argument('--row_cap', type=int, default=ROW_CAP)  # 预测 SQL 最多读取的行数，0 表示不限
+    args_parser.add_argument('--cpu_report', type=int, default=10)  # 打印 CPU 时间最长的前 N 条查询，0 表示不打印
     args = args_parser.parse_args()
-    exec_result = []
-
     pred_queries, db_paths = package_sqls(args.predicted_sql_path, args.db_root_path, mode=args.mode_predict,
                                           data_mode=args.data_mode)
     gt_queries, db_paths_gt = package_sqls(args.ground_truth_path, args.db_root_path, mode='gt',
                                            data_mode=args.data_mode)
 
     query_pairs = list(zip(pred_queries, gt_queries))
-    run_sqls_parallel(query_pairs, db_places=db_paths, num_cpus=args.num_cpus, meta_time_out=args.meta_time_out)
+    exec_result = run_sqls_parallel(query_pairs, db_places=db_paths, num_cpus=args.num_cpus,
+                                    meta_time_out=args.meta_time_out, gold_cache=args.gold_cache or None,
+                                    memory_limit_mb=args.memory_limit_mb, row_cap=args.row_cap)
     exec_result = sort_results(exec_result)
 
     print('start calculate')
@@ -172,4 +171,6 @@ if __name__ == '__main__':
     score_lists = [easy_acc, medium_acc, hard_acc, extra_acc, acc]
     print_data(score_lists, count_lists)
     print('=====================================================================================================')
+    if args.cpu_report:
+        print_cpu_report(exec_result, args.cpu_report)
     print("Finished evaluation")
@@ -1,71 +1,39 @@
 import os
 import sys
 import json
-import numpy as np
 import argparse
-import sqlite3
-import multiprocessing as mp
-from func_timeout import func_timeout, FunctionTimedOut
-import time
 import math
-
-
-def result_callback(result):
-    exec_result.append(result)
-
-
-def clean_abnormal(input):
-    input = np.asarray(input)
-    processed_list = []
-    mean = np.mean(input, axis=0)
-    std = np.std(input, axis=0)
-    for x in input:
-        if x < mean + 3 * std and x > mean - 3 * std:
-            processed_list.append(x)
-    return processed_list
-
-
-def execute_sql(sql, db_path):
-    # Connect to the database  
-    conn = sqlite3.connect(db_path)
-    # Create a cursor object  
-    cursor = conn.cursor()
-    start_time = time.process_time_ns()
-    cursor.execute(sql)
-    exec_time = time.process_time_ns() - start_time
-    return exec_time
-
-
-def iterated_execute_sql(predicted_sql, ground_truth, db_path, iterate_num):
-    conn = sqlite3.connect(db_path)
-    diff_list = []
-    cursor = conn.cursor()
-    cursor.execute(predicted_sql)
-    predicted_res = cursor.fetchall()
-    cursor.execute(ground_truth)
-    ground_truth_res = cursor.fetchall()
-    time_ratio = 0
-    if set(predicted_res) == set(ground_truth_res):
-        for i in range(iterate_num):
-            predicted_time = execute_sql(predicted_sql, db_path)
-            ground_truth_time = execute_sql(ground_truth, db_path)
-            diff_list.append(ground_truth_time / predicted_time)
-        processed_diff_list = clean_abnormal(diff_list)
-        time_ratio = sum(processed_diff_list) / len(processed_diff_list)
-    return time_ratio
-
-
-def execute_model(predicted_sql, ground_truth, db_place, idx, iterate_num, meta_time_out):
+# sql_engine / timing_engine 由 bird 与 spider 共用，放在上一级 evaluation 目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_engine import MEMORY_LIMIT_MB, ROW_CAP, QueryTimeout, compare_results, deadline, get_connection, run_grouped
+from timing_engine import MIN_ITERATIONS, is_untimed, measure_time_ratio, print_timing_report
+
+
+def iterated_execute_sql(predicted_sql, ground_truth, db_path, idx, iterate_num, meta_time_out,
+                         min_iterations=MIN_ITERATIONS, row_cap=ROW_CAP):
+    # 复用工作进程内缓存的只读连接，先验证结果正确性
+    conn = get_connection(db_path)
+    with deadline(conn, meta_time_out):
+        if not compare_results(conn, predicted_sql, ground_truth, db_path, row_cap):
+            return 0, (0.0, 0.0), 0
+    # 预热、随机交替计时，置信区间足够窄时提前停止
+    # 预热加计时总共不超过 meta_time_out 秒，而不是 meta_time_out * iterate_num
+    return measure_time_ratio(conn, predicted_sql, ground_truth, iterate_num, meta_time_out,
+                              budget=meta_time_out, min_iterations=min_iterations, seed=idx)
+
+
+def execute_model(predicted_sql, ground_truth, db_place, idx, iterate_num, meta_time_out,
+                  min_iterations=MIN_ITERATIONS, row_cap=ROW_CAP):
     try:
-        time_ratio = func_timeout(meta_time_out * iterate_num, iterated_execute_sql,
-                                  args=(predicted_sql, ground_truth, db_place, iterate_num))
+        time_ratio, ci, iterations = iterated_execute_sql(predicted_sql, ground_truth, db_place, idx, iterate_num,
+                                                          meta_time_out, min_iterations, row_cap)
     except KeyboardInterrupt:
         sys.exit(0)
-    except FunctionTimedOut:
-        time_ratio = 0
+    except QueryTimeout:
+        time_ratio, ci, iterations = 0, (0.0, 0.0), 0
     except Exception:
-        time_ratio = 0
-    result = {'sql_idx': idx, 'time_ratio': time_ratio}
+        time_ratio, ci, iterations = 0, (0.0, 0.0), 0
+    result = {'sql_idx': idx, 'time_ratio': time_ratio, 'ci': ci, 'iterations': iterations}
     return result
 
 
@@ -91,14 +59,12 @@ def package_sqls(sql_path, db_root_path, mode='gpt', data_mode='dev'):
     return clean_sqls, db_path_list
 
 
-def run_sqls_parallel(sqls, db_places, num_cpus=1, iterate_num=100, meta_time_out=30.0):
-    pool = mp.Pool(processes=num_cpus)
-    for i, sql_pair in enumerate(sqls):
-        predicted_sql, ground_truth = sql_pair
-        pool.apply_async(execute_model, args=(predicted_sql, ground_truth, db_places[i], i, iterate_num, meta_time_out),
-                         callback=result_callback)
-    pool.close()
-    pool.join()
+def run_sqls_parallel(sqls, db_places, num_cpus=1, iterate_num=100, meta_time_out=30.0, gold_cache=None,
+                      memory_limit_mb=MEMORY_LIMIT_MB, min_iterations=MIN_ITERATIONS, row_cap=ROW_CAP):
+    # 按 db_id 分组分发，每个工作进程绑定一个 CPU，结果按 sql_idx 写回
+    return run_grouped(execute_model, sqls, db_places, num_cpus=num_cpus, gold_cache=gold_cache,
+                       memory_limit_mb=memory_limit_mb, pin_cpu=True, iterate_num=iterate_num,
+                       meta_time_out=meta_time_out, min_iterations=min_iterations, row_cap=row_cap)
 
 
 def sort_results(list_of_dicts):
@@ -106,7 +72,11 @@ def sort_results(list_of_dicts):
 
 
 def compute_ves(exec_results):
+    # budget 内未能计时的正确查询不参与平均
+    exec_results = [r for r in exec_results if not is_untimed(r)]
     num_queries = len(exec_results)
+    if not num_queries:
+        return 0
     total_ratio = 0
     for i, result in enumerate(exec_results):
         if result['time_ratio'] != 0:
@@ -194,12 +164,16 @@ if __name__ == '__main__':
     args_parser.add_argument('--data_mode', type=str, required=True, default='dev')
     args_parser.add_argument('--db_root_path', type=str, required=True, default='')
     args_parser.add_argument('--num_cpus', type=int, default=1)
-    args_parser.add_argument('--meta_time_out', type=float, default=30.0)
+    args_parser.add_argument('--meta_time_out', type=float, default=30.0)  # 单条 SQL 的时限，也是每对 SQL 计时（含预热）的总时长上限
     args_parser.add_argument('--mode_gt', type=str, default='gt')
     args_parser.add_argument('--mode_predict', type=str, default='gpt')
     args_parser.add_argument('--diff_json_path', type=str, default='')
+    args_parser.add_argument('--iterate_num', type=int, default=100)  # 每条查询最多计时轮数
+    args_parser.add_argument('--min_iterations', type=int, default=MIN_ITERATIONS)  # 至少计时轮数，之后置信区间足够窄即停止
+    args_parser.add_argument('--gold_cache', type=str, default='./outputs/gold_cache.sqlite')  # 空字符串表示不缓存金标准结果
+    args_parser.add_argument('--memory_limit_mb', type=int, default=MEMORY_LIMIT_MB)  # 每个工作进程的 SQLite 堆内存上限，0 表示不限
+    args_parser.add_argument('--row_cap', type=int, default=ROW_CAP)  # 预测 SQL 最多读取的行数，0 表示不限
     args = args_parser.parse_args()
-    exec_result = []
 
     pred_queries, db_paths = package_sqls(args.predicted_sql_path, args.db_root_path, mode=args.mode_predict,
                                           data_mode=args.data_mode)
@@ -207,12 +181,15 @@ if __name__ == '__main__':
                                            data_mode=args.data_mode)
 
     query_pairs = list(zip(pred_queries, gt_queries))
-    run_sqls_parallel(query_pairs, db_places=db_paths, num_cpus=args.num_cpus, iterate_num=100,
-                      meta_time_out=args.meta_time_out)
+    exec_result = run_sqls_parallel(query_pairs, db_places=db_paths, num_cpus=args.num_cpus,
+                                    iterate_num=args.iterate_num, meta_time_out=args.meta_time_out,
+                                    gold_cache=args.gold_cache or None, memory_limit_mb=args.memory_limit_mb,
+                                    min_iterations=args.min_iterations, row_cap=args.row_cap)
     exec_result = sort_results(exec_result)
     #print("exec_result 内容：", exec_result)
     easy_ves, medium_ves, hard_ves, extra_ves, ves, count_lists = compute_ves_by_diff(exec_result, args.diff_json_path)
     score_lists = [easy_ves, medium_ves, hard_ves, extra_ves, ves]
     print_data(score_lists, count_lists)
     print('======================================================================================================')
+    print_timing_report(exec_result, args.iterate_num)
     print("Finished evaluation")
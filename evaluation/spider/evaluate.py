@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import argparse
+import importlib.util
+import multiprocessing as mp
+# sql_engine / timing_engine 由 bird 与 spider 共用，放在上一级 evaluation 目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sql_engine import (MEMORY_LIMIT_MB, ROW_CAP, QueryTimeout, compare_results, deadline, get_connection,
+                        print_cpu_report, run_grouped)
+from timing_engine import MIN_ITERATIONS, measure_time_ratio, print_timing_report
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(file_name):
+    """按路径加载同目录下的评测脚本（R-VES.py 不是合法的模块名，不能直接 import）"""
+    name = os.path.splitext(file_name)[0].replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, os.path.join(EVAL_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ex = load_script('EX.py')
+ves = load_script('R-VES.py')
+
+
+def evaluate_pair(predicted_sql, ground_truth, db_path, idx, meta_time_out=30.0, iterate_num=10,
+                  min_iterations=MIN_ITERATIONS, row_cap=ROW_CAP, timing=True):
+    """
+    一对 SQL 的 EX 与 R-VES：在缓存的只读连接上流式比较一次结果，
+    只有结果正确时才在同一连接上计时（R-VES 中错误的预测耗时比记为 0）
+    """
+    result = {'sql_idx': idx, 'res': 0, 'time_ratio': 0, 'ci': (0.0, 0.0), 'iterations': 0}
+    conn = get_connection(db_path)
+    start = time.process_time_ns()
+    try:
+        with deadline(conn, meta_time_out):
+            result['res'] = int(compare_results(conn, predicted_sql, ground_truth, db_path, row_cap))
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except QueryTimeout:
+        print(f"Timeout on SQL {idx}: {predicted_sql[:100]}...")
+    except Exception as e:
+        print(f"SQL Error on SQL {idx}: {e}")
+    result['cpu_time'] = (time.process_time_ns() - start) / 1e9
+    if not (result['res'] and timing):
+        return result
+
+    try:
+        # 预热加计时总共不超过 meta_time_out 秒，与 R-VES.py 一致
+        ratio, ci, iterations = measure_time_ratio(conn, predicted_sql, ground_truth, iterate_num, meta_time_out,
+                                                   budget=meta_time_out,
+                                                   min_iterations=min_iterations, seed=idx)
+        result.update(time_ratio=ratio, ci=ci, iterations=iterations)
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except Exception as e:
+        print(f"Timing failed on SQL {idx}: {e}")
+    return result
+
+
+if __name__ == '__main__':
+    # 一次评测同时给出 EX 和 R-VES：每对 SQL 只比较一次结果，正确的再计时
+    parser = argparse.ArgumentParser("Unified EX / R-VES evaluation")
+    parser.add_argument('--predicted_sql_path', type=str, required=True)
+    parser.add_argument('--ground_truth_path', type=str, required=True)
+    parser.add_argument('--data_mode', type=str, default='dev')
+    parser.add_argument('--db_root_path', type=str, required=True)
+    parser.add_argument('--num_cpus', type=int, default=max(1, mp.cpu_count() - 1))
+    parser.add_argument('--meta_time_out', type=float, default=30.0)  # 单条 SQL 的时限，也是每对 SQL 计时（含预热）的总时长上限
+    parser.add_argument('--iterate_num', type=int, default=10)  # 每条查询最多计时轮数
+    parser.add_argument('--min_iterations', type=int, default=MIN_ITERATIONS)  # 至少计时轮数，之后置信区间足够窄即停止
+    parser.add_argument('--mode_gt', type=str, default='gt')
+    parser.add_argument('--mode_predict', type=str, default='gpt')
+    parser.add_argument('--diff_json_path', type=str, required=True)
+    parser.add_argument('--gold_cache', type=str, default='./outputs/gold_cache.sqlite')  # 空字符串表示不缓存金标准结果
+    parser.add_argument('--memory_limit_mb', type=int, default=MEMORY_LIMIT_MB)  # 每个工作进程的 SQLite 堆内存上限，0 表示不限
+    parser.add_argument('--row_cap', type=int, default=ROW_CAP)  # 预测 SQL 最多读取的行数，0 表示不限
+    parser.add_argument('--skip_ves', action='store_true')  # 只算 EX，不计时
+    parser.add_argument('--cpu_report', type=int, default=10)  # 打印 CPU 时间最长的前 N 条查询，0 表示不打印
+    args = parser.parse_args()
+
+    pred_queries, db_paths = ex.package_sqls(args.predicted_sql_path, args.db_root_path,
+                                             mode=args.mode_predict, data_mode=args.data_mode)
+    gt_queries, _ = ex.package_sqls(args.ground_truth_path, args.db_root_path,
+                                    mode='gt', data_mode=args.data_mode)
+
+    print(f"Evaluating {len(pred_queries)} queries with {args.num_cpus} cores...")
+    exec_result = run_grouped(
+        evaluate_pair, list(zip(pred_queries, gt_queries)), db_paths,
+        num_cpus=args.num_cpus, gold_cache=args.gold_cache or None, memory_limit_mb=args.memory_limit_mb,
+        pin_cpu=not args.skip_ves, progress=True,
+        meta_time_out=args.meta_time_out, iterate_num=args.iterate_num,
+        min_iterations=args.min_iterations, row_cap=args.row_cap, timing=not args.skip_ves
+    )
+
+    print('start calculate')
+    easy_acc, medium_acc, hard_acc, extra_acc, acc, count_lists = ex.compute_acc_by_diff(
+        exec_result, args.diff_json_path)
+    ex.print_data([easy_acc, medium_acc, hard_acc, extra_acc, acc], count_lists)
+    if not args.skip_ves:
+        easy_ves, medium_ves, hard_ves, extra_ves, all_ves, count_lists = ves.compute_ves_by_diff(
+            exec_result, args.diff_json_path)
+        ves.print_data([easy_ves, medium_ves, hard_ves, extra_ves, all_ves], count_lists)
+        print_timing_report(exec_result, args.iterate_num)
+    if args.cpu_report:
+        print_cpu_report(exec_result, args.cpu_report)
+    print("Finished evaluation")
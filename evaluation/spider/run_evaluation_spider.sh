@@ -7,13 +7,10 @@ num_cpus=16
 meta_time_out=30.0
 mode_gt='gt'
 mode_predict='gpt'
+iterate_num=30  # 计时轮数上限，置信区间足够窄时提前停止
 
-echo '''starting to compare with knowledge for ex'''
-python3 -u ./evaluation/evaluation.py --db_root_path ${db_root_path} --predicted_sql_path ${predicted_sql_path_kg} --data_mode ${data_mode} \
+echo '''starting to compare with knowledge for ex and ves'''
+# EX 与 R-VES 一次完成：每对 SQL 只比较一次结果，正确的再计时（--skip_ves 只算 EX）
+python3 -u ./evaluation/spider/evaluate.py --db_root_path ${db_root_path} --predicted_sql_path ${predicted_sql_path_kg} --data_mode ${data_mode} \
 --ground_truth_path ${ground_truth_path} --num_cpus ${num_cpus} --mode_gt ${mode_gt} --mode_predict ${mode_predict} \
---diff_json_path ${diff_json_path} --meta_time_out ${meta_time_out} 
-
-echo '''starting to compare with knowledge for ves'''
-python3 -u ./evaluation/evaluation_ves.py --db_root_path ${db_root_path} --predicted_sql_path ${predicted_sql_path_kg} --data_mode ${data_mode} \
---ground_truth_path ${ground_truth_path} --num_cpus ${num_cpus} --mode_gt ${mode_gt} --mode_predict ${mode_predict} \
---diff_json_path ${diff_json_path} --meta_time_out ${meta_time_out} 
\ No newline at end of file
+--diff_json_path ${diff_json_path} --meta_time_out ${meta_time_out} --iterate_num ${iterate_num}
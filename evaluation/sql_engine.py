@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import multiprocessing as mp
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote
+
+try:
+    import resource  # 仅 Unix
+except ImportError:
+    resource = None
+
+MAX_OPEN_DBS = 32  # 每个工作进程最多同时保持打开的数据库连接数
+CHUNK_SIZE = 16  # 同一数据库的任务每 CHUNK_SIZE 条打成一个包分发，兼顾局部性与负载均衡
+HASH_BLOCK_SIZE = 1 << 20  # 计算数据库文件哈希时每次读取的字节数
+PROGRESS_STEPS = 10000  # SQLite 每执行这么多条虚拟机指令检查一次截止时间
+MEMORY_LIMIT_MB = int(os.environ.get('EVAL_MEMORY_LIMIT_MB', 4096))  # 每个工作进程的 SQLite 堆内存上限（0 表示不限）
+# 可选的进程地址空间上限（RLIMIT_AS）兜底，默认关闭：它也计入 numpy/BLAS 线程等预留的虚拟内存，容易误伤正常查询
+ADDRESS_SPACE_LIMIT_MB = int(os.environ.get('EVAL_ADDRESS_SPACE_LIMIT_MB', 0))
+FETCH_SIZE = 1000  # 流式比较时每批读取的行数
+ROW_CAP = int(os.environ.get('EVAL_ROW_CAP', 1000000))  # 预测 SQL 最多读取的行数（金标准行数更多时以金标准为准）
+
+# 工作进程内的只读连接缓存：db_path -> sqlite3.Connection（LRU）
+_connections = OrderedDict()
+# 工作进程内的金标准结果库及数据库文件哈希（由 init_worker 设置）
+_gold_store = None
+_db_hashes = {}
+# 工作进程内新建连接时设置的 SQLite 堆内存上限（由 init_worker 设置）
+_memory_limit_mb = 0
+
+
+def connect_readonly(db_path):
+    """
+    以只读、不可变方式打开数据库：immutable=1 时 SQLite 不加锁、不检查文件变化，
+    评测期间数据库不会被修改，可以放心复用同一连接。
+    """
+    uri = f"file:{quote(os.path.abspath(db_path))}?mode=ro&immutable=1"
+    return sqlite3.connect(uri, uri=True)
+
+
+def set_heap_limit(conn, memory_limit_mb=MEMORY_LIMIT_MB):
+    """
+    在连接上设置 SQLite 堆内存上限：超过 soft 上限时 SQLite 先释放页缓存等可回收内存，
+    仍超过 hard 上限时分配失败，只有当前语句报 out of memory（MemoryError），连接之后照常可用
+    """
+    if not memory_limit_mb:
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    conn.execute(f"PRAGMA hard_heap_limit={limit}")
+    conn.execute(f"PRAGMA soft_heap_limit={limit * 3 // 4}")
+
+
+def set_address_space_limit(limit_mb=ADDRESS_SPACE_LIMIT_MB):
+    """可选兜底：限制整个进程的地址空间，超出时 Python 侧抛出 MemoryError（0 表示不限）"""
+    if not limit_mb:
+        return
+    limit = limit_mb * 1024 * 1024
+    if resource is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def pin_worker_cpu(worker):
+    """把第 worker 个工作进程绑定到一个 CPU（轮流分配），避免计时过程中在核间迁移"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return
+    cpus = sorted(os.sched_getaffinity(0))
+    os.sched_setaffinity(0, {cpus[worker % len(cpus)]})
+
+
+def init_worker(gold_cache=None, db_hashes=None, memory_limit_mb=MEMORY_LIMIT_MB, worker_counter=None,
+                address_space_limit_mb=ADDRESS_SPACE_LIMIT_MB):
+    """
+    进程池 initializer：记录 SQLite 堆内存上限（及可选的地址空间上限、CPU 绑定），
+    每个工作进程从空的连接缓存开始，并各自打开金标准结果库
+
+    worker_counter 是进程间共享的计数器，每个工作进程启动时领取一个编号用于 CPU 绑定；为 None 时不绑定
+    """
+    global _gold_store, _db_hashes, _memory_limit_mb
+    _memory_limit_mb = memory_limit_mb
+    set_address_space_limit(address_space_limit_mb)
+    if worker_counter is not None:
+        with worker_counter.get_lock():
+            worker = worker_counter.value
+            worker_counter.value += 1
+        pin_worker_cpu(worker)
+    _connections.clear()
+    _gold_store = GoldStore(gold_cache) if gold_cache else None
+    _db_hashes = db_hashes or {}
+
+
+def get_connection(db_path):
+    conn = _connections.get(db_path)
+    if conn is None:
+        conn = connect_readonly(db_path)
+        set_heap_limit(conn, _memory_limit_mb)
+        _connections[db_path] = conn
+        while len(_connections) > MAX_OPEN_DBS:
+            _connections.popitem(last=False)[1].close()
+    else:
+        _connections.move_to_end(db_path)
+    return conn
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class ResultTooLarge(Exception):
+    pass
+
+
+@contextmanager
+def deadline(conn, timeout):
+    """
+    在同一线程内限时执行：SQLite 的进度回调发现超过截止时间后中断当前语句
+    （execute 和 fetch 都会被中断），超时抛出 QueryTimeout，连接之后仍可继续使用
+    """
+    end = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: time.monotonic() > end, PROGRESS_STEPS)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if time.monotonic() > end and 'interrupted' in str(e):
+            raise QueryTimeout(f"exceeded {timeout}s") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def _canonical(value):
+    # 与 Python 的相等语义保持一致：1 == 1.0，整数值的浮点数按整数处理
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def row_hash(row):
+    """一行结果的 64 位哈希（对规范化后的 repr 做 blake2b）"""
+    payload = repr(tuple(_canonical(v) for v in row)).encode('utf-8', 'surrogatepass')
+    return int.from_bytes(hashlib.blake2b(payload, digest_size=8).digest(), 'little')
+
+
+def hashes_digest(hashes):
+    """去重后的行哈希集合的摘要（与行顺序、重复次数无关）"""
+    return hashlib.blake2b(array('Q', sorted(hashes)).tobytes(), digest_size=16).hexdigest()
+
+
+def iter_rows(cursor, fetch_size=FETCH_SIZE):
+    """用 fetchmany 分批读取结果行，不一次性物化整个结果集"""
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+class GoldResult:
+    """金标准 SQL 的结果：行数、去重后的行哈希集合及其摘要"""
+
+    def __init__(self, row_count, hashes, digest=None):
+        self.row_count = row_count
+        self.hashes = frozenset(hashes)
+        self.digest = digest or hashes_digest(self.hashes)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows 可以是任意可迭代对象（如 iter_rows 的流式结果），只保留去重后的行哈希"""
+        row_count = 0
+        hashes = set()
+        for row in rows:
+            hashes.add(row_hash(row))
+            row_count += 1
+        return cls(row_count, hashes)
+
+    def matches(self, rows, row_cap=None):
+        """
+        与原来的 set(predicted_res) == set(ground_truth_res) 语义相同
+
+        rows 可以是流式结果：遇到第一条不在金标准中的行立即返回 False，
+        内存只与金标准的去重行数有关；读取的行数超过 row_cap 时抛出 ResultTooLarge
+        """
+        hashes = set()
+        row_count = 0
+        for row in rows:
+            h = row_hash(row)
+            if h not in self.hashes:
+                return False
+            hashes.add(h)
+            row_count += 1
+            if row_cap and row_count > row_cap:
+                raise ResultTooLarge(f"predicted SQL returned more than {row_cap} rows")
+        return len(hashes) == len(self.hashes)
+
+
+class GoldStore:
+    """
+    金标准结果的持久化存储（SQLite），key 为 (金标准 SQL, 数据库文件哈希)
+
+    数据库和金标准 SQL 在多次评测之间不变，缓存命中后只需执行预测 SQL。
+    数据库文件哈希按 (路径, 大小, 修改时间) 记忆，文件不变时不必重新读取整个文件。
+    """
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS gold ("
+            "key TEXT PRIMARY KEY, row_count INTEGER, hashes BLOB, digest TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS db_files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(sql, db_hash):
+        payload = json.dumps({'sql': sql.strip(), 'db': db_hash}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def db_hash(self, db_path):
+        path = os.path.abspath(db_path)
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT size, mtime_ns, hash FROM db_files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+        blake2b = hashlib.blake2b()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                blake2b.update(block)
+        file_hash = blake2b.hexdigest()
+        self.conn.execute("INSERT OR REPLACE INTO db_files VALUES (?, ?, ?, ?)",
+                          (path, stat.st_size, stat.st_mtime_ns, file_hash))
+        self.conn.commit()
+        return file_hash
+
+    def get(self, key):
+        row = self.conn.execute("SELECT row_count, hashes, digest FROM gold WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return GoldResult(row[0], array('Q', row[1]), row[2])
+
+    def put(self, key, gold):
+        hashes = array('Q', sorted(gold.hashes)).tobytes()
+        self.conn.execute("INSERT OR REPLACE INTO gold VALUES (?, ?, ?, ?)",
+                          (key, gold.row_count, hashes, gold.digest))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def prepare_gold_cache(gold_cache, db_places):
+    """在主进程里计算各数据库文件的哈希，供工作进程拼金标准结果的 key"""
+    if not gold_cache:
+        return {}
+    store = GoldStore(gold_cache)
+    try:
+        return {db_path: store.db_hash(db_path) for db_path in set(db_places) if os.path.exists(db_path)}
+    finally:
+        store.close()
+
+
+def load_gold(conn, ground_truth, db_path):
+    """金标准结果：金标准结果库命中时不执行金标准 SQL，否则流式执行并写回结果库（若启用）"""
+    key = None
+    if _gold_store is not None and db_path in _db_hashes:
+        key = GoldStore.make_key(ground_truth, _db_hashes[db_path])
+        gold = _gold_store.get(key)
+        if gold is not None:
+            return gold
+    cursor = conn.execute(ground_truth)
+    try:
+        gold = GoldResult.from_rows(iter_rows(cursor))
+    finally:
+        cursor.close()
+    if key is not None:
+        _gold_store.put(key, gold)
+    return gold
+
+
+def compare_results(conn, predicted_sql, ground_truth, db_path, row_cap=ROW_CAP):
+    """
+    流式比较预测 SQL 与金标准 SQL 的结果（集合语义）
+
+    先执行预测 SQL，出错时不必再执行金标准；然后把金标准结果读成行哈希集合，
+    再分批读取预测结果，第一条不在金标准中的行即判错，不会物化整个预测结果集。
+    """
+    cursor = conn.execute(predicted_sql)
+    try:
+        gold = load_gold(conn, ground_truth, db_path)
+        return gold.matches(iter_rows(cursor), max(row_cap, gold.row_count) if row_cap else None)
+    finally:
+        cursor.close()
+
+
+def group_by_db(db_places, chunk_size=CHUNK_SIZE):
+    """按数据库分组，再切成不超过 chunk_size 的任务包：[(db_path, [idx, ...]), ...]"""
+    groups = OrderedDict()
+    for idx, db_path in enumerate(db_places):
+        groups.setdefault(db_path, []).append(idx)
+    tasks = []
+    for db_path, idxs in groups.items():
+        for start in range(0, len(idxs), chunk_size):
+            tasks.append((db_path, idxs[start:start + chunk_size]))
+    return tasks
+
+
+def _run_chunk(task):
+    func, db_path, items, kwargs = task
+    return [(idx, func(predicted_sql, ground_truth, db_path, idx, **kwargs))
+            for idx, predicted_sql, ground_truth in items]
+
+
+def run_grouped(func, sqls, db_places, num_cpus=1, chunk_size=CHUNK_SIZE, gold_cache=None,
+                memory_limit_mb=MEMORY_LIMIT_MB, pin_cpu=False, progress=False,
+                address_space_limit_mb=ADDRESS_SPACE_LIMIT_MB, **kwargs):
+    """
+    按数据库分组并行执行 func(predicted_sql, ground_truth, db_path, idx, **kwargs)
+
+    结果按下标写入预先分配的列表，返回顺序与 sqls 一致，无需事后排序。
+    func 需是模块顶层函数（可被 pickle）。gold_cache 为金标准结果库路径（None 表示不缓存），
+    memory_limit_mb 为每个工作进程的 SQLite 堆内存上限，address_space_limit_mb 为可选的地址空间上限，pin_cpu 表示把每个工作进程绑定到一个 CPU（计时用），
+    progress 表示显示进度条。
+    """
+    results = [None] * len(sqls)
+    tasks = [(func, db_path, [(idx, *sqls[idx]) for idx in idxs], kwargs)
+             for db_path, idxs in group_by_db(db_places, chunk_size)]
+    db_hashes = prepare_gold_cache(gold_cache, db_places)
+    worker_counter = mp.Value('i', 0) if pin_cpu else None
+    with mp.Pool(processes=num_cpus, initializer=init_worker,
+                 initargs=(gold_cache, db_hashes, memory_limit_mb, worker_counter,
+                           address_space_limit_mb)) as pool:
+        bar = None
+        if progress:
+            from tqdm import tqdm
+            bar = tqdm(total=len(sqls), desc="Evaluating queries")
+        for chunk in pool.imap_unordered(_run_chunk, tasks):
+            for idx, result in chunk:
+                results[idx] = result
+            if bar is not None:
+                bar.update(len(chunk))
+        if bar is not None:
+            bar.close()
+    return results
+
+
+def print_cpu_report(exec_results, top_n=10):
+    """每条查询的 CPU 时间汇总（结果中需带 cpu_time 字段，单位秒）"""
+    timed = [r for r in exec_results if r and 'cpu_time' in r]
+    if not timed:
+        return
+    total = sum(r['cpu_time'] for r in timed)
+    print(f"CPU time: {total:.2f}s total, {total / len(timed) * 1000:.1f}ms per query")
+    for r in sorted(timed, key=lambda r: r['cpu_time'], reverse=True)[:top_n]:
+        print("  sql {:<8} {:>10.3f}s  res={}".format(r['sql_idx'], r['cpu_time'], r['res']))
@@ -0,0 +1,24 @@
+import os
+import sys
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+EVAL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 评测脚本从 evaluation 目录直接导入 sql_engine / timing_engine，测试时同样加入 sys.path
+if EVAL_DIR not in sys.path:
+    sys.path.insert(0, EVAL_DIR)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'shop' / 'shop.sqlite')
+    os.makedirs(os.path.dirname(path))
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, name TEXT, price REAL)")
+        conn.executemany("INSERT INTO item VALUES (?, ?, ?)",
+                         [(i, f"item{i % 50}", float(i % 7)) for i in range(5000)])
+        conn.commit()
+    return path
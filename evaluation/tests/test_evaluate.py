@@ -0,0 +1,47 @@
+import os
+import importlib.util
+
+import pytest
+
+EVAL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLOW_SQL = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c"
+
+
+def _load_evaluate(dataset):
+    spec = importlib.util.spec_from_file_location(f'{dataset}_evaluate', os.path.join(EVAL_DIR, dataset, 'evaluate.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(params=['bird', 'spider'])
+def evaluate(request):
+    return _load_evaluate(request.param)
+
+
+def test_correct_prediction_is_timed_once_matched(evaluate, db_path):
+    result = evaluate.evaluate_pair("SELECT name FROM item", "SELECT DISTINCT name FROM item", db_path, 0,
+                                    meta_time_out=5, iterate_num=6, min_iterations=3)
+    assert result['res'] == 1
+    assert result['time_ratio'] > 0 and 3 <= result['iterations'] <= 6
+    assert result['ci'][0] <= result['time_ratio'] <= result['ci'][1]
+    # 与单独运行 R-VES 相同的计分方式
+    assert evaluate.ves.compute_ves([result]) > 0
+
+
+def test_wrong_or_failing_predictions_are_not_timed(evaluate, db_path, capsys):
+    wrong = evaluate.evaluate_pair("SELECT id FROM item", "SELECT name FROM item", db_path, 1)
+    broken = evaluate.evaluate_pair("SELECT nonsense FROM item", "SELECT name FROM item", db_path, 2)
+    for result, idx in ((wrong, 1), (broken, 2)):
+        assert (result['sql_idx'], result['res'], result['time_ratio'], result['iterations']) == (idx, 0, 0, 0)
+        assert result['cpu_time'] >= 0
+    assert 'SQL Error on SQL 2' in capsys.readouterr().out
+
+
+def test_timeout_and_skip_ves(evaluate, db_path, capsys):
+    result = evaluate.evaluate_pair(SLOW_SQL, "SELECT 1", db_path, 3, meta_time_out=0.2)
+    assert result['res'] == 0
+    assert 'Timeout on SQL 3' in capsys.readouterr().out
+
+    result = evaluate.evaluate_pair("SELECT name FROM item", "SELECT name FROM item", db_path, 4, timing=False)
+    assert result['res'] == 1 and result['iterations'] == 0
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import sql_engine
+from sql_engine import (GoldStore, QueryTimeout, ResultTooLarge, compare_results, connect_readonly, deadline,
+                        group_by_db, prepare_gold_cache, run_grouped)
+
+# 没有终止条件的递归查询，只能靠 deadline 中断
+SLOW_SQL = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c"
+
+
+def test_deadline_interrupts_and_connection_stays_usable(db_path):
+    conn = connect_readonly(db_path)
+    start = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        with deadline(conn, 0.2):
+            conn.execute(SLOW_SQL).fetchall()
+    assert time.monotonic() - start < 2
+    # 超时后进度回调已撤销，同一连接上的查询不再被中断
+    assert conn.execute("SELECT count(*) FROM item").fetchone() == (5000,)
+
+
+def test_deadline_passes_through_other_errors(db_path):
+    conn = connect_readonly(db_path)
+    with pytest.raises(sqlite3.OperationalError):
+        with deadline(conn, 5):
+            conn.execute("SELECT missing FROM item")
+
+
+def test_compare_results_uses_set_semantics(db_path):
+    conn = connect_readonly(db_path)
+    gold = "SELECT DISTINCT name FROM item"
+    assert compare_results(conn, "SELECT name FROM item ORDER BY id DESC", gold, db_path)
+    assert not compare_results(conn, "SELECT name FROM item WHERE id < 10", gold, db_path)
+    assert not compare_results(conn, "SELECT name || 'x' FROM item", gold, db_path)
+    # 与 Python 的相等语义一致：1 == 1.0
+    assert compare_results(conn, "SELECT 1", "SELECT 1.0", db_path)
+
+
+def test_row_cap(db_path):
+    conn = connect_readonly(db_path)
+    gold = "SELECT DISTINCT price FROM item"
+    with pytest.raises(ResultTooLarge):
+        compare_results(conn, "SELECT price FROM item", gold, db_path, row_cap=100)
+    assert compare_results(conn, "SELECT price FROM item", gold, db_path, row_cap=0)
+    # 金标准本身行数更多时上限随之放宽
+    assert compare_results(conn, "SELECT id FROM item", "SELECT id FROM item", db_path, row_cap=100)
+
+
+def test_gold_store_hit_skips_gold_query(tmp_path, db_path, monkeypatch):
+    gold_cache = str(tmp_path / 'gold.sqlite')
+    db_hashes = prepare_gold_cache(gold_cache, [db_path])
+    store = GoldStore(gold_cache)
+    monkeypatch.setattr(sql_engine, '_gold_store', store)
+    monkeypatch.setattr(sql_engine, '_db_hashes', db_hashes)
+
+    conn = connect_readonly(db_path)
+    executed = []
+    conn.set_trace_callback(executed.append)
+    gold = "SELECT DISTINCT name FROM item"
+    assert compare_results(conn, "SELECT name FROM item", gold, db_path)
+    assert gold in executed
+    executed.clear()
+    assert compare_results(conn, "SELECT name FROM item", gold, db_path)
+    assert not compare_results(conn, "SELECT name FROM item LIMIT 3", gold, db_path)
+    assert gold not in executed
+    store.close()
+
+    # 数据库文件变化后哈希不同，旧的金标准结果不再命中
+    with sqlite3.connect(db_path) as writer:
+        writer.execute("INSERT INTO item VALUES (5000, 'new', 1.0)")
+    assert prepare_gold_cache(gold_cache, [db_path])[db_path] != db_hashes[db_path]
+
+
+def test_group_by_db_chunks_per_database():
+    places = ['a', 'b', 'a', 'a', 'b']
+    assert group_by_db(places, chunk_size=2) == [('a', [0, 2]), ('a', [3]), ('b', [1, 4])]
+
+
+def _match(predicted_sql, ground_truth, db_path, idx):
+    return idx, compare_results(sql_engine.get_connection(db_path), predicted_sql, ground_truth, db_path)
+
+
+def _match_or_error(predicted_sql, ground_truth, db_path, idx):
+    try:
+        return os.getpid(), compare_results(sql_engine.get_connection(db_path), predicted_sql, ground_truth, db_path)
+    except MemoryError:
+        return os.getpid(), 'out of memory'
+
+
+def test_heap_limit_fails_only_the_heavy_query(db_path):
+    # 拼出约 40MB 的字符串，超过 16MB 的 SQLite 堆上限；同一工作进程、同一连接上的下一条查询不受影响
+    heavy = ("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 200000) "
+             "SELECT group_concat(hex(randomblob(100))) FROM c")
+    sqls = [(heavy, "SELECT 1"), ("SELECT name FROM item", "SELECT DISTINCT name FROM item")]
+    results = run_grouped(_match_or_error, sqls, [db_path] * len(sqls), num_cpus=1, memory_limit_mb=16)
+    assert [r[1] for r in results] == ['out of memory', True]
+    assert results[0][0] == results[1][0]
+
+
+def test_run_grouped_keeps_input_order(tmp_path, db_path):
+    sqls = [("SELECT name FROM item", "SELECT DISTINCT name FROM item"),
+            ("SELECT 1", "SELECT 2"),
+            ("SELECT id FROM item", "SELECT id FROM item")]
+    results = run_grouped(_match, sqls, [db_path] * len(sqls), num_cpus=2, chunk_size=1,
+                          gold_cache=str(tmp_path / 'gold.sqlite'), memory_limit_mb=0, pin_cpu=True)
+    assert results == [(0, True), (1, False), (2, True)]
@@ -0,0 +1,69 @@
+import os
+import time
+import importlib.util
+
+import numpy as np
+
+from sql_engine import connect_readonly
+from timing_engine import CHECK_EVERY, bootstrap_ci, is_untimed, measure_time_ratio, median_of_means
+
+SLOW_SQL = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c"
+
+
+def test_median_of_means_ignores_outliers():
+    samples = [1.0] * 20 + [1000.0]
+    assert median_of_means(samples) == 1.0
+    low, high = bootstrap_ci([1.0] * 20, np.random.default_rng(0))
+    assert low == high == 1.0
+
+
+def test_stops_early_once_interval_is_narrow(db_path):
+    conn = connect_readonly(db_path)
+    ratio, ci, iterations = measure_time_ratio(conn, "SELECT * FROM item", "SELECT * FROM item", 100, 5,
+                                               min_iterations=5, tolerance=10.0)
+    assert iterations == CHECK_EVERY
+    assert ratio > 0 and ci[0] <= ratio <= ci[1]
+
+
+def test_runs_max_iterations_without_convergence(db_path):
+    conn = connect_readonly(db_path)
+    _, _, iterations = measure_time_ratio(conn, "SELECT * FROM item", "SELECT * FROM item", 12, 5,
+                                          tolerance=0.0)
+    assert iterations == 12
+
+
+def test_budget_includes_warmup_and_bounds_each_run(db_path):
+    conn = connect_readonly(db_path)
+    start = time.monotonic()
+    ratio, ci, iterations = measure_time_ratio(conn, SLOW_SQL, SLOW_SQL, 30, 60, budget=0.3)
+    # 单次执行的时限是 60 秒，但预热也计入 0.3 秒的总预算，到点即停止；没有样本时记为未计时而不是 0
+    assert time.monotonic() - start < 2
+    assert (ratio, ci, iterations) == (None, (0.0, 0.0), 0)
+    assert is_untimed({'sql_idx': 0, 'time_ratio': ratio})
+    assert conn.execute("SELECT count(*) FROM item").fetchone() == (5000,)
+
+
+def test_budget_keeps_samples_taken_so_far(db_path):
+    conn = connect_readonly(db_path)
+    big = "SELECT a.id FROM item a JOIN item b ON a.id = b.id"
+    start = time.monotonic()
+    ratio, _, iterations = measure_time_ratio(conn, big, big, 100000, 60, budget=0.5, tolerance=0.0)
+    assert time.monotonic() - start < 2
+    assert 0 < iterations < 100000 and ratio > 0
+
+
+def _load_script(path):
+    spec = importlib.util.spec_from_file_location('r_ves', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_untimed_queries_are_left_out_of_ves():
+    eval_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = [{'sql_idx': 0, 'time_ratio': 4.0}, {'sql_idx': 1, 'time_ratio': 0},
+               {'sql_idx': 2, 'time_ratio': None}]
+    for dataset in ('bird', 'spider'):
+        ves = _load_script(os.path.join(eval_dir, dataset, 'R-VES.py'))
+        assert ves.compute_ves(results) == 100.0
+        assert ves.compute_ves(results[2:]) == 0
@@ -0,0 +1,127 @@
+import time
+import numpy as np
+from sql_engine import QueryTimeout, deadline, iter_rows
+
+WARMUP_RUNS = 2  # 正式计时前每条 SQL 先执行几次（预热页缓存与语句缓存）
+MIN_ITERATIONS = 5  # 至少计时这么多轮才检查是否可以提前停止
+CHECK_EVERY = 5  # 每多少轮检查一次置信区间
+MOM_BLOCKS = 5  # median-of-means 的分块数
+BOOTSTRAP_SAMPLES = 1000
+CI_LEVEL = 0.95
+CI_TOLERANCE = 0.05  # 置信区间半宽不超过估计值的这个比例时停止
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+def time_query(conn, sql, timeout):
+    """执行 SQL 并取完全部结果所用的进程 CPU 时间（ns）"""
+    with deadline(conn, timeout):
+        start = time.process_time_ns()
+        cursor = conn.execute(sql)
+        for _ in iter_rows(cursor):
+            pass
+        elapsed = time.process_time_ns() - start
+    cursor.close()
+    return elapsed
+
+
+def median_of_means(samples, blocks=MOM_BLOCKS):
+    """分块求均值再取中位数，对少数异常慢的样本不敏感"""
+    samples = np.asarray(samples, dtype=np.float64)
+    blocks = max(1, min(blocks, len(samples)))
+    usable = len(samples) - len(samples) % blocks
+    return float(np.median(samples[:usable].reshape(blocks, -1).mean(axis=1)))
+
+
+def bootstrap_ci(samples, rng, blocks=MOM_BLOCKS, level=CI_LEVEL, num_samples=BOOTSTRAP_SAMPLES):
+    """median-of-means 估计值的 bootstrap 置信区间"""
+    samples = np.asarray(samples, dtype=np.float64)
+    blocks = max(1, min(blocks, len(samples)))
+    usable = len(samples) - len(samples) % blocks
+    resampled = samples[rng.integers(0, len(samples), size=(num_samples, usable))]
+    estimates = np.median(resampled.reshape(num_samples, blocks, -1).mean(axis=2), axis=1)
+    alpha = (1 - level) / 2
+    low, high = np.quantile(estimates, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+def measure_time_ratio(conn, predicted_sql, ground_truth, max_iterations, timeout, budget=None,
+                       min_iterations=MIN_ITERATIONS, warmup=WARMUP_RUNS, tolerance=CI_TOLERANCE, seed=0):
+    """
+    金标准与预测 SQL 的耗时比（ground_truth_time / predicted_time）
+
+    在同一连接上先预热，再每轮以随机顺序各执行一次得到一个比值样本；
+    比值的 median-of-means 的 bootstrap 置信区间足够窄，或用完 max_iterations 轮 / budget 秒时停止。
+    budget 从预热开始计算，单次执行的时限也不超过剩余的 budget，用完时按已有样本给出估计。
+    一个样本都没取到就用完 budget 时耗时比为 None（未计时）：这是评测的时间限制，
+    不代表查询本身慢，调用方应把它排除在 R-VES 平均之外，而不是记为 0。
+
+    Returns:
+        (耗时比估计值或 None, (置信区间下界, 上界), 计时轮数)
+    """
+    rng = np.random.default_rng(seed)
+    start = time.monotonic()
+    ratios = []
+    ci = (0.0, 0.0)
+    exhausted = False
+
+    def run(sql):
+        limit = timeout
+        if budget:
+            limit = min(timeout, budget - (time.monotonic() - start))
+            if limit <= 0:
+                raise BudgetExhausted()
+        try:
+            return time_query(conn, sql, limit)
+        except QueryTimeout:
+            if limit < timeout:
+                raise BudgetExhausted()
+            raise
+
+    try:
+        for _ in range(warmup):
+            run(predicted_sql)
+            run(ground_truth)
+        for i in range(max_iterations):
+            if rng.random() < 0.5:
+                predicted_time = run(predicted_sql)
+                ground_truth_time = run(ground_truth)
+            else:
+                ground_truth_time = run(ground_truth)
+                predicted_time = run(predicted_sql)
+            if predicted_time > 0:
+                ratios.append(ground_truth_time / predicted_time)
+            if len(ratios) >= min_iterations and (i + 1) % CHECK_EVERY == 0:
+                ci = bootstrap_ci(ratios, rng)
+                if (ci[1] - ci[0]) / 2 <= tolerance * median_of_means(ratios):
+                    break
+    except BudgetExhausted:
+        exhausted = True
+    if not ratios:
+        return (None if exhausted else 0.0), ci, 0
+    if len(ratios) >= min_iterations:
+        ci = bootstrap_ci(ratios, rng)
+    return median_of_means(ratios), ci, len(ratios)
+
+
+def is_untimed(result):
+    """结果正确但 budget 内没能取到计时样本（time_ratio 为 None），不参与 R-VES 平均"""
+    return bool(result) and result.get('time_ratio', 0) is None
+
+
+def print_timing_report(exec_results, max_iterations):
+    """计时轮数与置信区间宽度的汇总"""
+    untimed = sum(is_untimed(r) for r in exec_results)
+    if untimed:
+        print(f"{untimed} queries ran out of timing budget and are left out of R-VES")
+    timed = [r for r in exec_results if r and r.get('iterations')]
+    if not timed:
+        return
+    iterations = np.array([r['iterations'] for r in timed])
+    widths = np.array([(r['ci'][1] - r['ci'][0]) / r['time_ratio'] for r in timed if r['time_ratio'] > 0])
+    print(f"Timed {len(timed)} queries: {iterations.mean():.1f} iterations on average, "
+          f"{(iterations < max_iterations).mean() * 100:.1f}% stopped early")
+    if len(widths):
+        print(f"Relative CI width: median {np.median(widths) * 100:.1f}%, max {widths.max() * 100:.1f}%")
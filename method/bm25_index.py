@@ -0,0 +1,226 @@
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from collections import Counter
+from typing import Callable, List, Optional, Tuple
+from src.vector_index import top_k_from_scores
+
+# 与 rank_bm25.BM25Okapi 相同的默认参数
+K1 = 1.5
+B = 0.75
+EPSILON = 0.25
+THETA_POOL_LIMIT = 16384  # 估计 top-k 阈值时最多看多少个文档
+
+
+def sql_tokenizer(text: str) -> List[str]:
+    """面向SQL问题文本的分词（与 RQ3 关键词检索版一致）"""
+    if not isinstance(text, str):
+        return []
+    # 保留SQL关键字和运算符
+    tokens = re.findall(r"\b\w+\b|!=|>=|<=|==|=|>|<|\+|-|\*|/|\(|\)", text.lower())
+    return [t for t in tokens if len(t) > 1 or t in {'=', '>', '<', '(', ')'}]
+
+
+def corpus_hash(texts: List[str]) -> str:
+    sha1 = hashlib.sha1()
+    for text in texts:
+        sha1.update(hashlib.sha1(text.encode('utf-8')).digest())
+    return sha1.hexdigest()
+
+
+class BM25Index:
+    """
+    倒排索引版 BM25（打分与 rank_bm25.BM25Okapi 一致）
+
+    倒排表以 CSR 形式存放：词 t 的文档号为 doc_ids[indptr[t]:indptr[t + 1]]（升序），
+    对应位置的 weights 是预先算好的 idf * tf 饱和项，查询时只需按词累加。
+    search 按 MaxScore 思路提前终止：剩余词的分数上界之和不足以进入 top-k 时，
+    不再扫描剩余词的整条倒排表，只在已有候选上二分查找补分。
+    """
+
+    def __init__(self, vocab: List[str], indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray,
+                 num_docs: int, k1: float = K1, b: float = B, epsilon: float = EPSILON, corpus_hash: str = ''):
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.terms = list(vocab)
+        self.indptr = indptr
+        self.doc_ids = doc_ids.astype(np.intp)  # 磁盘上存 int32；花式索引用 intp 可省去每次查询的类型转换
+        self.weights = weights
+        self.num_docs = int(num_docs)
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        self.corpus_hash = corpus_hash
+        # 每个词在任意文档上的最大得分，作为 MaxScore 的上界
+        self.max_weight = np.zeros(len(vocab), dtype=np.float32)
+        nonempty = indptr[1:] > indptr[:-1]
+        if len(weights):
+            self.max_weight[nonempty] = np.maximum.reduceat(weights, indptr[:-1][nonempty])
+        # idf 下限为负时得分不再单调，不能提前终止
+        self.prunable = not (len(weights) and weights.min() < 0)
+
+    def __len__(self):
+        return self.num_docs
+
+    @classmethod
+    def build(cls, corpus: List[List[str]], k1: float = K1, b: float = B, epsilon: float = EPSILON,
+              corpus_hash: str = '') -> 'BM25Index':
+        """由已分词的语料构建索引"""
+        vocab = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_len = np.array([len(doc) for doc in corpus], dtype=np.float64)
+        for d, doc in enumerate(corpus):
+            for term, tf in Counter(doc).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(d)
+                tfs.append(tf)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')  # 同一个词内文档号保持升序
+        term_ids = term_ids[order]
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        tfs = np.asarray(tfs, dtype=np.float64)[order]
+
+        num_docs = len(corpus)
+        df = np.bincount(term_ids, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(df)
+        df = df.astype(np.float64)
+        idf = np.log(num_docs - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            # 出现在一半以上文档中的词 idf 为负，置为 epsilon * 平均 idf
+            idf[idf < 0] = epsilon * idf.mean()
+        avgdl = doc_len.mean() if num_docs else 1.0
+        dl = doc_len[doc_ids]
+        weights = idf[term_ids] * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * dl / avgdl))
+        return cls(list(vocab), indptr, doc_ids, weights.astype(np.float32), num_docs, k1, b, epsilon, corpus_hash)
+
+    def _query_terms(self, tokens: List[str]) -> List[Tuple[int, int]]:
+        """(词号, 查询中出现次数)；与 BM25Okapi 一样，重复的查询词重复计分"""
+        return [(self.vocab[t], n) for t, n in Counter(tokens).items() if t in self.vocab]
+
+    def _postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[term], self.indptr[term + 1]
+        return self.doc_ids[start:end], self.weights[start:end]
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """全部文档的 BM25 分数（逐词向量化累加），接口同 BM25Okapi.get_scores"""
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term, count in self._query_terms(tokens):
+            docs, weights = self._postings(term)
+            scores[docs] += count * weights  # 同一个词的倒排表内文档号不重复
+        return scores
+
+    def search(self, tokens: List[str], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        取 BM25 分数最高的 top_k 个文档（只返回得分为正的文档），按分数降序
+
+        Returns:
+            (文档号, 分数)
+        """
+        terms = self._query_terms(tokens)
+        if not terms or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # 上界大的（稀有词）先处理，常见词的长倒排表尽量留到剪枝阶段
+        bounds = np.array([count * self.max_weight[term] for term, count in terms], dtype=np.float32)
+        order = np.argsort(-bounds, kind='stable')
+        rest_bounds = np.append(np.cumsum(bounds[order][::-1])[::-1][1:], 0.0)
+        lengths = np.array([self.indptr[terms[j][0] + 1] - self.indptr[terms[j][0]] for j in order])
+        rest_longest = np.append(np.maximum.accumulate(lengths[::-1])[::-1][1:], 0)
+
+        dense = np.zeros(self.num_docs, dtype=np.float32)  # 稠密累加器
+        cands = None  # 进入剪枝阶段后的候选文档（升序）
+        theta = 0.0  # 第 k 名得分的下界
+        for pos, j in enumerate(order):
+            term, count = terms[j]
+            docs, weights = self._postings(term)
+            if cands is not None and len(cands) * 8 < len(docs):
+                # 剪枝阶段：只给候选补分，在有序倒排表上二分查找，不扫描整条倒排表
+                hit = np.minimum(np.searchsorted(docs, cands), len(docs) - 1)
+                found = docs[hit] == cands
+                dense[cands[found]] += count * weights[hit[found]]
+            else:
+                dense[docs] += count * weights  # 同一个词的倒排表内文档号不重复
+            if not self.prunable or pos + 1 == len(order):
+                continue
+            # 任一组互不相同文档的第 k 名都是全局第 k 名的下界：用刚扫描的倒排表或候选集更新
+            # （长倒排表上求第 k 名本身就很贵，只用短表更新）
+            pool = cands if cands is not None else docs
+            if top_k <= len(pool) <= THETA_POOL_LIMIT:
+                scores = dense[pool]
+                theta = max(theta, float(np.partition(scores, len(scores) - top_k)[len(scores) - top_k]))
+            rest = rest_bounds[pos]
+            if cands is not None:
+                cands = cands[dense[cands] + rest >= theta]
+            elif rest < theta and rest_longest[pos] > top_k * 8:
+                # 未出现过的文档最多再得 rest 分，进不了 top-k；已出现的文档补满 rest 也不够的同样丢弃。
+                # 只有剩下的倒排表足够长、候选又足够少时，二分查找才比直接扫描划算
+                touched = np.flatnonzero(dense >= theta - rest)
+                if len(touched) * 8 < rest_longest[pos]:
+                    cands = touched
+
+        if cands is None:
+            cands, acc = top_k_from_scores(dense, top_k)
+        else:
+            acc = dense[cands]
+            top = top_k_from_scores(acc, top_k)[0]
+            cands, acc = cands[top], acc[top]
+        positive = acc > 0
+        return cands[positive], acc[positive]
+
+    def save(self, path: str):
+        """写入 .npz（先写临时文件再替换）"""
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, vocab=np.array(self.terms, dtype=str), indptr=self.indptr, doc_ids=self.doc_ids.astype(np.int32),
+                 weights=self.weights, num_docs=self.num_docs,
+                 params=np.array([self.k1, self.b, self.epsilon]), corpus_hash=np.array(self.corpus_hash))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with np.load(path, allow_pickle=False) as data:
+            k1, b, epsilon = data['params'].tolist()
+            return cls(data['vocab'].tolist(), data['indptr'], data['doc_ids'], data['weights'],
+                       int(data['num_docs']), k1, b, epsilon, str(data['corpus_hash']))
+
+    @classmethod
+    def load_or_build(cls, path: Optional[str], texts: List[str],
+                      tokenizer: Callable[[str], List[str]] = sql_tokenizer,
+                      k1: float = K1, b: float = B, epsilon: float = EPSILON) -> 'BM25Index':
+        """语料与参数和磁盘上的索引一致时直接加载，否则重新构建并写回（path 为 None 时不持久化）"""
+        texts_hash = corpus_hash(texts)
+        if path and os.path.exists(path):
+            try:
+                index = cls.load(path)
+                if index.corpus_hash == texts_hash and (index.k1, index.b, index.epsilon) == (k1, b, epsilon):
+                    return index
+            except (OSError, KeyError, ValueError):
+                pass
+        index = cls.build([tokenizer(text) for text in texts], k1, b, epsilon, texts_hash)
+        if path:
+            index.save(path)
+        return index
+
+
+if __name__ == '__main__':
+    # 示例：python -m src.bm25_index --example_db ./question.json --index_path ./question_bm25.npz
+    parser = argparse.ArgumentParser("Build BM25 inverted index and measure query latency")
+    parser.add_argument('--example_db', type=str, default='./question.json')
+    parser.add_argument('--index_path', type=str, default=None)
+    parser.add_argument('--top_k', type=int, default=50)
+    parser.add_argument('--num_queries', type=int, default=200)
+    opt = parser.parse_args()
+
+    with open(opt.example_db, 'r', encoding='utf-8') as f:
+        examples = json.load(f).get('questions', [])
+    texts = [f"{ex.get('question', '')} {ex.get('evidence', '')}" for ex in examples]
+    start = time.perf_counter()
+    index = BM25Index.load_or_build(opt.index_path, texts)
+    print(f"{len(index)} documents, {len(index.vocab)} terms, ready in {time.perf_counter() - start:.2f}s")
+
+    queries = [sql_tokenizer(text) for text in texts[:opt.num_queries]]
+    start = time.perf_counter()
+    for tokens in queries:
+        index.search(tokens, opt.top_k)
+    latency = (time.perf_counter() - start) / max(1, len(queries))
+    print(f"search top-{opt.top_k}: {latency * 1000:.3f} ms/query")
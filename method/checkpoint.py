@@ -0,0 +1,100 @@
+import os
+import json
+import threading
+
+
+class CheckpointStore:
+    """追加写入的检查点日志（JSONL），运行结束时压缩成 predict_{mode}.json 格式"""
+
+    def __init__(self, output_path, log_path=None, fsync_every=16):
+        """
+        Args:
+            output_path: 压缩后的结果文件（评测脚本读取的 JSON）
+            log_path: 追加日志路径，默认与 output_path 同名、后缀为 .jsonl
+            fsync_every: 每追加多少条记录执行一次 fsync
+        """
+        self.output_path = output_path
+        self.log_path = log_path or os.path.splitext(output_path)[0] + '.jsonl'
+        self.fsync_every = max(1, fsync_every)
+        self.records = {}  # 索引 -> 结果
+        self._pending = 0  # 尚未 fsync 的记录数
+        self._lock = threading.Lock()
+        self._load()
+        self._fh = open(self.log_path, 'a', encoding='utf-8')
+
+    def _load(self):
+        """依次加载已压缩的结果文件和追加日志，日志中的记录优先"""
+        if os.path.exists(self.output_path):
+            with open(self.output_path, 'r', encoding='utf-8') as f:
+                try:
+                    self.records.update({int(k): v for k, v in json.load(f).items()})
+                except (json.JSONDecodeError, ValueError):
+                    pass  # 文件内容无效时忽略
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+        # 崩溃时最后一行可能只写了一半：截断到最后一个完整行，避免后续追加拼接到残行上
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(end)
+        for line in data[:end].decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self.records[int(record['idx'])] = record['value']
+
+    def completed(self):
+        """已完成的索引集合（并发运行可能留下空洞，不能只看最大索引）"""
+        with self._lock:
+            return set(self.records)
+
+    def __contains__(self, idx):
+        return int(idx) in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, idx, value):
+        """追加一条记录，按 fsync_every 批量落盘"""
+        line = json.dumps({'idx': int(idx), 'value': value}, ensure_ascii=False) + '\n'
+        with self._lock:
+            self.records[int(idx)] = value
+            self._fh.write(line)
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                self._sync()
+
+    def _sync(self):
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def compact(self):
+        """把全部记录按索引顺序写成 {"0": ..., "1": ...} 格式，并清空追加日志"""
+        with self._lock:
+            self._sync()
+            ordered = {str(k): self.records[k] for k in sorted(self.records)}
+            tmp_path = self.output_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(ordered, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.output_path)
+            # 结果文件已包含全部记录，日志可以从头开始
+            self._fh.close()
+            self._fh = open(self.log_path, 'w', encoding='utf-8')
+
+    def close(self):
+        with self._lock:
+            if not self._fh.closed:
+                self._sync()
+                self._fh.close()
@@ -0,0 +1,290 @@
+import os
+import csv
+import json
+import time
+import random
+import hashlib
+import sqlite3
+import argparse
+from contextlib import closing
+from urllib.request import pathname2url
+from concurrent.futures import ProcessPoolExecutor
+
+import tqdm
+
+SAMPLE_SIZE = 3  # 高基数列保留的示例值个数
+LOW_CARDINALITY = 10  # 不同取值不超过该数量时列出全部取值
+MAX_VALUE_LEN = 50  # 示例值过长时不生成提示
+SAMPLE_TYPES = ['text', 'date', 'datetime']  # 需要采样取值的列类型
+
+
+def db_signature(db_path, content_hash=False):
+    """数据库文件签名：默认用大小 + mtime，content_hash=True 时用文件内容的 SHA-1"""
+    stat = os.stat(db_path)
+    if not content_hash:
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    sha1 = hashlib.sha1()
+    with open(db_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return f"sha1:{sha1.hexdigest()}"
+
+
+def column_stats(cursor, otn, ocn, seed):
+    """统计一列的不同取值个数，并确定性地抽取示例值（同一 seed 每次结果相同）"""
+    where = f'''FROM `{otn}` WHERE "{ocn}" IS NOT NULL'''
+    distinct_count = cursor.execute(f'''SELECT COUNT(DISTINCT "{ocn}") {where}''').fetchone()[0]
+    if distinct_count <= LOW_CARDINALITY:
+        samples = [v[0] for v in cursor.execute(f'''SELECT DISTINCT "{ocn}" {where} ORDER BY "{ocn}"''')]
+    else:
+        # 一次有序遍历不同取值，按种子选出的偏移量取样，不必为每个偏移量重新排序
+        offsets = set(random.Random(seed).sample(range(distinct_count), SAMPLE_SIZE))
+        last = max(offsets)
+        samples = []
+        for i, (value,) in enumerate(cursor.execute(f'''SELECT DISTINCT "{ocn}" {where} ORDER BY "{ocn}"''')):
+            if i in offsets:
+                samples.append(value)
+            if i == last:
+                break
+    # BLOB 等无法写入 JSON 的取值不作为示例
+    samples = [v for v in samples if isinstance(v, (str, int, float))]
+    return {
+        'distinct_count': distinct_count,
+        'samples': samples,
+        'low_cardinality': distinct_count <= LOW_CARDINALITY
+    }
+
+
+def connect_readonly(db_path):
+    """以只读、不可变模式打开数据库：不加锁、不检查 WAL，多个进程可以同时读取"""
+    uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro&immutable=1"
+    return sqlite3.connect(uri, uri=True)
+
+
+def value_prompt_from_stats(stats):
+    """由列统计生成取值提示，规则与原先的随机采样版本一致"""
+    samples = stats['samples']
+    if not samples or not isinstance(samples[0], str) or len(samples[0]) >= MAX_VALUE_LEN:
+        return None
+    if stats['low_cardinality']:
+        return f"all possible values are {samples}"
+    return f"example values are {samples[:SAMPLE_SIZE]}"
+
+
+class ValueSampleStore:
+    """
+    列描述与取值统计的持久化存储：
+    {db_id: {'signature': 数据库签名, 'columns': {"表|列": 统计},
+             'csv_signature': CSV 描述文件签名, 'csv_info': 解析后的列描述}}
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                try:
+                    self.entries = json.load(f)
+                except json.JSONDecodeError:
+                    self.entries = {}
+
+    def get(self, db_id):
+        return self.entries.get(db_id)
+
+    def put(self, db_id, entry):
+        if self.entries.get(db_id) != entry:
+            self.entries[db_id] = entry
+            self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+def csv_paths(db_root_path, table_info, prefer_table_names=True):
+    """各表的 CSV 描述文件：[(原始表名, 路径)]，查找顺序见 load_db_info"""
+    csv_dir = os.path.join(db_root_path, table_info['db_id'], 'database_description')
+    paths = []
+    # 遍历原始表名和标准表名
+    for otn, tn in zip(table_info['table_names_original'], table_info['table_names']):
+        # 确定CSV文件路径
+        if prefer_table_names and os.path.exists(os.path.join(csv_dir, f"{tn}.csv")):
+            paths.append((otn, os.path.join(csv_dir, f"{tn}.csv")))
+        else:
+            paths.append((otn, os.path.join(csv_dir, f"{otn}.csv")))
+    return paths
+
+
+def csv_signature(paths):
+    """CSV 描述文件签名：各文件的文件名 + 大小 + mtime"""
+    parts = []
+    for _, csv_path in paths:
+        stat = os.stat(csv_path)
+        parts.append(f"{os.path.basename(csv_path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return '|'.join(parts)
+
+
+def _db_path(db_root_path, db_id):
+    return os.path.normpath(os.path.join(db_root_path, db_id, f'{db_id}.sqlite'))
+
+
+def _signature_for(db_path, cached, content_hash):
+    # 已有条目使用内容哈希签名时沿用同样的签名方式，否则每次都会判定为过期
+    if cached and str(cached.get('signature', '')).startswith('sha1:'):
+        content_hash = True
+    return db_signature(db_path, content_hash)
+
+
+def is_fresh(db_root_path, table_info, cached, content_hash=False, prefer_table_names=True):
+    """存储条目是否可以直接使用：数据库与 CSV 描述文件都未变化，且保存了解析后的列描述"""
+    if not cached or 'csv_info' not in cached:
+        return False
+    db_id = table_info['db_id']
+    try:
+        return (cached.get('csv_signature') == csv_signature(csv_paths(db_root_path, table_info, prefer_table_names))
+                and cached.get('signature') == _signature_for(_db_path(db_root_path, db_id), cached, content_hash))
+    except OSError:
+        return False
+
+
+def value_prompts_from_entry(db_id, entry):
+    """由存储条目中的列统计生成该数据库的取值提示"""
+    value_prompt = {}  # 存储列值示例提示
+    for key, column in entry['columns'].items():
+        prompt = value_prompt_from_stats(column)
+        if prompt:
+            value_prompt[f"{db_id}|{key}"] = prompt
+    return value_prompt
+
+
+def load_db_info(db_root_path, table_info, cached=None, content_hash=False, prefer_table_names=True):
+    """
+    解析一个数据库的 CSV 列描述，并给出文本列的取值提示
+
+    Args:
+        db_root_path: 数据库根目录
+        table_info: tables.json 中该数据库的条目
+        cached: ValueSampleStore 中该数据库的已有条目，签名一致时不再访问数据库
+        content_hash: 是否用文件内容哈希（而不是大小 + mtime）作为签名
+        prefer_table_names: 优先读 <table_names>.csv，不存在时再读 <table_names_original>.csv；
+            False 时只读 <table_names_original>.csv
+
+    Returns:
+        (csv_info, value_prompt, 新的存储条目)
+    """
+    db_id = table_info['db_id']
+    db_path = _db_path(db_root_path, db_id)
+    paths = csv_paths(db_root_path, table_info, prefer_table_names)
+    csv_info = {}  # 存储列信息：数据库+表 -> 列详情
+    sample_columns = []  # 需要采样取值的 (表, 列)
+    # 处理每个表的CSV描述文件
+    for otn, csv_path in paths:
+        column_info = {}
+        with open(csv_path, newline='', encoding="latin1") as f:
+            # 解析CSV中的列信息
+            for row in csv.DictReader(f):
+                headers = list(row.keys())
+                ocn_header = [h for h in headers if 'original_column_name' in h][0]  # remove BOM
+                ocn, cn = row[ocn_header].strip(), row['column_name']
+                column_description = row['column_description'].strip()
+                column_type = row['data_format'].strip()
+                column_name = cn if cn not in ['', ' '] else ocn
+                value_description = row['value_description'].strip()
+                # 构建列信息：名称、描述、类型、值示例
+                column_info[ocn] = [column_name, column_description, column_type, value_description]
+                if column_type in SAMPLE_TYPES:
+                    sample_columns.append((otn, ocn))
+        csv_info[f"{db_id}|{otn}"] = column_info
+
+    signature = _signature_for(db_path, cached, content_hash)
+    stats = dict(cached['columns']) if cached and cached.get('signature') == signature else {}
+    missing = [(otn, ocn) for otn, ocn in sample_columns if f"{otn}|{ocn}" not in stats]
+    if missing:
+        with closing(connect_readonly(db_path)) as conn:
+            conn.text_factory = lambda x: x.decode('latin1', errors='ignore')  # 或 utf-8 with errors='ignore'
+            cursor = conn.cursor()
+            for otn, ocn in missing:
+                try:
+                    stats[f"{otn}|{ocn}"] = column_stats(cursor, otn, ocn, seed=f"{db_id}|{otn}|{ocn}")
+                except sqlite3.Error as e:
+                    print(f"跳过列 {db_id}|{otn}|{ocn}: {e}")
+
+    entry = {'signature': signature, 'columns': stats,
+             'csv_signature': csv_signature(paths), 'csv_info': csv_info}
+    return csv_info, value_prompts_from_entry(db_id, entry), entry
+
+
+def _load_db_info_task(args):
+    return load_db_info(*args)
+
+
+def load_info_from_csv(db_root_path, table_json, store_path=None, content_hash=False, workers=None,
+                       prefer_table_names=True):
+    """
+    从CSV文件读取所有数据库列的详细信息，各数据库在进程池中并行处理后按 table_json 顺序合并；
+    存储中条目仍然有效的数据库直接在当前进程中读取
+
+    Args:
+        store_path: 取值统计存储路径，缺失或过期的数据库重新计算并写回（None 表示不持久化）
+        content_hash: 是否用文件内容哈希作为数据库签名
+        workers: 进程数，默认等于 CPU 核数（不超过需要重新计算的数据库个数）；1 表示在当前进程中顺序处理
+        prefer_table_names: CSV 描述文件的查找顺序，见 load_db_info
+    """
+    store = ValueSampleStore(store_path)
+    results = [None] * len(table_json)
+    stale = []  # (在 table_json 中的位置, load_db_info 参数)
+    for i, table_info in enumerate(table_json):
+        cached = store.get(table_info['db_id'])
+        if is_fresh(db_root_path, table_info, cached, content_hash, prefer_table_names):
+            # 热启动：条目仍然有效，直接使用存储的列描述与统计，不解析 CSV、不访问数据库
+            results[i] = (cached['csv_info'], value_prompts_from_entry(table_info['db_id'], cached), cached)
+        else:
+            stale.append((i, (db_root_path, table_info, cached, content_hash, prefer_table_names)))
+
+    # 只有缺失或过期的数据库才需要计算，全部有效时不启动进程池
+    workers = min(workers or os.cpu_count() or 1, len(stale))
+    tasks = [task for _, task in stale]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            computed = list(tqdm.tqdm(executor.map(_load_db_info_task, tasks), total=len(tasks)))
+    else:
+        computed = [_load_db_info_task(task) for task in tqdm.tqdm(tasks, disable=not tasks)]
+    for (i, _), result in zip(stale, computed):
+        results[i] = result
+
+    csv_info = {}
+    value_prompt = {}
+    for table_info, (db_csv_info, db_value_prompt, entry) in zip(table_json, results):
+        csv_info.update(db_csv_info)
+        value_prompt.update(db_value_prompt)
+        store.put(table_info['db_id'], entry)
+    store.save()
+    return csv_info, value_prompt
+
+
+def default_store_path(db_root_path, mode):
+    return os.path.join(db_root_path, f'{mode}_value_samples.json')
+
+
+if __name__ == '__main__':
+    # 离线构建取值统计：python -m src.db_metadata --db_root_path ./data/dev_databases --mode dev
+    parser = argparse.ArgumentParser("Build column value-sample store")
+    parser.add_argument('--db_root_path', type=str, default="./data/dev_databases")
+    parser.add_argument('--mode', type=str, default='dev')
+    parser.add_argument('--store_path', type=str, default=None)
+    parser.add_argument('--content_hash', action='store_true')  # 用文件内容哈希判断数据库是否变化
+    parser.add_argument('--workers', type=int, default=None)  # 并行处理数据库的进程数
+    opt = parser.parse_args()
+
+    store_path = opt.store_path or default_store_path(opt.db_root_path, opt.mode)
+    table_json = json.load(open(os.path.join(opt.db_root_path, f'{opt.mode}_tables.json'), 'r'))
+    start = time.time()
+    _, prompts = load_info_from_csv(opt.db_root_path, table_json, store_path, opt.content_hash, opt.workers)
+    print(f"{len(prompts)} value prompts for {len(table_json)} databases "
+          f"written to {store_path} in {time.time() - start:.1f}s")
@@ -0,0 +1,101 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Callable, List, Optional
+
+
+class EmbeddingStore:
+    """
+    离线构建、加载时内存映射的嵌入存储：<prefix>.npy 保存矩阵，<prefix>.json 保存 manifest
+
+    manifest 记录模型名、数据类型、每条文本的哈希以及整个语料的哈希；加载时逐项校验，
+    重建时只对新增或变化的文本重新编码，未变化的行直接从旧矩阵复制。
+    """
+
+    def __init__(self, path_prefix: str, model_name: str, dtype: str = 'float32'):
+        assert dtype in ('float32', 'float16'), "dtype should be float32 or float16"
+        self.npy_path = path_prefix + '.npy'
+        self.manifest_path = path_prefix + '.json'
+        self.model_name = model_name
+        self.dtype = dtype
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def corpus_hash(item_hashes: List[str]) -> str:
+        return hashlib.sha1('\n'.join(item_hashes).encode('utf-8')).hexdigest()
+
+    def _read_manifest(self) -> Optional[dict]:
+        if not (os.path.exists(self.manifest_path) and os.path.exists(self.npy_path)):
+            return None
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                return None
+
+    def load(self, texts: List[str]) -> Optional[np.ndarray]:
+        """manifest 与当前语料、模型、数据类型完全一致时返回内存映射的矩阵，否则返回 None"""
+        manifest = self._read_manifest()
+        item_hashes = [self.text_hash(t) for t in texts]
+        if manifest is None \
+                or manifest.get('model_name') != self.model_name \
+                or manifest.get('dtype') != self.dtype \
+                or manifest.get('corpus_hash') != self.corpus_hash(item_hashes):
+            return None
+        embeddings = np.load(self.npy_path, mmap_mode='r')
+        if embeddings.shape[0] != len(texts) or embeddings.dtype != np.dtype(self.dtype):
+            return None
+        return embeddings
+
+    def build(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """增量重建：同一模型下哈希未变的文本复用旧向量，其余文本调用 encode 编码"""
+        item_hashes = [self.text_hash(t) for t in texts]
+        if not texts:
+            return np.zeros((0, 0), dtype=self.dtype)
+        old_rows = {}
+        old_embeddings = None
+        manifest = self._read_manifest()
+        if manifest is not None and manifest.get('model_name') == self.model_name:
+            old_embeddings = np.load(self.npy_path, mmap_mode='r')
+            if old_embeddings.shape[0] == len(manifest.get('item_hashes', [])):
+                old_rows = {h: i for i, h in enumerate(manifest['item_hashes'])}
+
+        missing = [i for i, h in enumerate(item_hashes) if h not in old_rows]
+        print(f"Embedding store: reusing {len(texts) - len(missing)} rows, encoding {len(missing)} new texts")
+        new_embeddings = encode([texts[i] for i in missing]) if missing else None
+
+        dim = new_embeddings.shape[1] if new_embeddings is not None else old_embeddings.shape[1]
+        embeddings = np.empty((len(texts), dim), dtype=self.dtype)
+        for row, h in enumerate(item_hashes):
+            if h in old_rows:
+                embeddings[row] = old_embeddings[old_rows[h]]
+        if missing:
+            embeddings[missing] = new_embeddings
+        del old_embeddings
+
+        # 先写临时文件再替换，避免中途失败留下与 manifest 不一致的矩阵
+        tmp_npy = self.npy_path + '.tmp.npy'
+        np.save(tmp_npy, embeddings)
+        os.replace(tmp_npy, self.npy_path)
+        manifest = {
+            'model_name': self.model_name,
+            'dtype': self.dtype,
+            'dim': int(dim),
+            'count': len(texts),
+            'corpus_hash': self.corpus_hash(item_hashes),
+            'item_hashes': item_hashes
+        }
+        with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+        return np.load(self.npy_path, mmap_mode='r')
+
+    def load_or_build(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        embeddings = self.load(texts)
+        if embeddings is None:
+            embeddings = self.build(texts, encode)
+        return embeddings
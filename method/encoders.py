@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from typing import List, Optional, Union
+from sentence_transformers import SentenceTransformer
+
+DEFAULT_MODEL_PATH = '/model/LLM/bge-large'
+DISTILLED_MODEL_PATH = '/model/LLM/bge-small'  # 蒸馏的小模型（如 bge-small-en-v1.5，384 维）
+ONNX_QUANT_CONFIG = 'avx512_vnni'  # 动态 int8 量化的目标指令集：avx512_vnni / avx512 / avx2 / arm64
+
+BACKENDS = ('sentence-transformers', 'onnx', 'onnx-int8', 'distilled')
+
+
+class SentenceTransformerEncoder:
+    """
+    sentence-transformers 编码器，encode 的参数与返回值同 SentenceTransformer.encode（numpy 输出）
+
+    name 写入嵌入存储的 manifest，编码器或截断长度变化时存储自动重建。
+    """
+
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH, max_seq_length: Optional[int] = None,
+                 backend: str = 'torch', model_kwargs: Optional[dict] = None, tag: str = ''):
+        self.model_path = model_path
+        if backend == 'torch':
+            self.model = SentenceTransformer(model_path)
+        else:
+            self.model = SentenceTransformer(model_path, backend=backend, model_kwargs=model_kwargs)
+        if max_seq_length:
+            self.model.max_seq_length = max_seq_length
+        # 默认配置沿用原来的模型路径作为名字，已有的嵌入存储仍然有效
+        self.name = model_path + tag + (f'@{max_seq_length}' if max_seq_length else '')
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, show_progress_bar: bool = False,
+               **kwargs) -> np.ndarray:
+        kwargs['convert_to_numpy'] = True
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar, **kwargs)
+
+
+def onnx_encoder(model_path: str = DEFAULT_MODEL_PATH, max_seq_length: Optional[int] = None,
+                 quantize: bool = True, quant_config: str = ONNX_QUANT_CONFIG) -> SentenceTransformerEncoder:
+    """
+    ONNX Runtime 编码器（需要 sentence-transformers>=3.2 与 optimum[onnxruntime]）
+
+    quantize=True 时使用动态 int8 量化的模型；量化模型第一次使用时导出到 <model_path>/onnx/ 下。
+    """
+    if not quantize:
+        return SentenceTransformerEncoder(model_path, max_seq_length, backend='onnx', tag='#onnx')
+    file_name = f'onnx/model_qint8_{quant_config}.onnx'
+    if not os.path.exists(os.path.join(model_path, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        export_dynamic_quantized_onnx_model(SentenceTransformer(model_path, backend='onnx'), quant_config, model_path)
+    return SentenceTransformerEncoder(model_path, max_seq_length, backend='onnx',
+                                      model_kwargs={'file_name': file_name}, tag=f'#onnx-int8-{quant_config}')
+
+
+def build_encoder(backend: str = 'sentence-transformers', model_path: Optional[str] = None,
+                  max_seq_length: Optional[int] = None):
+    """
+    构建查询/示例编码器
+
+    Args:
+        backend: sentence-transformers / onnx / onnx-int8 / distilled（小模型，默认 DISTILLED_MODEL_PATH）
+        model_path: 模型路径，缺省时按 backend 取默认模型
+        max_seq_length: 最大序列长度，超出部分截断（None 表示沿用模型配置）
+    """
+    assert backend in BACKENDS, f"backend should be one of {BACKENDS}"
+    if backend == 'distilled':
+        return SentenceTransformerEncoder(model_path or DISTILLED_MODEL_PATH, max_seq_length)
+    model_path = model_path or DEFAULT_MODEL_PATH
+    if backend == 'onnx':
+        return onnx_encoder(model_path, max_seq_length, quantize=False)
+    if backend == 'onnx-int8':
+        return onnx_encoder(model_path, max_seq_length)
+    return SentenceTransformerEncoder(model_path, max_seq_length)
+
+
+def _top_k(corpus: np.ndarray, queries: np.ndarray, top_k: int) -> List[set]:
+    corpus = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+    scores = queries @ corpus.T
+    return [set(np.argpartition(-row, top_k - 1)[:top_k].tolist()) for row in scores]
+
+
+def benchmark(texts: List[str], queries: List[str], backends: List[str], top_k: int = 5,
+              max_seq_length: Optional[int] = None, batch_size: int = 64):
+    """
+    以第一个后端为基准，统计各后端的示例库编码吞吐、单条查询编码延迟和检索 recall@k
+    （recall@k = 与基准后端 top-k 结果的重合比例）
+    """
+    report = {}
+    reference = None
+    for backend in backends:
+        encoder = build_encoder(backend, max_seq_length=max_seq_length)
+        start = time.perf_counter()
+        corpus = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+        corpus_seconds = time.perf_counter() - start
+        encoder.encode(queries[0])  # 预热
+        start = time.perf_counter()
+        query_embeddings = np.stack([encoder.encode(query) for query in queries]).astype(np.float32)
+        latency = (time.perf_counter() - start) / max(1, len(queries))
+        query_embeddings /= np.maximum(np.linalg.norm(query_embeddings, axis=1, keepdims=True), 1e-12)
+        neighbors = _top_k(corpus, query_embeddings, min(top_k, len(texts)))
+        if reference is None:
+            reference = neighbors
+        hits = sum(len(a & b) for a, b in zip(neighbors, reference))
+        report[backend] = {
+            'name': encoder.name,
+            'dim': corpus.shape[1],
+            'corpus_per_s': len(texts) / corpus_seconds,
+            'query_ms': latency * 1000,
+            'recall': hits / max(1, sum(len(r) for r in reference))
+        }
+    return report
+
+
+if __name__ == '__main__':
+    # 示例：python -m src.encoders --example_db ./question.json --queries ./data/dev.json
+    parser = argparse.ArgumentParser("Embedding encoder latency / recall benchmark")
+    parser.add_argument('--example_db', type=str, default='./question.json')
+    parser.add_argument('--queries', type=str, default=None, help='BIRD/Spider 格式的问题文件；缺省时用示例库中的问题（不含证据）')
+    parser.add_argument('--backends', type=str, nargs='+', default=['sentence-transformers', 'onnx-int8', 'distilled'])
+    parser.add_argument('--num_queries', type=int, default=200)
+    parser.add_argument('--top_k', type=int, default=5)
+    parser.add_argument('--max_seq_length', type=int, default=None)
+    opt = parser.parse_args()
+
+    with open(opt.example_db, 'r', encoding='utf-8') as f:
+        examples = json.load(f).get('questions', [])
+    texts = [f"{ex['question']} {ex['evidence']}" for ex in examples]
+    if opt.queries:
+        with open(opt.queries, 'r', encoding='utf-8') as f:
+            queries = [f"{q['question']} {q.get('evidence', '')}".strip() for q in json.load(f)]
+    else:
+        queries = [ex['question'] for ex in examples]
+    queries = queries[:opt.num_queries]
+
+    report = benchmark(texts, queries, opt.backends, opt.top_k, opt.max_seq_length)
+    print(f"{len(texts)} examples, {len(queries)} queries, reference: {opt.backends[0]}")
+    print("{:<24} {:<6} {:<16} {:<16} {:<12}".format(
+        'backend', 'dim', 'corpus (/s)', 'query (ms)', f'recall@{opt.top_k}'))
+    for backend, row in report.items():
+        print("{:<24} {:<6} {:<16.1f} {:<16.2f} {:<12.4f}".format(
+            backend, row['dim'], row['corpus_per_s'], row['query_ms'], row['recall']))
@@ -1,12 +1,30 @@
-﻿import json
-import os
-import time  
+﻿import os
 import openai  
+from src.llm_cache import ResponseCache
+from src.llm_async import AsyncChatClient
 
 # 设置 OpenAI API 配置  
 openai.api_base = "openai"
 openai.api_key = "sk-xxxxxxxx"
 
+# collect_response 使用的异步客户端（连接池 + 令牌桶限速 + 指数退避），可通过环境变量指向本地模拟服务
+llm_client = AsyncChatClient(
+    api_base=os.environ.get("LLM_API_BASE", openai.api_base),
+    api_key=os.environ.get("LLM_API_KEY", openai.api_key),
+    requests_per_min=int(os.environ.get("LLM_REQUESTS_PER_MIN", "600")),
+    tokens_per_min=int(os.environ.get("LLM_TOKENS_PER_MIN", "1000000")),
+    max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", "32")),
+    max_retries=int(os.environ.get("LLM_MAX_RETRIES", "8"))
+)
+
+# 响应缓存配置：所有调用都是 temperature=0，重跑和消融实验中相同的请求直接命中缓存
+# 将 LLM_CACHE_PATH 设为空字符串可关闭缓存
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "./outputs/llm_cache.sqlite")
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "200000"))
+LLM_CACHE_MAX_AGE_DAYS = float(os.environ.get("LLM_CACHE_MAX_AGE_DAYS", "0")) or None
+response_cache = ResponseCache(LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES,
+                               max_age_days=LLM_CACHE_MAX_AGE_DAYS) if LLM_CACHE_PATH else None
+
 def connect_gpt4(message, prompt):
     print("Connecting to...")
     response = openai.ChatCompletion.create(
@@ -23,41 +41,34 @@ def connect_gpt4(message, prompt):
 
 def collect_response(prompt, max_tokens=800, stop=None):
     model_name = "Qwen/Qwen3-32B"
-    while True:  
-        try:  
-            response = openai.ChatCompletion.create(  
-                model=model_name,  # 确认使用的模型名称正确
-                messages=[  
-                    {"role": "system", "content": "You are an AI assistant that helps people find information."},  
-                    {"role": "user", "content": f"{prompt}"}  
-                ],  
-                temperature=0,  
-                max_tokens=max_tokens,  
-                top_p=1,  
-                frequency_penalty=0,  
-                presence_penalty=0,  
-                stop=stop,
-                enable_thinking=False
-            )
-            print("\n" + "=" * 50)
-            print("Connecting to model：" + model_name)
-            print("=" * 50 + "\n")
-            return response['choices'][0]['message']['content'].strip()
-
-        except openai.error.OpenAIError as e:  
-            print("OpenAI API error occurred.")  
-            print(f"Exception message: {e}")  
-            if hasattr(e, 'http_status'):  
-                print(f"HTTP Status: {e.http_status}")  
-            if hasattr(e, 'response') and isinstance(e.response, dict):  
-                if 'error' in e.response:  
-                    print("Error details:")  
-                    print(json.dumps(e.response['error'], indent=2))  
-            else:  
-                print("No detailed error information available.")  
-            print("Retrying in 1 second...")  
-            time.sleep(1)  
-
-        except Exception as e:  
-            print(f"An unexpected error occurred: {e}")  
-            time.sleep(1) 
\ No newline at end of file
+    system_prompt = "You are an AI assistant that helps people find information."
+    params = dict(
+        temperature=0,
+        max_tokens=max_tokens,
+        top_p=1,
+        frequency_penalty=0,
+        presence_penalty=0,
+        stop=stop,
+        enable_thinking=False
+    )
+    cache_key = None
+    if response_cache is not None:
+        cache_key = ResponseCache.make_key(model=model_name, system=system_prompt, prompt=f"{prompt}", **params)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    # 异步客户端负责连接复用、限速和退避重试；超出重试预算时抛出异常，由调用方走兜底逻辑
+    content = llm_client.chat_sync(
+        model_name,
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"{prompt}"}
+        ],
+        **params
+    ).strip()
+    print("\n" + "=" * 50)
+    print("Connecting to model：" + model_name)
+    print("=" * 50 + "\n")
+    if cache_key is not None:
+        response_cache.put(cache_key, model_name, content)
+    return content
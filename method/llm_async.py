@@ -0,0 +1,184 @@
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+# 这些状态码视为暂时性错误，按退避策略重试；其余非 200 状态直接抛出
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class ChatCompletionError(RuntimeError):
+    """不可重试的接口错误（如 400/401/404）"""
+
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body[:500]}")
+        self.status = status
+        self.body = body
+
+
+class RetryBudgetExceeded(RuntimeError):
+    """重试次数用尽仍未成功"""
+
+
+class TokenBucket:
+    """令牌桶限速器，rate_per_min 为每分钟补充的令牌数"""
+
+    def __init__(self, rate_per_min, capacity=None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity or rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # 单次请求超过桶容量时按容量扣除，否则会永远等不到
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount):
+        """用真实用量修正预估值：多扣的退回，少扣的补扣（允许暂时为负）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def parse_retry_after(headers):
+    """解析 Retry-After（秒数或 HTTP 日期）以及部分服务返回的 retry-after-ms"""
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages, max_tokens):
+    """粗略估计一次请求消耗的 token 数（约 4 个字符 1 个 token），用于 tokens/min 限速"""
+    return sum(len(m['content']) for m in messages) // 4 + (max_tokens or 0)
+
+
+class AsyncChatClient:
+    """OpenAI 兼容 /chat/completions 的异步客户端：连接池 + 令牌桶限速 + 带抖动的指数退避"""
+
+    def __init__(self, api_base, api_key, requests_per_min=600, tokens_per_min=1000000,
+                 max_connections=32, max_retries=8, base_delay=1.0, max_delay=60.0, timeout=300):
+        """
+        Args:
+            api_base: 接口地址，如 http://127.0.0.1:8000/v1
+            api_key: 接口密钥
+            requests_per_min: 每分钟请求数上限
+            tokens_per_min: 每分钟 token 数上限（按 estimate_tokens 预估）
+            max_connections: 连接池中最多保持的连接数
+            max_retries: 最大重试次数，用尽后抛出 RetryBudgetExceeded
+            base_delay / max_delay: 指数退避的初始与最大等待秒数
+            timeout: 单次请求超时秒数
+        """
+        self.api_base = api_base.rstrip('/')
+        self.api_key = api_key
+        self.requests_per_min = requests_per_min
+        self.tokens_per_min = tokens_per_min
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._session = None
+        self._request_bucket = None
+        self._token_bucket = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    async def _get_session(self):
+        # 会话和限速器都绑定在后台事件循环上，首次使用时创建
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Authorization': f'Bearer {self.api_key}'}
+            )
+            self._request_bucket = TokenBucket(self.requests_per_min)
+            self._token_bucket = TokenBucket(self.tokens_per_min)
+        return self._session
+
+    def _backoff(self, attempt):
+        """Full jitter：在 [0, min(max_delay, base * 2^attempt)] 内均匀取值"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def chat(self, model, messages, **params):
+        """发送一次对话请求并返回首个回复内容"""
+        session = await self._get_session()
+        payload = dict(model=model, messages=messages, **params)
+        estimated = estimate_tokens(messages, params.get('max_tokens'))
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(estimated)
+            retry_after = None
+            try:
+                async with session.post(f"{self.api_base}/chat/completions", json=payload) as resp:
+                    if resp.status == 200:
+                        data = await resp.json(content_type=None)
+                        usage = data.get('usage') or {}
+                        if usage.get('total_tokens'):
+                            self._token_bucket.refund(estimated - usage['total_tokens'])
+                        return data['choices'][0]['message']['content']
+                    body = await resp.text()
+                    if resp.status not in RETRY_STATUS:
+                        raise ChatCompletionError(resp.status, body)
+                    retry_after = parse_retry_after(resp.headers)
+                    last_error = ChatCompletionError(resp.status, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+            if attempt == self.max_retries:
+                break
+            delay = retry_after if retry_after is not None else self._backoff(attempt)
+            print(f"LLM request failed ({last_error}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(min(delay, self.max_delay))
+        raise RetryBudgetExceeded(f"giving up after {self.max_retries + 1} attempts: {last_error}")
+
+    def _ensure_loop(self):
+        """在后台线程中运行一个常驻事件循环，供同步调用方提交协程"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        return self._loop
+
+    def chat_sync(self, model, messages, **params):
+        """同步接口：多个线程可以同时调用，请求在同一个事件循环和连接池中并发执行"""
+        future = asyncio.run_coroutine_threadsafe(self.chat(model, messages, **params), self._ensure_loop())
+        return future.result()
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def close(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
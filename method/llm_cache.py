@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class ResponseCache:
+    """基于 SQLite 的 LLM 响应缓存，按请求内容寻址（同样的请求参数 -> 同样的 key）"""
+
+    def __init__(self, path, max_entries=200000, max_age_days=None, evict_every=100):
+        """
+        Args:
+            path: SQLite 缓存文件路径
+            max_entries: 最多保留的条目数，超出时淘汰最久未访问的条目（None 表示不限）
+            max_age_days: 条目最长保留天数（None 表示不过期）
+            evict_every: 每写入多少条执行一次淘汰检查
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.evict_every = max(1, evict_every)
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, created REAL, last_access REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(**params):
+        """对请求参数（模型、系统提示、用户提示、max_tokens、stop、采样参数）做 SHA-256"""
+        payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age and now - row[1] > self.max_age:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self.conn.commit()
+            self._puts += 1
+            if self._puts % self.evict_every == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        """先按时间淘汰过期条目，再按 LRU 把条目数压到 max_entries 以内"""
+        if self.max_age:
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+        if self.max_entries:
+            count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+        self.conn.commit()
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        with self._lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return (f"LLM cache: {self.hits} hits, {self.misses} misses "
+                f"({hit_rate:.1f}% hit rate), {size} entries in {self.path}")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
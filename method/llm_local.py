@@ -1,20 +1,113 @@
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
-from transformers import StoppingCriteria, StoppingCriteriaList
+from transformers import StoppingCriteria, StoppingCriteriaList, DynamicCache
+import copy
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
 import warnings
+from concurrent.futures import Future
 from transformers import logging
 from typing import Optional, List, Union
+from src.prompt_bank import template_prefixes
 
 # 配置静默模式
 warnings.filterwarnings("ignore")
 logging.set_verbosity_error()
 
 
+class StopOnTokens(StoppingCriteria):
+    """按序列检查停止词：返回形状为 (batch,) 的布尔张量，已结束的序列由 generate 继续用 pad 填充"""
+
+    def __init__(self, tokenizer, stop_words, prompt_len):
+        self.tokenizer = tokenizer
+        # 预编码所有停止词（处理多token情况）
+        self.stop_token_sequences = [tokenizer.encode(stop, add_special_tokens=False) for stop in stop_words]
+        self.stop_token_sequences = [seq for seq in self.stop_token_sequences if seq]
+        self.max_stop_len = max(len(seq) for seq in self.stop_token_sequences) if self.stop_token_sequences else 0
+        self.prompt_len = prompt_len  # 左填充后所有序列的生成部分都从同一位置开始
+        self.done = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.done is None:
+            self.done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        # 检查最后N个token（N=最长停止词长度+缓冲），只看生成部分
+        check_len = min(32, self.max_stop_len + 4, input_ids.shape[1] - self.prompt_len)
+        if check_len <= 0:
+            return self.done.clone()
+        recent = input_ids[:, -check_len:].tolist()
+        for row, recent_tokens in enumerate(recent):
+            if self.done[row]:
+                continue
+            # 检查所有停止词序列
+            for stop_seq in self.stop_token_sequences:
+                if len(stop_seq) <= len(recent_tokens) and recent_tokens[-len(stop_seq):] == stop_seq:
+                    self.done[row] = True
+                    break
+        return self.done.clone()
+
+
+class PrefixCache:
+    """静态前缀的 KV 缓存，按 token 序列寻址，超过 max_prefixes 时淘汰最久未用的前缀"""
+
+    # 前缀末尾的 token 可能与后续文本合并成不同的 token，存储时丢弃末尾几个 token 保证能匹配
+    BOUNDARY_TOKENS = 2
+
+    def __init__(self, max_prefixes: int = 8):
+        self.max_prefixes = max_prefixes
+        self._entries = OrderedDict()  # token 元组 -> (past_key_values, 预填充耗时)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def put(self, prefix_ids: List[int], past_key_values, prefill_seconds: float):
+        with self._lock:
+            self._entries[tuple(prefix_ids)] = (past_key_values, prefill_seconds)
+            self._entries.move_to_end(tuple(prefix_ids))
+            while len(self._entries) > self.max_prefixes:
+                self._entries.popitem(last=False)
+
+    def lookup(self, input_ids: List[int]):
+        """返回与 input_ids 匹配的最长前缀 (长度, past_key_values 副本, 预填充耗时)，未命中返回 None"""
+        with self._lock:
+            best = None
+            for prefix in self._entries:
+                if len(prefix) < len(input_ids) and (best is None or len(prefix) > len(best)) \
+                        and tuple(input_ids[:len(prefix)]) == prefix:
+                    best = prefix
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            past_key_values, prefill_seconds = self._entries[best]
+            self.hits += 1
+        # generate 会扩展传入的缓存对象，每次调用都要拿到独立的缓存对象
+        return len(best), self._fork(past_key_values), prefill_seconds
+
+    @staticmethod
+    def _fork(past_key_values):
+        """
+        缓存的轻量副本：DynamicCache 扩展时用 torch.cat 得到新张量替换各层列表中的元素，
+        不会原地写入已有张量，因此只需复制各层列表、共享张量；其他缓存类型仍整体深拷贝
+        """
+        if isinstance(past_key_values, tuple):
+            return past_key_values  # 旧版元组格式本身不可变
+        if type(past_key_values) is DynamicCache and 'key_cache' in vars(past_key_values):
+            fork = copy.copy(past_key_values)
+            fork.key_cache = list(past_key_values.key_cache)
+            fork.value_cache = list(past_key_values.value_cache)
+            return fork
+        return copy.deepcopy(past_key_values)
+
+
 class LocalLLM:
-    def __init__(self, model_path: str = "/model/LLM/DeepSeek-V2-Lite-Chat"):
+    def __init__(self, model_path: str = "/model/LLM/DeepSeek-V2-Lite-Chat", max_prefixes: int = 8):
         self.model_path = model_path
         self.tokenizer = None
         self.model = None
+        self.prefix_cache = PrefixCache(max_prefixes)
         self._load_model()
 
     def _load_model(self):
@@ -25,6 +118,10 @@ class LocalLLM:
                 self.model_path,
                 trust_remote_code=True
             )
+            # 批量生成需要左填充，保证所有序列的生成位置对齐
+            self.tokenizer.padding_side = "left"
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
             self.model = AutoModelForCausalLM.from_pretrained(
                 self.model_path,
                 device_map="auto",
@@ -35,6 +132,23 @@ class LocalLLM:
         except Exception as e:
             raise RuntimeError(f"❌ Load failed: {str(e)}")
 
+    def _render(self, prompt: str) -> str:
+        return self.tokenizer.apply_chat_template([{"role": "user", "content": prompt}], tokenize=False)
+
+    def register_prefix(self, prefix: str):
+        """预先计算静态前缀（含聊天模板头部）的 past_key_values 并放入前缀缓存"""
+        sentinel = "\x00PREFIX_END\x00"
+        text = self._render(prefix + sentinel).split(sentinel)[0]
+        prefix_ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+        prefix_ids = prefix_ids[:-PrefixCache.BOUNDARY_TOKENS]
+        if not prefix_ids:
+            return
+        input_ids = torch.tensor([prefix_ids], device=self.model.device)
+        start = time.perf_counter()
+        with torch.no_grad():
+            past_key_values = self.model(input_ids=input_ids, use_cache=True).past_key_values
+        self.prefix_cache.put(prefix_ids, past_key_values, time.perf_counter() - start)
+
     def generate(
             self,
             prompt: str,
@@ -52,64 +166,148 @@ class LocalLLM:
             top_p: 核采样阈值 (0.5-0.95)
             stop: 停止词 (str或list), 如 "\n" 或 ["###", "</s>"]
         """
+        return self.generate_batch([prompt], max_tokens=max_tokens, temperature=temperature,
+                                   top_p=top_p, stop=stop)[0]
+
+    def generate_batch(
+            self,
+            prompts: List[str],
+            max_tokens: int = 600,
+            temperature: float = 0.5,
+            top_p: float = 0.9,
+            stop: Optional[Union[str, List[str]]] = None
+    ) -> List[str]:
+        """
+        批量生成文本（左填充动态批处理，停止词按序列独立判断）
+        Args:
+            prompts: 输入文本列表
+            其余参数同 generate
+        """
         # 参数检查
         assert 0.1 <= temperature <= 1.0, "temperature should be in [0.1, 1.0]"
         assert 0.5 <= top_p <= 0.95, "top_p should be in [0.5, 0.95]"
         if stop is not None:
             stop = [stop] if isinstance(stop, str) else list(stop)
 
-        # 构建输入
-        messages = [{"role": "user", "content": prompt}]
-        inputs = self.tokenizer.apply_chat_template(
-            messages,
-            return_tensors="pt"
+        # 构建输入：先渲染聊天模板，再整体左填充
+        texts = [self._render(prompt) for prompt in prompts]
+        inputs = self.tokenizer(
+            texts,
+            return_tensors="pt",
+            padding=True,
+            add_special_tokens=False
         ).to(self.model.device)
-
-        # 定义停止条件类
-        class StopOnTokens(StoppingCriteria):
-            def __init__(self, tokenizer, stop_words):
-                self.tokenizer = tokenizer
-                # 预编码所有停止词（处理多token情况）
-                self.stop_token_sequences = [tokenizer.encode(stop, add_special_tokens=False) for stop in stop_words]
-                self.max_stop_len = max(len(seq) for seq in self.stop_token_sequences) if stop_words else 0
-
-            def __call__(self, input_ids, scores, **kwargs):
-                # 检查最后N个token（N=最长停止词长度+缓冲）
-                check_len = min(32, self.max_stop_len + 4)  # 最多检查32个token
-                recent_tokens = input_ids[0][-check_len:].tolist()
-
-                # 检查所有停止词序列
-                for stop_seq in self.stop_token_sequences:
-                    if len(stop_seq) > len(recent_tokens):
-                        continue
-                    if recent_tokens[-len(stop_seq):] == stop_seq:
-                        return True
-                return False
+        prompt_len = inputs["input_ids"].shape[1]
 
         # 生成配置
         generate_args = {
-            "input_ids": inputs,
+            "input_ids": inputs["input_ids"],
+            "attention_mask": inputs["attention_mask"],
             "max_new_tokens": max_tokens,
             "temperature": temperature,
             "top_p": top_p,
             "do_sample": temperature > 0.1,
-            "pad_token_id": self.tokenizer.eos_token_id,
-            "stopping_criteria": StoppingCriteriaList([StopOnTokens(self.tokenizer, stop)]) if stop else None
+            "pad_token_id": self.tokenizer.pad_token_id,
+            "stopping_criteria": StoppingCriteriaList(
+                [StopOnTokens(self.tokenizer, stop, prompt_len)]) if stop else None
         }
 
+        # 单条请求时复用静态前缀的 KV 缓存，只预填充前缀之后的部分（左填充的批次位置不对齐，不复用）
+        if len(prompts) == 1:
+            cached = self.prefix_cache.lookup(inputs["input_ids"][0].tolist())
+            if cached is not None:
+                cached_len, past_key_values, prefill_seconds = cached
+                generate_args["past_key_values"] = past_key_values
+                self.prefix_cache.saved_seconds += prefill_seconds
+                print(f"[prefix cache] reused {cached_len}/{prompt_len} prompt tokens, "
+                      f"saved ~{prefill_seconds * 1000:.1f} ms prefill "
+                      f"(total {self.prefix_cache.saved_seconds:.2f} s)")
+
         # 执行生成
         outputs = self.model.generate(**generate_args)
-        response = self.tokenizer.decode(outputs[0][inputs.shape[1]:], skip_special_tokens=True)
+        responses = self.tokenizer.batch_decode(outputs[:, prompt_len:], skip_special_tokens=True)
 
         # 后处理停止词（确保兼容性）
-        if stop:
-            for stop_word in stop:
-                response = response.split(stop_word)[0]
-        return response.strip()
+        results = []
+        for response in responses:
+            if stop:
+                for stop_word in stop:
+                    response = response.split(stop_word)[0]
+            results.append(response.strip())
+        return results
+
+
+class MicroBatchQueue:
+    """微批队列：多个流水线线程共享同一个已加载模型，参数相同的请求合并成一批生成"""
 
+    def __init__(self, llm: LocalLLM, max_batch_size: int = 8, max_wait_ms: float = 20):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._deferred = deque()  # 参数与上一批不同而留下的请求，按到达顺序排在队列之前
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
 
-# 单例服务
-llm_service = LocalLLM()
+    def submit(self, prompt: str, max_tokens: int, temperature: float, top_p: float,
+               stop: Optional[Union[str, List[str]]]) -> Future:
+        stop_key = (stop,) if isinstance(stop, str) else tuple(stop) if stop else None
+        future = Future()
+        self._queue.put(((max_tokens, temperature, top_p, stop_key), prompt, future))
+        return future
+
+    def _collect(self):
+        """
+        取出最早到达的请求，在 max_wait 内继续收集参数相同的请求组成一批；
+        参数不同的留在 _deferred 中，下一批先从这里取，保证先到先服务、不会被后来的请求饿死
+        """
+        pending, self._deferred = self._deferred, deque()
+        first = pending.popleft() if pending else self._queue.get()
+        batch = [first]
+        for item in pending:
+            (batch if item[0] == first[0] and len(batch) < self.max_batch_size else self._deferred).append(item)
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            (batch if item[0] == first[0] else self._deferred).append(item)
+        return first[0], batch
+
+    def _run(self):
+        while True:
+            (max_tokens, temperature, top_p, stop), batch = self._collect()
+            try:
+                responses = self.llm.generate_batch(
+                    [prompt for _, prompt, _ in batch],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    stop=list(stop) if stop else None
+                )
+                for (_, _, future), response in zip(batch, responses):
+                    future.set_result(response)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+
+
+# 单例服务：第一次请求时才加载模型并预填充静态前缀，导入本模块不加载模型
+llm_service = None
+batch_queue = None
+_service_lock = threading.Lock()
+
+
+def get_batch_queue() -> MicroBatchQueue:
+    global llm_service, batch_queue
+    with _service_lock:
+        if batch_queue is None:
+            llm_service = LocalLLM()
+            for _prefix in template_prefixes():
+                llm_service.register_prefix(_prefix)
+            batch_queue = MicroBatchQueue(llm_service)
+    return batch_queue
 
 
 def get_response(
@@ -120,19 +318,13 @@ def get_response(
         stop: Optional[Union[str, List[str]]] = None
 ) -> str:
     """
-    获取模型响应
+    获取模型响应（经微批队列，与其他并发线程的请求合并生成）
     Args:
         stop: 支持字符串或列表格式，例如：
               - stop="\n"          # 遇到换行符停止
               - stop=["###", "</s>"] # 遇到任意停止词停止
     """
-    return llm_service.generate(
-        prompt=prompt,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        top_p=top_p,
-        stop=stop
-    )
+    return get_batch_queue().submit(prompt, max_tokens, temperature, top_p, stop).result()
 
 
 if __name__ == "__main__":
@@ -143,3 +335,7 @@ if __name__ == "__main__":
     print(get_response("写一首诗", stop="\n"))
     print("\n💬 Response:")
     print(response)
+
+    # 批量生成
+    for r in llm_service.generate_batch(["什么是主键？", "什么是外键？"], max_tokens=100):
+        print(r)
@@ -2,15 +2,14 @@ import os
 import json
 import random
 import re
-import time
 
-import tqdm
-import sqlite3
-import csv
 from src.prompt_bank import dummy_sql_prompt, sr_examples, generate_sr, sr2sql
 from src.llm import collect_response
 # from src.llm_local import get_response
 from src.rag import RAGModule
+from src.schema_catalog import SchemaCatalog
+from src.checkpoint import CheckpointStore
+from src.db_metadata import load_info_from_csv, default_store_path
 
 
 class BaseModule():
@@ -21,101 +20,29 @@ class BaseModule():
         question_path = os.path.join(db_root_path, f'{mode}.json')
         self.table_json = json.load(open(table_json_path, 'r'))
         self.question_json = json.load(open(question_path, 'r', encoding='utf-8'))
+        # 按 db_id 编译的模式索引，各模块都从这里读取表、列和主外键信息
+        self.catalog = SchemaCatalog(self.table_json)
         # self.csv_info, self.value_prompts = self._get_info_from_csv()
 
     def _get_info_from_csv(self):
-        """从CSV文件读取数据库列的详细信息"""
-        csv_info = {}  # 存储列信息：数据库+表 -> 列详情
-        value_prompt = {}  # 存储列值示例提示
-        for i in tqdm.tqdm(range(len(self.table_json))):
-            table_info = self.table_json[i]
-            db_id = table_info['db_id']
-            db_path = os.path.join(self.db_root_path, db_id, f'{db_id}.sqlite')
-            db_path = os.path.normpath(db_path)
-            print("\n" + "=" * 50)
-            print("初始化数据库：" + db_path)
-            print("=" * 50 + "\n")
-            time.sleep(1)
-            conn = sqlite3.connect(db_path)
-            conn.text_factory = lambda x: x.decode('latin1', errors='ignore')  # 或 utf-8 with errors='ignore'
-            cursor = conn.cursor()
-            # 处理每个表的CSV描述文件
-            csv_dir = os.path.join(self.db_root_path, db_id, 'database_description')
-            otn_list = table_info['table_names_original']
-            tn_list = table_info['table_names']
-            # 遍历原始表名和标准表名
-            for otn, tn in zip(otn_list, tn_list):
-                # 确定CSV文件路径
-                if os.path.exists(os.path.join(csv_dir, f"{tn}.csv")):
-                    csv_path = os.path.join(os.path.join(csv_dir, f"{tn}.csv"))
-                else:
-                    csv_path = os.path.join(os.path.join(csv_dir, f"{otn}.csv"))
-                csv_dict = csv.DictReader(open(csv_path, newline='', encoding="latin1"))
-                column_info = {}
-                # 解析CSV中的列信息
-                for row in csv_dict:
-                    headers = list(row.keys())
-                    ocn_header = [h for h in headers if 'original_column_name' in h][0]  # remove BOM
-                    ocn, cn = row[ocn_header].strip(), row['column_name']
-                    column_description = row['column_description'].strip()
-                    column_type = row['data_format'].strip()
-                    column_name = cn if cn not in ['', ' '] else ocn
-                    value_description = row['value_description'].strip()
-                    # 构建列信息：名称、描述、类型、值示例
-                    column_info[ocn] = [column_name, column_description, column_type, value_description]
-                    # 获取列值示例用于提示
-                    if column_type in ['text', 'date', 'datetime']:
-                        sql = f'''SELECT DISTINCT "{ocn}" FROM `{otn}` where "{ocn}" IS NOT NULL ORDER BY RANDOM()'''
-                        cursor.execute(sql)
-                        values = cursor.fetchall()
-                        if len(values) > 0:
-                            # 检查 values[0][0] 是否是字符串，否则跳过
-                            if isinstance(values[0][0], str) and len(values[0][0]) < 50:
-                                if len(values) <= 10:
-                                    example_values = [v[0] for v in values]
-                                    value_prompt[f"{db_id}|{otn}|{ocn}"] = f"all possible values are {example_values}"
-                                else:
-                                    example_values = [v[0] for v in values[:3]]
-                                    value_prompt[f"{db_id}|{otn}|{ocn}"] = f"example values are {example_values}"
-
-                csv_info[f"{db_id}|{otn}"] = column_info
-            # pdb.set_trace()
-        return csv_info, value_prompt
+        """从CSV文件读取数据库列的详细信息，列取值示例来自持久化的取值统计（首次运行时构建）"""
+        store_path = default_store_path(self.db_root_path, self.mode)
+        # 返回 csv_info（数据库+表 -> 列详情）和 value_prompt（列值示例提示）
+        # 各数据库在进程池中并行加载（只读连接，处理完立即关闭）
+        return load_info_from_csv(self.db_root_path, self.table_json, store_path)
 
     def generate_pk_fk(self, question_id):
         """生成主键和外键信息"""
         question_info = self.question_json[question_id]
         db_id = question_info['db_id']
-        table = [content for content in self.table_json if content['db_id'] == db_id][0]
-        pk_dict = {}  # 主键字典：表 -> 主键列
-        fk_dict = {}  # 外键字典：源列 -> 目标列
-        table_names_original = table['table_names_original']
-        column_names_original = table['column_names_original']
-        primary_keys = table['primary_keys']
-        foreign_keys = table['foreign_keys']
-
-        for _, pk_idx in enumerate(primary_keys):
-            if type(pk_idx) == int:
-                pk_dict[str(table_names_original[column_names_original[pk_idx][0]])] = [
-                    column_names_original[pk_idx][-1]]
-            else:
-                pk_dict[str(table_names_original[column_names_original[pk_idx[0]][0]])] = [
-                    column_names_original[idx][-1] for idx in pk_idx]
-
-        for cur_fk in foreign_keys:
-            src_col_idx, tgt_col_idx = cur_fk
-            src_col_name = str(table_names_original[column_names_original[src_col_idx][0]]) + '.' + str(
-                column_names_original[src_col_idx][-1])
-            tgt_col_name = str(table_names_original[column_names_original[tgt_col_idx][0]]) + '.' + str(
-                column_names_original[tgt_col_idx][-1])
-            fk_dict[src_col_name] = tgt_col_name
-        return pk_dict, fk_dict
+        # 主键字典：表 -> 主键列；外键字典：源列 -> 目标列（在 SchemaCatalog 中预先计算）
+        return self.catalog.pk_fk(db_id)
 
 
 class TASL(BaseModule):
     """语义增强模块，处理数据库模式重构和虚拟SQL生成"""
 
-    def __init__(self, db_root_path, mode, column_meaning_path, max_retries=2):
+    def __init__(self, db_root_path, mode, column_meaning_path, max_retries=2, dummy_flush_every=32):
         super().__init__(db_root_path, mode)
         # 加载列语义描述
         self.column_meanings = json.load(open(column_meaning_path, 'r', encoding='utf-8'))
@@ -123,18 +50,19 @@ class TASL(BaseModule):
         self.max_retries = max_retries  # 最大重试次数
         # 重构模式字典
         self.schema_item_dic = self._reconstruct_schema()
+        # dummy SQL 审计记录：追加写入并分批落盘，结束时由 close() 压缩成 dummy_sql.json
+        self.dummy_log = CheckpointStore("dummy_sql.json", fsync_every=dummy_flush_every)
 
     def _reconstruct_schema(self):
         """重构数据库模式，整合列语义信息"""
         schema_item_dic = {}
         skipped_databases = {}  # 记录被跳过的数据库及其出现次数
-        db_id_list = [content['db_id'] for content in self.table_json]
+        db_id_list = self.catalog.db_ids()
         # print(f"数据库总个数：{len(db_id_list)}\n数据库列表: {db_id_list}\n")
 
         for db_id in db_id_list:
             # 为每个数据库构建表结构
-            content = [content for content in self.table_json if content['db_id'] == db_id][0]
-            otn_list = content['table_names_original']
+            otn_list = self.catalog.table_names(db_id)
             schema_for_db = {table: {} for table in otn_list}  # 更清晰的初始化方式
             schema_item_dic[db_id] = schema_for_db
         # 填充列语义信息（仅处理存在的 db_id 和表）
@@ -171,16 +99,10 @@ class TASL(BaseModule):
         """改进的SQL验证方法，支持表别名和更精确的验证"""
         try:
             # 获取数据库schema信息
-            db_info = [content for content in self.table_json if content['db_id'] == db_id][0]
-            valid_tables = set(db_info["table_names_original"])
+            valid_tables = set(self.catalog.table_names(db_id))
 
-            # 构建列名映射：{表名: {列名}}
-            column_map = {}
-            for table_id, col_name in db_info["column_names_original"][1:]:
-                table_name = db_info["table_names_original"][table_id]
-                if table_name not in column_map:
-                    column_map[table_name] = set()
-                column_map[table_name].add(col_name)
+            # 列名映射：{表名: {小写列名}}
+            column_map = self.catalog.column_map(db_id)
 
             # 1. 识别表别名（包括带AS和不带AS的情况）
             alias_pattern = r'(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?(?=\s|$|,)'
@@ -206,7 +128,7 @@ class TASL(BaseModule):
                     # 先检查是否是表别名
                     actual_table = table_aliases.get(qualifier,
                                                      qualifier if qualifier in valid_tables else None)
-                    if actual_table and col_name.lower() in {c.lower() for c in column_map.get(actual_table, set())}:
+                    if actual_table and col_name.lower() in column_map.get(actual_table, set()):
                         has_valid_columns = True
                     else:
                         return False  # 包含无效的限定列引用
@@ -214,7 +136,7 @@ class TASL(BaseModule):
                 # 情况2：无前缀列名（仅在查询只涉及单表时可靠）
                 elif len(table_aliases) == 1:
                     actual_table = list(table_aliases.values())[0]
-                    if col_name.lower() in {c.lower() for c in column_map.get(actual_table, set())}:
+                    if col_name.lower() in column_map.get(actual_table, set()):
                         has_valid_columns = True
                     else:
                         return False  # 无效的无前缀列名
@@ -239,22 +161,16 @@ class TASL(BaseModule):
 
     def generate_dummy_sql(self, question_id):
         """生成虚拟SQL查询（使用LLM）"""
-        output_dummy = {}  # 存储生成的dummy SQL,也是
-        # 先尝试读取已有数据（如果文件存在）
-        if os.path.exists("dummy_sql.json"):
-            with open("dummy_sql.json", 'r') as f:
-                try:
-                    output_dummy = json.load(f)
-                except json.JSONDecodeError:
-                    output_dummy = {}
         question = self.question_json[question_id]
         db_id = question['db_id']
         q = question['question']
         evidence = question['evidence']
         pk_dict, fk_dict = self.generate_pk_fk(question_id)
-        db_prompt_dic = self._reconstruct_schema()
-        db_prompt = db_prompt_dic[db_id]
-        database_schema = self._generate_database_schema(db_prompt)
+        # 每个数据库的模式提示只渲染一次（基于 __init__ 中构建的 schema_item_dic）
+        database_schema = self.catalog.schema_prompt(
+            db_id, 'database_schema',
+            lambda db: self._generate_database_schema(self.schema_item_dic[db])
+        )
         # print("\n" + "=" * 50)
         # print("database_schema:\n" + database_schema)
         # print("=" * 50 + "\n")
@@ -294,10 +210,8 @@ class TASL(BaseModule):
             if attempt == 0:
                 processed_sql = processed_sql + '\t----- spider -----\t' + db_id
                 print("\n纯净模式生成的SQL:\n" + processed_sql)
-                # 更新字典并写入文件
-                output_dummy[str(question_id)] = processed_sql
-                with open("dummy_sql.json", 'w') as f:
-                    json.dump(output_dummy, f, indent=4)
+                # 记录到审计日志（内存 + 追加写，分批落盘）
+                self.dummy_log.append(question_id, processed_sql)
             # 验证SQL
             if self._validate_sql(dummy_sql, db_id):
                 print("SQL验证通过")
@@ -318,18 +232,19 @@ class TASL(BaseModule):
         # 返回prompt和所有生成的SQL（最多2个）
         return prompt, tuple(generated_sqls)
 
+    def close(self):
+        """把 dummy SQL 审计日志压缩写入 dummy_sql.json"""
+        self.dummy_log.compact()
+        self.dummy_log.close()
+
     def get_schema(self, question_id):
         question_info = self.question_json[question_id]
         db_id = question_info['db_id']
         _, dummy_sqls = self.generate_dummy_sql(question_id)
 
         # 获取数据库的表和列信息
-        table_info = [content for content in self.table_json if content['db_id'] == db_id][0]
-        table_names_list = table_info["table_names_original"]
-        column_names_list = [
-            [table_names_list[int(content[0])], content[1]]
-            for content in table_info['column_names_original'][1:]
-        ]
+        table_names_list = self.catalog.table_names(db_id)
+        column_names_list = self.catalog.columns(db_id)
 
         schemas = []
 
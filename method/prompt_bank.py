@@ -1,3 +1,5 @@
+import string
+
 column_meaning_prompt = """def convert_schema_to_comprehensive_description(db_id, table_name, column_name, column_type, column_description = None, value_description = None):
     # step1: The interpretation of a column name is contingent upon its relational association with the table name. Thus, the first generated sentence should explain the column meaning within the context of table_name
     # step2: output overall column description according to step1
@@ -195,3 +197,23 @@ from ORDER_OPERATIONS import desc, asc
 # You MUST wrap the generated SQL in markdown code blocks like this:
 ```sql
 """
+
+
+def static_prefix(template, **constants):
+    """返回模板中第一个非常量占位符之前的文本（constants 中的占位符按常量展开）"""
+    prefix = ''
+    for literal, field, _, _ in string.Formatter().parse(template):
+        prefix += literal
+        if field is None or field not in constants:
+            break
+        prefix += str(constants[field])
+    return prefix
+
+
+def template_prefixes():
+    """各生成模板的静态前缀，供本地推理复用 KV 缓存（sr2sql 调用前会 strip('\\n')）"""
+    return [
+        static_prefix(dummy_sql_prompt),
+        static_prefix(generate_sr, sr_example=sr_examples),
+        static_prefix(sr2sql).strip('\n'),
+    ]
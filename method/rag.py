@@ -0,0 +1,296 @@
+import os
+import copy
+import json
+import argparse
+import threading
+import numpy as np
+from collections import OrderedDict
+from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict
+from src.embedding_store import EmbeddingStore
+from src.encoders import SentenceTransformerEncoder, build_encoder, BACKENDS as ENCODER_BACKENDS
+from src.vector_index import build_index
+from src.retrieval_cache import RetrievalCache
+from src.llm_cache import ResponseCache
+
+
+class RAGModule:
+    def __init__(self, example_db_path='question.json', model_path='/model/LLM/bge-large',
+                 store_path=None, store_dtype='float32', index_backend='auto',
+                 cache_path=None, cache_size=1000, encoder=None):
+        """
+        初始化RAG模块
+
+        Args:
+            example_db_path: 示例库路径
+            model_path: 嵌入模型路径
+            store_path: 嵌入存储路径前缀（生成 .npy 和 .json），默认与示例库同目录
+            store_dtype: 嵌入存储的数据类型（float32 / float16）
+            index_backend: 向量索引后端（exact / int8 / float16 / int8+rescore / float16+rescore / hnsw / faiss-ivf / auto）
+            cache_path: 检索结果缓存的 SQLite 路径（None 表示只在内存中缓存）
+            cache_size: 内存中缓存的检索结果条数
+            encoder: 编码器（见 src.encoders），缺省时用 model_path 的 sentence-transformers 模型
+        """
+        self.example_db = self._load_examples(example_db_path)
+        self.model_path = model_path
+        self.model = encoder or SentenceTransformerEncoder(model_path)
+        self.store_path = store_path or os.path.splitext(example_db_path)[0] + '_embeddings'
+        # manifest 记录编码器名，换编码器或截断长度后存储自动重建
+        self.store = EmbeddingStore(self.store_path, model_name=self.model.name, dtype=store_dtype)
+        self.sub_store = EmbeddingStore(self.store_path + '_sub', model_name=self.model.name, dtype=store_dtype)
+        # 最近查询的嵌入，retrieve 与 evaluate_examples_similarity 共用，避免同一查询编码两次
+        self._query_embeddings = OrderedDict()
+        self._query_cache_size = 256
+        self._query_lock = threading.Lock()
+        self._preprocess_embeddings()
+        self._preprocess_sub_examples()
+        self.index = build_index(self.example_embeddings, index_backend)
+        self.cache = RetrievalCache(ResponseCache.make_key(**self._index_version()), cache_size, cache_path)
+
+    def _load_examples(self, path: str) -> List[Dict]:
+        """加载示例数据库"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            return data.get('questions', [])
+
+    def _encode_corpus(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+
+    def _preprocess_embeddings(self):
+        """加载离线构建的嵌入向量（内存映射），语料变化时只重新编码新增或修改的示例"""
+        self.example_texts = [
+            f"{ex['question']} {ex['evidence']}"
+            for ex in self.example_db
+        ]
+        self.example_embeddings = self.store.load_or_build(self.example_texts, self._encode_corpus)
+
+    def _preprocess_sub_examples(self):
+        """一次性抽取所有示例 prompt 中的子示例，并把它们的问题部分编码成一个扁平矩阵"""
+        self.sub_examples = [self._extract_full_examples(ex.get('prompt', '')) for ex in self.example_db]
+        # 第 i 个示例的子示例对应矩阵中的 [sub_offsets[i], sub_offsets[i + 1]) 行
+        self.sub_offsets = np.cumsum([0] + [len(subs) for subs in self.sub_examples])
+        sub_texts = [sub['question_part'] for subs in self.sub_examples for sub in subs]
+        self.sub_embeddings = self.sub_store.load_or_build(sub_texts, self._encode_corpus)
+        # 由子示例的问题部分定位其所属的示例
+        self._sub_parent = {}
+        for i, subs in enumerate(self.sub_examples):
+            self._sub_parent.setdefault(tuple(sub['question_part'] for sub in subs), i)
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        """编码查询文本，最近的查询结果保留在内存中"""
+        with self._query_lock:
+            if query in self._query_embeddings:
+                self._query_embeddings.move_to_end(query)
+                return self._query_embeddings[query]
+        embedding = self.model.encode(query, convert_to_numpy=True)
+        self._remember_queries([query], [embedding])
+        return embedding
+
+    def _remember_queries(self, queries: List[str], embeddings):
+        with self._query_lock:
+            for query, embedding in zip(queries, embeddings):
+                self._query_embeddings[query] = embedding
+                self._query_embeddings.move_to_end(query)
+            while len(self._query_embeddings) > self._query_cache_size:
+                self._query_embeddings.popitem(last=False)
+
+    def _extract_full_examples(self, prompt: str) -> List[Dict]:
+        """从prompt中提取完整的SQL示例片段"""
+        examples = []
+        # 分割每个完整的示例
+        example_blocks = prompt.split('/* Answer the following:')[1:]
+
+        for block in example_blocks:
+            if '#SQL:' in block:
+                # 提取问题描述
+                question_part = block.split('*/')[0].strip()
+                # 提取完整示例内容
+                full_example = '/* Answer the following:' + block.split('#SQL:')[0].strip()
+                # 提取SQL语句
+                sql = block.split('#SQL:')[1].strip()
+
+                examples.append({
+                    'question_part': question_part,
+                    'full_example': full_example,
+                    'sql': sql
+                })
+        return examples
+
+    def _index_version(self) -> Dict:
+        """决定检索结果的全部因素：检索器、嵌入模型、示例库内容和索引后端"""
+        return {
+            'retriever': type(self).__name__,
+            'model': self.model.name,
+            'corpus': EmbeddingStore.corpus_hash([EmbeddingStore.text_hash(t) for t in self.example_texts]),
+            'index': self.index.name
+        }
+
+    def retrieve(self, query: str, top_k: int = 1, min_similarity: float = 0.4) -> List[Dict]:
+        """
+        检索相似示例并返回完整的SQL示例片段（结果经缓存，返回值是独立副本，可以随意修改）
+
+        Args:
+            query: 查询文本
+            top_k: 返回数量
+            min_similarity: 最小相似度阈值
+
+        Returns:
+            包含完整SQL示例片段的检索结果列表
+        """
+        key = self.cache.make_key(query, top_k, min_similarity)
+        results = self.cache.get(key)
+        if results is None:
+            results = self._retrieve(query, top_k, min_similarity)
+            self.cache.put(key, results)
+            # _make_result 引用的是 self.sub_examples 中的对象，返回副本以免调用方改动示例库
+            results = copy.deepcopy(results)
+        return results
+
+    def _retrieve(self, query: str, top_k: int, min_similarity: float) -> List[Dict]:
+        """稠密向量检索（不经缓存）"""
+        self._print_header(f"RAG query: {query}")
+
+        query_embedding = self._encode_query(query)
+        top_indices, top_sims = self.index.search(query_embedding, top_k)
+        results = self._collect_results(top_indices, top_sims, min_similarity)
+
+        print("\nTOP MATCHING EXAMPLES:")
+        for result in results:
+            self._print_result(result)
+
+        self._print_footer()
+        return results
+
+    def retrieve_many(self, queries: List[str], top_k: int = 1, min_similarity: float = 0.4,
+                      batch_size: int = 128) -> List[List[Dict]]:
+        """
+        批量检索：未命中缓存的查询按 batch_size 成批编码，再一次性检索，结果写入检索缓存。
+        离线运行时可以在调用 LLM 之前预取整个数据集的检索结果，之后的 retrieve 直接命中缓存。
+
+        Returns:
+            与 queries 一一对应的检索结果列表（格式同 retrieve）
+        """
+        keys = [self.cache.make_key(query, top_k, min_similarity) for query in queries]
+        results = [self.cache.get(key) for key in keys]
+        # 缺失的查询去重后批量处理
+        missing = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+        if missing:
+            embeddings = self.model.encode(missing, batch_size=batch_size, convert_to_numpy=True,
+                                           show_progress_bar=len(missing) > batch_size)
+            # 查询嵌入留在内存中，随后 evaluate_examples_similarity 不必再编码
+            self._query_cache_size = max(self._query_cache_size, len(missing))
+            self._remember_queries(missing, embeddings)
+            fetched = dict(zip(missing, self._retrieve_batch(missing, embeddings, top_k, min_similarity)))
+            for j, (key, query) in enumerate(zip(keys, queries)):
+                if results[j] is None:
+                    self.cache.put(key, fetched[query])
+                    results[j] = copy.deepcopy(fetched[query])
+        return results
+
+    def _retrieve_batch(self, queries: List[str], embeddings: np.ndarray, top_k: int,
+                        min_similarity: float) -> List[List[Dict]]:
+        """对已编码的一批查询做一次矩阵乘检索（不经缓存、不打印）"""
+        hits = self.index.search_many(np.asarray(embeddings, dtype=np.float32), top_k)
+        return [self._collect_results(indices, sims, min_similarity) for indices, sims in hits]
+
+    def _collect_results(self, top_indices, top_sims, min_similarity: float) -> List[Dict]:
+        results = []
+        for i, sim in zip(top_indices, top_sims):
+            if sim > min_similarity:
+                result = self._make_result(i, sim)
+                if result:
+                    results.append(result)
+        return results
+
+    def _make_result(self, i: int, sim: float):
+        """构造第 i 个示例的检索结果；该示例没有完整SQL示例时返回 None"""
+        example = self.example_db[i]
+        # 该prompt中的所有完整SQL示例（初始化时已抽取）
+        sql_examples = self.sub_examples[i]
+        if not sql_examples:
+            return None
+        return {
+            'similarity': round(float(sim), 4),
+            'original_question': example.get('question', ''),
+            'evidence': example.get('evidence', ''),
+            'db_id': example.get('db_id', ''),
+            'sql_examples': sql_examples  # 包含所有完整SQL示例
+        }
+
+    def evaluate_examples_similarity(self, query: str, examples: List[Dict]) -> List[Dict]:
+        """
+        计算每个示例的问题与查询之间的相似度，并返回包含所有示例的结果列表
+
+        Args:
+            query: 查询文本
+            examples: 待评估的示例列表
+
+        Returns:
+            每个示例与查询的相似度结果列表
+        """
+        query_embedding = self._encode_query(query).astype(np.float32)
+        parent = self._sub_parent.get(tuple(ex['question_part'] for ex in examples))
+        if parent is not None:
+            # 示例库中的子示例：对预先编码的矩阵切片做一次矩阵-向量乘；
+            # 范数只对这几行现算，加载时不必把整个内存映射矩阵读进内存
+            start, end = self.sub_offsets[parent], self.sub_offsets[parent + 1]
+            block = np.asarray(self.sub_embeddings[start:end], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1) * np.linalg.norm(query_embedding)
+            sims = block @ query_embedding / np.maximum(norms, 1e-12)
+        else:
+            # 不在示例库中的示例才需要现场编码
+            example_embeddings = self.model.encode(
+                [ex['question_part'] for ex in examples],
+                convert_to_numpy=True
+            )
+            sims = cosine_similarity(query_embedding.reshape(1, -1), example_embeddings)[0]
+
+        # 包含每个示例和其相似度的新结构
+        examples_with_similarity = [{'example': ex, 'similarity': sim} for ex, sim in zip(examples, sims)]
+
+        # 按相似度排序
+        examples_with_similarity.sort(key=lambda x: x['similarity'], reverse=True)
+
+        return examples_with_similarity
+
+    def _print_header(self, title: str):
+        """打印输出头部"""
+        print("\n" + "=" * 80)
+        print(title.center(80))
+        print("=" * 80)
+
+    def _print_result(self, result: Dict):
+        """打印单个检索结果及其SQL示例"""
+        print(f"\n[相似度: {result['similarity']:.2f}]")
+        print(f"[原始问题]: {result['original_question']}")
+        print(f"[证据]: {result['evidence']}")
+        print(f"[数据库]: {result['db_id']}")
+        print("=" * 80)
+        # print("\n[相关SQL示例]:")
+        # for i, example in enumerate(result['sql_examples'], 1):
+        #     print(f"\n示例 {i}:")
+        #     print("-" * 60)
+        #     print(example['full_example'])
+        #     print("#SQL:", example['sql'])
+        #     print("-" * 60)
+
+    def _print_footer(self):
+        """打印输出尾部"""
+        print("\n" + "=" * 80 + "\n")
+
+
+if __name__ == '__main__':
+    # 离线构建示例库嵌入：python -m src.rag --example_db ./question.json
+    parser = argparse.ArgumentParser("Build RAG example-bank embeddings")
+    parser.add_argument('--example_db', type=str, default='./question.json')
+    parser.add_argument('--model_path', type=str, default='/model/LLM/bge-large')
+    parser.add_argument('--store_path', type=str, default=None)
+    parser.add_argument('--store_dtype', type=str, default='float32')
+    parser.add_argument('--index_backend', type=str, default='auto')
+    parser.add_argument('--encoder', type=str, default='sentence-transformers', choices=ENCODER_BACKENDS)
+    parser.add_argument('--max_seq_length', type=int, default=None)
+    opt = parser.parse_args()
+    encoder = build_encoder(opt.encoder, opt.model_path, opt.max_seq_length)
+    rag = RAGModule(opt.example_db, opt.model_path, opt.store_path, opt.store_dtype, opt.index_backend,
+                    encoder=encoder)
+    print(f"{len(rag.example_texts)} embeddings ready at {rag.store.npy_path}")
@@ -0,0 +1,120 @@
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+from src.bm25_index import BM25Index, sql_tokenizer
+from src.rag import RAGModule
+
+FUSIONS = ('rrf', 'weighted')
+
+
+class HybridRAGModule(RAGModule):
+    """
+    BM25 + 稠密向量的混合检索
+
+    BM25 先给出 candidate_k 个候选，同时在另一个线程里编码查询；稠密模型只对候选打分，
+    两路排名再用 RRF 或加权归一化求和融合。返回结果的结构与 RAGModule.retrieve 完全相同，
+    其中 'similarity' 仍是稠密余弦相似度，min_similarity 阈值也作用于它。
+    """
+
+    def __init__(self, example_db_path='question.json', model_path='/model/LLM/bge-large',
+                 store_path=None, store_dtype='float32', index_backend='auto',
+                 cache_path=None, cache_size=1000, encoder=None,
+                 fusion='rrf', candidate_k=50, dense_weight=0.5, rrf_k=60):
+        """
+        Args:
+            fusion: 融合方式，rrf（倒数排名融合）或 weighted（BM25 与余弦相似度加权求和）
+            candidate_k: BM25 候选数，稠密模型只对这些候选打分
+            dense_weight: weighted 融合时稠密分数的权重
+            rrf_k: RRF 的平滑常数
+            其余参数同 RAGModule
+        """
+        assert fusion in FUSIONS, f"fusion should be one of {FUSIONS}"
+        # 融合参数参与检索缓存的索引版本，需在父类初始化之前设置
+        self.fusion = fusion
+        self.candidate_k = candidate_k
+        self.dense_weight = dense_weight
+        self.rrf_k = rrf_k
+        super().__init__(example_db_path, model_path, store_path, store_dtype, index_backend,
+                         cache_path, cache_size, encoder)
+        # BM25 倒排索引与嵌入存储放在一起，语料不变时直接加载
+        self.bm25 = BM25Index.load_or_build(self.store_path + '_bm25.npz', self.example_texts)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='hybrid-rag')
+
+    def _bm25_candidates(self, tokens: List[str]):
+        """BM25 前 candidate_k 个得分为正的候选（按分数降序）"""
+        return self.bm25.search(tokens, self.candidate_k)
+
+    def _dense_scores(self, query_embedding: np.ndarray, cands: np.ndarray) -> np.ndarray:
+        """只对候选行计算余弦相似度"""
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        vectors = np.asarray(self.example_embeddings[cands], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_embedding)
+        return vectors @ query_embedding / np.maximum(norms, 1e-12)
+
+    def _fuse(self, bm25_scores: np.ndarray, dense_scores: np.ndarray) -> np.ndarray:
+        if self.fusion == 'rrf':
+            # bm25_scores 已按降序排列，名次即下标
+            bm25_rank = np.arange(len(bm25_scores))
+            dense_rank = np.empty(len(dense_scores), dtype=np.int64)
+            dense_rank[np.argsort(-dense_scores, kind='stable')] = np.arange(len(dense_scores))
+            return 1.0 / (self.rrf_k + 1 + bm25_rank) + 1.0 / (self.rrf_k + 1 + dense_rank)
+        bm25_norm = bm25_scores / max(float(bm25_scores[0]), 1e-12)
+        return (1 - self.dense_weight) * bm25_norm + self.dense_weight * dense_scores
+
+    def _retrieve_batch(self, queries: List[str], embeddings: np.ndarray, top_k: int,
+                        min_similarity: float) -> List[List[Dict]]:
+        """查询嵌入已由 retrieve_many 批量编码并放入内存，逐条做 BM25 候选生成和重打分"""
+        return [self._retrieve(query, top_k, min_similarity) for query in queries]
+
+    def _index_version(self) -> Dict:
+        version = super()._index_version()
+        version.update(fusion=self.fusion, candidate_k=self.candidate_k,
+                       dense_weight=self.dense_weight, rrf_k=self.rrf_k)
+        return version
+
+    def _retrieve(self, query: str, top_k: int, min_similarity: float) -> List[Dict]:
+        """
+        混合检索（不经缓存），参数与返回值同 RAGModule.retrieve
+
+        查询中没有可用的关键词，或 BM25 没有命中任何示例时，退回纯稠密检索
+        """
+        tokens = sql_tokenizer(query)
+        # 两路并发：BM25 候选生成与查询编码
+        encode_future = self._executor.submit(self._encode_query, query)
+        cands, bm25_scores = self._bm25_candidates(tokens) if tokens else (np.empty(0, dtype=np.int64), None)
+        query_embedding = encode_future.result()
+        if len(cands) == 0:
+            return super()._retrieve(query, top_k, min_similarity)
+
+        self._print_header(f"Hybrid RAG query: {query}")
+        dense_scores = self._dense_scores(query_embedding, cands)
+        order = np.argsort(-self._fuse(bm25_scores, dense_scores), kind='stable')
+        results = []
+
+        print("\nTOP MATCHING EXAMPLES:")
+        for j in order:
+            if len(results) >= top_k:
+                break
+            if dense_scores[j] > min_similarity:
+                result = self._make_result(int(cands[j]), float(dense_scores[j]))
+                if result:
+                    self._print_result(result)
+                    results.append(result)
+
+        self._print_footer()
+        return results
+
+
+if __name__ == '__main__':
+    # 示例：python -m src.rag_hybrid --example_db ./question.json --query "How many schools ..."
+    parser = argparse.ArgumentParser("Hybrid BM25 + dense retrieval")
+    parser.add_argument('--example_db', type=str, default='./question.json')
+    parser.add_argument('--model_path', type=str, default='/model/LLM/bge-large')
+    parser.add_argument('--fusion', type=str, default='rrf', choices=FUSIONS)
+    parser.add_argument('--candidate_k', type=int, default=50)
+    parser.add_argument('--top_k', type=int, default=3)
+    parser.add_argument('--query', type=str, required=True)
+    opt = parser.parse_args()
+    rag = HybridRAGModule(opt.example_db, opt.model_path, fusion=opt.fusion, candidate_k=opt.candidate_k)
+    rag.retrieve(opt.query, opt.top_k)
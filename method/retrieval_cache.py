@@ -0,0 +1,83 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from src.llm_cache import ResponseCache
+
+
+class RetrievalCache:
+    """
+    检索结果缓存：进程内 LRU，可选再加一层 SQLite 持久化（与 LLM 响应缓存同一实现）
+
+    key 由规范化后的查询、top_k、阈值和索引版本组成；索引版本应覆盖嵌入模型、示例库内容和
+    检索参数，任何一项变化都会自然失效。结果以 JSON 字符串保存，每次命中都反序列化出
+    新对象，调用方修改返回值不会影响缓存。
+    """
+
+    def __init__(self, index_version: str, max_entries: int = 1000, path: Optional[str] = None,
+                 max_disk_entries: int = 200000):
+        """
+        Args:
+            index_version: 索引版本标识
+            max_entries: 内存中最多保留的条目数
+            path: SQLite 持久化路径（None 表示只缓存在内存中）
+            max_disk_entries: 持久化缓存最多保留的条目数
+        """
+        self.index_version = index_version
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> JSON 字符串
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk = ResponseCache(path, max_entries=max_disk_entries) if path else None
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """合并连续空白并去掉首尾空白"""
+        return ' '.join(query.split())
+
+    def make_key(self, query: str, top_k: int, min_similarity: float) -> str:
+        return ResponseCache.make_key(query=self.normalize_query(query), top_k=int(top_k),
+                                      min_similarity=float(min_similarity), index=self.index_version)
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if payload is None and self.disk is not None:
+            payload = self.disk.get(key)
+            if payload is not None:
+                self._remember(key, payload)
+                with self._lock:
+                    self.disk_hits += 1
+        if payload is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return json.loads(payload)
+
+    def put(self, key: str, results: List[Dict]):
+        payload = json.dumps(results, ensure_ascii=False, default=float)
+        self._remember(key, payload)
+        if self.disk is not None:
+            self.disk.put(key, self.index_version, payload)
+
+    def _remember(self, key: str, payload: str):
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def report(self) -> str:
+        total = self.hits + self.disk_hits + self.misses
+        hit_rate = (self.hits + self.disk_hits) / total * 100 if total else 0.0
+        return (f"Retrieval cache: {self.hits} memory hits, {self.disk_hits} disk hits, "
+                f"{self.misses} misses ({hit_rate:.1f}% hit rate)")
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
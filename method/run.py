@@ -1,66 +1,118 @@
-﻿import os
-import json
+﻿import time
 import tqdm
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.modules import TASL, EnhancedTALOG
 from src.rag import RAGModule
+from src.rag_hybrid import HybridRAGModule
+from src.encoders import build_encoder
+from src.checkpoint import CheckpointStore
+from src.llm import response_cache
+from src.llm_async import RetryBudgetExceeded
+
+
+def generate_one(tasl, talog, i):
+    """
+    处理单个问题：模式链接 + SR + SQL 生成，失败时返回兜底SQL
+
+    LLM 重试预算用尽（限流、服务暂时不可用等）时抛出 RetryBudgetExceeded，
+    不写兜底SQL，该问题不进检查点，续跑时会重新生成
+    """
+    db_id = tasl.question_json[i]['db_id']
+    try:
+        sl_schemas = tasl.get_schema(i)
+        result = talog.sr2sql(i, sl_schemas)
+
+        if result is None:
+            # 生成默认错误SQL
+            sql = "SELECT * FROM " + db_id.split('/')[-1].split('.')[0] + "_error"
+            print(f"Warning: Generated default SQL for index {i}")
+        else:
+            _, sql = result
+
+        # 统一格式化处理
+        sql = (sql.replace('\"', '')
+               .replace('\\\n', ' ')
+               .replace('\n', ' ')
+               .strip())
+
+        # 确保最终格式正确
+        sql = sql + '\t----- bird -----\t' + db_id
+
+    except RetryBudgetExceeded:
+        raise
+    except Exception as e:
+        # 异常情况下的兜底处理
+        sql = f"SELECT 'ERROR' AS error_message\t----- bird -----\t{db_id}"
+        print(f"Error processing index {i}: {str(e)}")
 
+    print("\n" + "=" * 50)
+    print(f"Final SQL [{i}]:\n" + sql)
+    print("=" * 50 + "\n")
+    return sql
 
-def generate_sql(tasl, talog, output_path):
-    question_json = tasl.question_json
-    output_dic = {}
-    start_idx = 0
-    # 先尝试读取已有数据（如果文件存在）
-    if os.path.exists(output_path):
-        with open(output_path, 'r') as f:
-            try:
-                output_dic = json.load(f)  # 加载已有数据
-            except json.JSONDecodeError:
-                output_dic = {}  # 文件内容无效时重置
-    # 找到最大的 key（索引），并确定下一个开始的 i
-    if output_dic:
-        max_id = max(int(k) for k in output_dic.keys())
-        start_idx = max_id + 1
-
-    print(f"将从索引 {start_idx} 开始继续生成 SQL...")
-
-    for i in tqdm.tqdm(range(start_idx, len(question_json))):
-        db_id = question_json[i]['db_id']
-        try:
-            sl_schemas = tasl.get_schema(i)
-            result = talog.sr2sql(i, sl_schemas)
 
-            if result is None:
-                # 生成默认错误SQL
-                sql = "SELECT * FROM " + db_id.split('/')[-1].split('.')[0] + "_error"
-                print(f"Warning: Generated default SQL for index {i}")
-            else:
-                _, sql = result
+def prefetch_chunks(rag, question_json, pending):
+    """
+    调用 LLM 之前批量预取检索结果，之后 generate_sr 中的检索直接命中缓存
 
-            # 统一格式化处理
-            sql = (sql.replace('\"', '')
-                   .replace('\\\n', ' ')
-                   .replace('\n', ' ')
-                   .strip())
+    检索缓存没有持久化层时，内存中只能放 max_entries 条，一次预取更多会把自己的结果挤出去；
+    这时按缓存容量分块，每块预取完交给调用方生成，再预取下一块
+    """
+    if rag is None or not pending:
+        yield pending
+        return
+    size = len(pending) if rag.cache.disk is not None else max(1, rag.cache.max_entries)
+    for start in range(0, len(pending), size):
+        chunk = pending[start:start + size]
+        begin = time.time()
+        rag.retrieve_many([f"{question_json[i]['question']} {question_json[i]['evidence']}" for i in chunk])
+        print(f"预取 {len(chunk)} 条检索结果，用时 {time.time() - begin:.1f}s")
+        yield chunk
 
-            # 确保最终格式正确
-            sql = sql + '\t----- bird -----\t' + db_id
 
-        except Exception as e:
-            # 异常情况下的兜底处理
-            sql = f"SELECT 'ERROR' AS error_message\t----- bird -----\t{db_id}"
-            print(f"Error processing index {i}: {str(e)}")
+def generate_sql(tasl, talog, output_path, workers=1, fsync_every=16):
+    question_json = tasl.question_json
+    # 结果先追加到 JSONL 检查点日志，结束时再压缩成 output_path 的 JSON 格式
+    store = CheckpointStore(output_path, fsync_every=fsync_every)
+    # 并发运行会在结果中留下空洞，因此按缺失的索引续跑而不是从最大 key 之后开始
+    completed = store.completed()
+    pending = [i for i in range(len(question_json)) if i not in completed]
 
-        print("\n" + "=" * 50)
-        print("Final SQL:\n" + sql)
-        print("=" * 50 + "\n")
+    print(f"已完成 {len(completed)} 条，剩余 {len(pending)} 条待生成 SQL（workers={workers}）...")
 
-        # 更新字典
-        output_dic[str(i)] = sql
+    retry_later = []  # LLM 暂时性失败的问题，不写入检查点，续跑时重新生成
+    progress = tqdm.tqdm(total=len(pending))
 
-        # 实时写入文件
-        with open(output_path, 'w') as f:
-            json.dump(output_dic, f, indent=4)
+    def finish(i, get_sql):
+        try:
+            store.append(i, get_sql())
+        except RetryBudgetExceeded as e:
+            print(f"LLM unavailable for index {i}, left for resume: {e}")
+            retry_later.append(i)
+        progress.update(1)
+
+    # 线程池保持 workers 个问题同时在途，LLM 往返期间互不阻塞
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for chunk in prefetch_chunks(getattr(talog, 'rag', None), question_json, pending):
+            if executor is None:
+                for i in chunk:
+                    finish(i, lambda: generate_one(tasl, talog, i))
+            else:
+                futures = {executor.submit(generate_one, tasl, talog, i): i for i in chunk}
+                for future in as_completed(futures):
+                    finish(futures[future], future.result)
+        if retry_later:
+            print(f"{len(retry_later)} 条因 LLM 暂时不可用未生成，重新运行即可续跑：{sorted(retry_later)[:20]}")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        progress.close()
+        # 中断时也压缩一次，保证 output_path 始终是评测脚本可读的完整 JSON
+        store.compact()
+        store.close()
+    return store.records
 
 
 def parser():
@@ -68,8 +120,15 @@ def parser():
     parser.add_argument('--db_root_path', type=str, default="./data/dev_databases")
     parser.add_argument('--column_meaning_path', type=str, default="./outputs/column_meaning.json")
     parser.add_argument('--example_db', default="./question.json")  # 新增参数
+    parser.add_argument('--retriever', type=str, default='dense', choices=['dense', 'hybrid'])  # 示例检索方式
+    parser.add_argument('--retrieval_cache', type=str, default="./outputs/retrieval_cache.sqlite")  # 空字符串表示不持久化
+    parser.add_argument('--index_backend', type=str, default='auto')  # 向量索引：exact / int8+rescore / float16 / hnsw ...
+    parser.add_argument('--encoder', type=str, default='sentence-transformers')  # 编码器：onnx / onnx-int8 / distilled
+    parser.add_argument('--max_seq_length', type=int, default=None)  # 编码器最大序列长度
     parser.add_argument('--mode', type=str, default='dev')
     parser.add_argument('--output_path', type=str, default=f"./outputs/predict_dev.json")
+    parser.add_argument('--workers', type=int, default=1)  # 同时在途的问题数
+    parser.add_argument('--fsync_every', type=int, default=16)  # 检查点日志每多少条 fsync 一次
     opt = parser.parse_args()
     return opt
 
@@ -85,14 +144,24 @@ def main(opt):
     output_path = opt.output_path
     example_db = opt.example_db
 
-    rag = RAGModule(example_db)
+    rag_class = HybridRAGModule if opt.retriever == 'hybrid' else RAGModule
+    encoder = build_encoder(opt.encoder, max_seq_length=opt.max_seq_length)
+    rag = rag_class(example_db, index_backend=opt.index_backend, cache_path=opt.retrieval_cache or None,
+                    encoder=encoder)
     tasl = TASL(db_root_path, mode, column_meaning_path)
     # talog = TALOG(db_root_path, mode, rag)
     # 启用RAG
     talog = EnhancedTALOG(db_root_path, mode, rag)
     # 不启用RAG
     #talog = EnhancedTALOG(db_root_path, mode)
-    generate_sql(tasl, talog, output_path)
+    try:
+        generate_sql(tasl, talog, output_path, workers=opt.workers, fsync_every=opt.fsync_every)
+    finally:
+        tasl.close()
+        rag.cache.close()
+    if response_cache is not None:
+        print(response_cache.report())
+    print(rag.cache.report())
 
 
 if __name__ == '__main__':
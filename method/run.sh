@@ -3,6 +3,7 @@ mode='dev'
 meaning_output_path='./outputs/column_meaning.json'
 sql_output_path='./outputs/predict_dev.json'
 example_db='./questions.json'
+workers=8  # number of questions kept in flight; 1 = sequential
 
 #As stated in Appendix A.1, we first generate a succint description for each column.
 #You can comment out the following code and directly utilize './outputs/column_meaning.json' to bypass this step
@@ -12,6 +13,6 @@ example_db='./questions.json'
 # echo 'Description generation is finished.'
 
 echo 'Generate SQLs.'
-python3 ./run.py --db_root_path ${db_root_path} --mode ${mode} --column_meaning_path ${meaning_output_path} --output_path ${sql_output_path} --example_db ${example_db}
+python3 ./run.py --db_root_path ${db_root_path} --mode ${mode} --column_meaning_path ${meaning_output_path} --output_path ${sql_output_path} --example_db ${example_db} --workers ${workers}
 echo 'SQL generation is finished.'
 
@@ -0,0 +1,81 @@
+import threading
+
+
+class SchemaCatalog:
+    """由 {mode}_tables.json 编译得到的模式索引：按 db_id 直接查表，避免每次线性扫描 table_json"""
+
+    def __init__(self, table_json):
+        self._dbs = {}  # db_id -> tables.json 中的原始条目（重复 db_id 取第一条，与原先的 [0] 一致）
+        for content in table_json:
+            self._dbs.setdefault(content['db_id'], content)
+        self._columns = {}  # db_id -> [[表名, 列名], ...]
+        self._column_maps = {}  # db_id -> {表名: {小写列名}}
+        self._pk_fk = {}  # db_id -> (主键字典, 外键字典)
+        for db_id, content in self._dbs.items():
+            self._compile(db_id, content)
+        self._prompts = {}  # (db_id, 提示类型) -> 已渲染的模式提示
+        self._prompt_lock = threading.Lock()
+
+    def _compile(self, db_id, content):
+        table_names_original = content['table_names_original']
+        column_names_original = content['column_names_original']
+
+        columns = [[table_names_original[int(t)], c] for t, c in column_names_original[1:]]
+        column_map = {table: set() for table in table_names_original}
+        for table, col_name in columns:
+            column_map[table].add(col_name.lower())
+
+        pk_dict = {}  # 主键字典：表 -> 主键列
+        fk_dict = {}  # 外键字典：源列 -> 目标列
+        for pk_idx in content['primary_keys']:
+            if type(pk_idx) == int:
+                pk_dict[str(table_names_original[column_names_original[pk_idx][0]])] = [
+                    column_names_original[pk_idx][-1]]
+            else:
+                pk_dict[str(table_names_original[column_names_original[pk_idx[0]][0]])] = [
+                    column_names_original[idx][-1] for idx in pk_idx]
+        for src_col_idx, tgt_col_idx in content['foreign_keys']:
+            src_col_name = str(table_names_original[column_names_original[src_col_idx][0]]) + '.' + str(
+                column_names_original[src_col_idx][-1])
+            tgt_col_name = str(table_names_original[column_names_original[tgt_col_idx][0]]) + '.' + str(
+                column_names_original[tgt_col_idx][-1])
+            fk_dict[src_col_name] = tgt_col_name
+
+        self._columns[db_id] = columns
+        self._column_maps[db_id] = column_map
+        self._pk_fk[db_id] = (pk_dict, fk_dict)
+
+    def __contains__(self, db_id):
+        return db_id in self._dbs
+
+    def db_ids(self):
+        return list(self._dbs)
+
+    def get(self, db_id):
+        """tables.json 中该数据库的原始条目"""
+        return self._dbs[db_id]
+
+    def table_names(self, db_id):
+        return self._dbs[db_id]['table_names_original']
+
+    def columns(self, db_id):
+        """[[表名, 列名], ...]，不含 '*' 列"""
+        return self._columns[db_id]
+
+    def column_map(self, db_id):
+        """{表名: {小写列名}}"""
+        return self._column_maps[db_id]
+
+    def pk_fk(self, db_id):
+        """(主键字典, 外键字典)，调用方只读"""
+        return self._pk_fk[db_id]
+
+    def schema_prompt(self, db_id, kind, render):
+        """按 (db_id, kind) 缓存模式提示字符串，首次使用时调用 render(db_id) 生成"""
+        key = (db_id, kind)
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            prompt = render(db_id)
+            with self._prompt_lock:
+                self._prompts.setdefault(key, prompt)
+        return prompt
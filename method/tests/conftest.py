@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import types
+import sqlite3
+import hashlib
+from contextlib import closing
+import numpy as np
+import pytest
+
+METHOD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# method/ 部署时以 src 包的形式导入（from src.xxx import ...），测试时把 src 指向本目录
+if 'src' not in sys.modules:
+    src = types.ModuleType('src')
+    src.__path__ = [METHOD_DIR]
+    sys.modules['src'] = src
+
+
+class HashEncoder:
+    """确定性的小编码器：按词哈希到 dim 维词袋向量，接口同 src.encoders.SentenceTransformerEncoder"""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+        self.name = f'hash-{dim}'
+        self.calls = 0
+
+    def _one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode('utf-8')).hexdigest(), 16) % self.dim] += 1
+        return vector
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        self.calls += 1
+        if isinstance(texts, str):
+            return self._one(texts)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self._one(text) for text in texts])
+
+
+@pytest.fixture
+def hash_encoder():
+    return HashEncoder()
+
+
+# BIRD 格式的小型数据库目录：两个库，含复合主键、外键、带空格的表名和带 BOM 的描述 CSV
+TABLES = [
+    {'db_id': 'school',
+     'table_names_original': ['student', 'class info'],
+     'table_names': ['student', 'class information'],
+     'column_names_original': [[-1, '*'], [0, 'id'], [0, 'name'], [0, 'grade'], [0, 'class_id'],
+                               [1, 'id'], [1, 'title']],
+     'column_names': [[-1, '*'], [0, 'id'], [0, 'name'], [0, 'grade'], [0, 'class id'], [1, 'id'], [1, 'title']],
+     'primary_keys': [1, 5],
+     'foreign_keys': [[4, 5]]},
+    {'db_id': 'shop',
+     'table_names_original': ['orders'],
+     'table_names': ['orders'],
+     'column_names_original': [[-1, '*'], [0, 'order_id'], [0, 'line'], [0, 'status'], [0, 'placed']],
+     'column_names': [[-1, '*'], [0, 'order id'], [0, 'line'], [0, 'status'], [0, 'placed']],
+     'primary_keys': [[1, 2]],
+     'foreign_keys': []},
+]
+
+DESCRIPTIONS = {
+    ('school', 'student'): [('id', '', 'student id', 'integer', ''),
+                            ('name', 'student name', 'full name\nof the student', 'text', ''),
+                            ('grade', '', '', 'text', 'A: best\nC: worst'),
+                            ('class_id', 'class id', '', 'integer', '')],
+    ('school', 'class information'): [('id', '', '', 'integer', ''), ('title', '', 'class title', 'text', '')],
+    ('shop', 'orders'): [('order_id', '', '', 'integer', ''), ('line', '', '', 'integer', ''),
+                         ('status', '', 'order status', 'text', ''), ('placed', '', '', 'date', '')],
+}
+
+ROWS = {
+    ('school', 'student'): [(i, f"student {i:02d}", 'ABC'[i % 3], i % 4) for i in range(30)],
+    ('school', 'class info'): [(i, f"class {i}") for i in range(4)],
+    ('shop', 'orders'): [(i // 2, i % 2, ['new', 'paid', 'sent'][i % 3], f"2024-01-{i % 28 + 1:02d}")
+                         for i in range(40)],
+}
+
+COLUMN_MEANINGS = {
+    'school|student|name': '# the name of the student',
+    'school|student|grade': '# letter grade\n# A is best',
+    'school|class info|title': '# class title',
+    'shop|orders|status': '# order status',
+    'missing|table|column': '# skipped',
+}
+
+
+def build_db_root(root, mode='dev'):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, f'{mode}_tables.json'), 'w') as f:
+        json.dump(TABLES, f)
+    questions = [{'db_id': 'school', 'question': 'list student names', 'evidence': ''},
+                 {'db_id': 'shop', 'question': 'how many orders are paid', 'evidence': "paid refers to status = 'paid'"}]
+    with open(os.path.join(root, f'{mode}.json'), 'w', encoding='utf-8') as f:
+        json.dump(questions, f)
+    with open(os.path.join(root, 'column_meaning.json'), 'w', encoding='utf-8') as f:
+        json.dump(COLUMN_MEANINGS, f)
+    for table in TABLES:
+        db_id = table['db_id']
+        csv_dir = os.path.join(root, db_id, 'database_description')
+        os.makedirs(csv_dir)
+        with closing(sqlite3.connect(os.path.join(root, db_id, f'{db_id}.sqlite'))) as conn:
+            for column_table, otn in enumerate(table['table_names_original']):
+                columns = [c for t, c in table['column_names_original'] if t == column_table]
+                conn.execute(f"CREATE TABLE `{otn}` ({', '.join(columns)})")
+                conn.executemany(f"INSERT INTO `{otn}` VALUES ({', '.join('?' * len(columns))})",
+                                 ROWS[(db_id, otn)])
+            conn.commit()
+        for tn in table['table_names']:
+            # 第一个文件带 BOM，表头形如 '\ufefforiginal_column_name'
+            with open(os.path.join(csv_dir, f'{tn}.csv'), 'w', encoding='latin1' if tn != 'student' else 'utf-8-sig',
+                      newline='') as f:
+                f.write('original_column_name,column_name,column_description,data_format,value_description\r\n')
+                for row in DESCRIPTIONS[(db_id, tn)]:
+                    f.write(','.join(f'"{v}"' for v in row) + '\r\n')
+    return root
+
+
+@pytest.fixture
+def db_root(tmp_path):
+    return build_db_root(str(tmp_path / 'db'))
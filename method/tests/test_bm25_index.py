@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from src.bm25_index import BM25Index, sql_tokenizer
+
+
+def _corpus(num_docs=3000, vocab_size=400, seed=0):
+    # Zipf 分布的词频：少数常见词的倒排表很长，能走到 search 的剪枝分支
+    rng = np.random.default_rng(seed)
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    probs = 1.0 / np.arange(1, vocab_size + 1)
+    probs /= probs.sum()
+    return [[vocab[t] for t in rng.choice(vocab_size, size=rng.integers(3, 30), p=probs)] for _ in range(num_docs)]
+
+
+def test_scores_match_rank_bm25():
+    rank_bm25 = pytest.importorskip('rank_bm25')
+    corpus = _corpus(num_docs=500)
+    index = BM25Index.build(corpus)
+    reference = rank_bm25.BM25Okapi(corpus)
+    for query in (['w0', 'w5', 'w5', 'w120'], ['w3'], ['w399', 'unknown'], corpus[7]):
+        np.testing.assert_allclose(index.get_scores(query), reference.get_scores(query), rtol=1e-5, atol=1e-5)
+
+
+@pytest.mark.parametrize('top_k', [1, 10, 50])
+def test_search_matches_top_k_of_get_scores(top_k):
+    corpus = _corpus()
+    index = BM25Index.build(corpus)
+    assert index.prunable
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        query = [f"w{t}" for t in rng.integers(0, 400, size=rng.integers(2, 8))] + ['w0', 'w1']
+        docs, scores = index.search(query, top_k)
+        full = index.get_scores(query)
+        expected = np.sort(full[full > 0])[::-1][:top_k]
+        np.testing.assert_allclose(scores, expected, rtol=1e-5)
+        np.testing.assert_allclose(full[docs], scores, rtol=1e-6)
+
+
+def test_search_without_matching_terms():
+    index = BM25Index.build([['select', 'name'], ['count', 'rows']])
+    docs, scores = index.search(['missing'], 5)
+    assert len(docs) == 0 and len(scores) == 0
+
+
+def test_load_or_build_reuses_index_until_corpus_changes(tmp_path):
+    path = str(tmp_path / 'bm25.npz')
+    texts = ['how many students', 'highest movie rating', 'average employee salary']
+    index = BM25Index.load_or_build(path, texts)
+    loaded = BM25Index.load_or_build(path, texts)
+    assert loaded.corpus_hash == index.corpus_hash
+    np.testing.assert_allclose(loaded.get_scores(sql_tokenizer('movie rating')),
+                               index.get_scores(sql_tokenizer('movie rating')))
+
+    rebuilt = BM25Index.load_or_build(path, texts + ['list all courses'])
+    assert len(rebuilt) == 4
+    assert BM25Index.load(path).corpus_hash == rebuilt.corpus_hash
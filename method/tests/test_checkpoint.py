@@ -0,0 +1,60 @@
+import json
+
+from src import checkpoint
+from src.checkpoint import CheckpointStore
+
+
+def test_append_resume_and_compact(tmp_path):
+    output = str(tmp_path / 'predict_dev.json')
+    store = CheckpointStore(output, fsync_every=2)
+    store.append(2, 'SELECT 2')
+    store.append(0, 'SELECT 0')
+    store.close()
+
+    # 未压缩就中断：续跑时从追加日志恢复，并发留下的空洞（索引 1）不算完成
+    store = CheckpointStore(output)
+    assert store.completed() == {0, 2}
+    store.append(1, 'SELECT 1')
+    store.compact()
+    store.close()
+
+    with open(output, encoding='utf-8') as f:
+        assert json.load(f) == {'0': 'SELECT 0', '1': 'SELECT 1', '2': 'SELECT 2'}
+    assert (tmp_path / 'predict_dev.jsonl').read_text(encoding='utf-8') == ''
+
+
+def test_torn_last_line_is_dropped_and_truncated(tmp_path):
+    output = str(tmp_path / 'predict_dev.json')
+    log = tmp_path / 'predict_dev.jsonl'
+    complete = json.dumps({'idx': 0, 'value': 'SELECT 0'}) + '\n'
+    log.write_text(complete + '{"idx": 1, "val', encoding='utf-8')
+
+    store = CheckpointStore(output)
+    assert store.completed() == {0}
+    # 残行被截掉，之后追加的记录从新的一行开始
+    assert log.read_text(encoding='utf-8') == complete
+    store.append(1, 'SELECT 1')
+    store.close()
+
+    assert CheckpointStore(output).records == {0: 'SELECT 0', 1: 'SELECT 1'}
+
+
+def test_log_records_override_compacted_output(tmp_path):
+    output = tmp_path / 'predict_dev.json'
+    output.write_text(json.dumps({'0': 'OLD', '1': 'SELECT 1'}), encoding='utf-8')
+    (tmp_path / 'predict_dev.jsonl').write_text(json.dumps({'idx': 0, 'value': 'NEW'}) + '\n', encoding='utf-8')
+
+    assert CheckpointStore(str(output)).records == {0: 'NEW', 1: 'SELECT 1'}
+
+
+def test_fsync_is_batched(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(checkpoint.os, 'fsync', synced.append)
+    store = CheckpointStore(str(tmp_path / 'predict_dev.json'), fsync_every=4)
+    for i in range(10):
+        store.append(i, f'SELECT {i}')
+    assert len(synced) == 2
+    # 关闭时把剩下不足一批的记录落盘
+    store.close()
+    assert len(synced) == 3
+    assert len(CheckpointStore(str(tmp_path / 'predict_dev.json')).records) == 10
@@ -0,0 +1,60 @@
+import os
+import json
+import random
+import sqlite3
+from contextlib import closing
+
+from src import db_metadata
+from src.db_metadata import SAMPLE_SIZE, column_stats, default_store_path, load_info_from_csv
+
+
+def _table_json(db_root):
+    with open(os.path.join(db_root, 'dev_tables.json')) as f:
+        return json.load(f)
+
+
+def test_single_pass_samples_match_offset_queries(tmp_path):
+    with closing(sqlite3.connect(str(tmp_path / 'values.sqlite'))) as conn:
+        conn.execute("CREATE TABLE t (v)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(f"v{i % 500:03d}",) for i in range(2000)] + [(None,)])
+        cursor = conn.cursor()
+        stats = column_stats(cursor, 't', 'v', seed='db|t|v')
+
+        # 原先逐个偏移量执行 LIMIT 1 OFFSET ? 的抽样结果
+        offsets = sorted(random.Random('db|t|v').sample(range(500), SAMPLE_SIZE))
+        expected = [cursor.execute('SELECT DISTINCT "v" FROM `t` WHERE "v" IS NOT NULL ORDER BY "v" '
+                                   'LIMIT 1 OFFSET ?', (offset,)).fetchone()[0] for offset in offsets]
+    assert stats == {'distinct_count': 500, 'samples': expected, 'low_cardinality': False}
+
+
+def _fail(*args, **kwargs):
+    raise AssertionError('warm start must not touch the databases, the CSV files or a process pool')
+
+
+def test_warm_start_uses_no_sql_and_no_pool(db_root, monkeypatch):
+    table_json = _table_json(db_root)
+    store_path = default_store_path(db_root, 'dev')
+    cold = load_info_from_csv(db_root, table_json, store_path, workers=2)
+    assert os.path.exists(store_path)
+
+    monkeypatch.setattr(db_metadata, 'ProcessPoolExecutor', _fail)
+    monkeypatch.setattr(db_metadata, 'connect_readonly', _fail)
+    monkeypatch.setattr(db_metadata, 'load_db_info', _fail)
+    assert load_info_from_csv(db_root, table_json, store_path, workers=2) == cold
+
+
+def test_changed_csv_is_reparsed_without_resampling(db_root, monkeypatch):
+    table_json = _table_json(db_root)
+    store_path = default_store_path(db_root, 'dev')
+    load_info_from_csv(db_root, table_json, store_path, workers=1)
+
+    csv_path = os.path.join(db_root, 'shop', 'database_description', 'orders.csv')
+    with open(csv_path, 'a', encoding='latin1', newline='') as f:
+        f.write('"quantity","","items ordered","integer",""\r\n')
+    # 数据库未变化：只重新解析 CSV，取值统计沿用存储，不访问数据库
+    monkeypatch.setattr(db_metadata, 'connect_readonly', _fail)
+    csv_info, value_prompt = load_info_from_csv(db_root, table_json, store_path, workers=1)
+    assert csv_info['shop|orders']['quantity'] == ['quantity', 'items ordered', 'integer', '']
+    assert 'shop|orders|status' in value_prompt
+    with open(store_path, encoding='utf-8') as f:
+        assert 'quantity' in json.load(f)['shop']['csv_info']['shop|orders']
@@ -0,0 +1,51 @@
+import numpy as np
+
+from src.embedding_store import EmbeddingStore
+
+
+class CountingEncoder:
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        return self.encoder.encode(texts)
+
+
+def test_load_or_build_reuses_store(tmp_path, hash_encoder, capsys):
+    texts = ['how many students', 'highest movie rating']
+    encode = CountingEncoder(hash_encoder)
+    store = EmbeddingStore(str(tmp_path / 'emb'), hash_encoder.name)
+    built = store.load_or_build(texts, encode)
+    loaded = store.load_or_build(texts, encode)
+
+    assert isinstance(loaded, np.memmap)
+    np.testing.assert_array_equal(loaded, built)
+    np.testing.assert_array_equal(loaded, hash_encoder.encode(texts))
+    assert encode.encoded == texts
+
+
+def test_rebuild_only_encodes_changed_texts(tmp_path, hash_encoder, capsys):
+    prefix = str(tmp_path / 'emb')
+    EmbeddingStore(prefix, hash_encoder.name).build(['a b', 'c d', 'e f'], hash_encoder.encode)
+
+    encode = CountingEncoder(hash_encoder)
+    texts = ['c d', 'new text', 'a b']
+    embeddings = EmbeddingStore(prefix, hash_encoder.name).load_or_build(texts, encode)
+    assert encode.encoded == ['new text']
+    np.testing.assert_array_equal(embeddings, hash_encoder.encode(texts))
+
+
+def test_model_or_dtype_change_invalidates(tmp_path, hash_encoder, capsys):
+    prefix = str(tmp_path / 'emb')
+    texts = ['a b', 'c d']
+    EmbeddingStore(prefix, hash_encoder.name).build(texts, hash_encoder.encode)
+    assert EmbeddingStore(prefix, 'other-model').load(texts) is None
+    assert EmbeddingStore(prefix, hash_encoder.name, dtype='float16').load(texts) is None
+    assert EmbeddingStore(prefix, hash_encoder.name).load(texts + ['e f']) is None
+
+    # 换了模型时旧向量全部作废，所有文本重新编码
+    encode = CountingEncoder(hash_encoder)
+    EmbeddingStore(prefix, 'other-model').load_or_build(texts, encode)
+    assert encode.encoded == texts
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+sentence_transformers = pytest.importorskip('sentence_transformers')
+
+from src import encoders
+from src.encoders import DEFAULT_MODEL_PATH, DISTILLED_MODEL_PATH, ONNX_QUANT_CONFIG, build_encoder
+
+
+class FakeSentenceTransformer:
+    """记录构造参数，代替磁盘上的 sentence-transformers 模型"""
+
+    def __init__(self, model_path, backend='torch', model_kwargs=None):
+        self.model_path = model_path
+        self.backend = backend
+        self.model_kwargs = model_kwargs
+        self.max_seq_length = 512
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    monkeypatch.setattr(encoders, 'SentenceTransformer', FakeSentenceTransformer)
+
+
+def test_default_and_distilled_backends():
+    encoder = build_encoder()
+    assert (encoder.model.model_path, encoder.model.backend) == (DEFAULT_MODEL_PATH, 'torch')
+    # 默认配置的名字与原来的模型路径相同，已有嵌入存储继续有效
+    assert encoder.name == DEFAULT_MODEL_PATH
+
+    encoder = build_encoder('distilled', max_seq_length=128)
+    assert encoder.model.model_path == DISTILLED_MODEL_PATH
+    assert encoder.model.max_seq_length == 128
+    assert encoder.name == DISTILLED_MODEL_PATH + '@128'
+
+
+def test_onnx_backends(tmp_path, monkeypatch):
+    model_path = str(tmp_path / 'bge')
+    encoder = build_encoder('onnx', model_path)
+    assert encoder.model.backend == 'onnx' and encoder.name == model_path + '#onnx'
+
+    exported = []
+    monkeypatch.setattr(sentence_transformers, 'export_dynamic_quantized_onnx_model',
+                        lambda model, config, path: exported.append((model.backend, config, path)), raising=False)
+    encoder = build_encoder('onnx-int8', model_path)
+    file_name = f'onnx/model_qint8_{ONNX_QUANT_CONFIG}.onnx'
+    # 量化模型不存在时先导出一次
+    assert exported == [('onnx', ONNX_QUANT_CONFIG, model_path)]
+    assert encoder.model.model_kwargs == {'file_name': file_name}
+    assert encoder.name == f'{model_path}#onnx-int8-{ONNX_QUANT_CONFIG}'
+
+    os.makedirs(os.path.join(model_path, 'onnx'))
+    open(os.path.join(model_path, file_name), 'w').close()
+    build_encoder('onnx-int8', model_path)
+    assert len(exported) == 1
+
+
+def test_unknown_backend():
+    with pytest.raises(AssertionError, match='backend should be one of'):
+        build_encoder('tensorrt')
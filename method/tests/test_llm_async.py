@@ -0,0 +1,125 @@
+import time
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.llm_async import AsyncChatClient, ChatCompletionError, RetryBudgetExceeded, TokenBucket, parse_retry_after
+
+MESSAGES = [{'role': 'user', 'content': 'SELECT 1'}]
+
+
+def _reply(content):
+    return web.json_response({'choices': [{'message': {'content': content}}], 'usage': {'total_tokens': 10}})
+
+
+def _serve(responses, client_kwargs, calls):
+    """本地模拟 /chat/completions：依次返回 responses 中的响应（用完后重复最后一个）"""
+
+    async def handler(request):
+        calls.append(await request.json())
+        return responses[min(len(calls), len(responses)) - 1]()
+
+    async def main():
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', handler)
+        server = TestServer(app)
+        await server.start_server()
+        client = AsyncChatClient(str(server.make_url('/v1')), 'test-key', **client_kwargs)
+        try:
+            return await client.chat('test-model', MESSAGES, temperature=0)
+        finally:
+            await client.aclose()
+            await server.close()
+
+    return main
+
+
+def _record_backoff(delays):
+    # 记录每次退避实际选取的等待时间，检查抖动范围
+    original = AsyncChatClient._backoff
+
+    def backoff(self, attempt):
+        delay = original(self, attempt)
+        delays.append((attempt, delay))
+        return delay
+
+    return backoff
+
+
+def test_retries_429_with_retry_after_then_5xx_then_succeeds(monkeypatch, capsys):
+    calls, delays = [], []
+    kwargs = dict(max_retries=3, base_delay=0.05, max_delay=1.0)
+    monkeypatch.setattr(AsyncChatClient, '_backoff', _record_backoff(delays))
+    responses = [lambda: web.Response(status=429, headers={'Retry-After': '0.3'}, text='slow down'),
+                 lambda: web.Response(status=503, text='unavailable'),
+                 lambda: _reply('ok')]
+
+    start = time.monotonic()
+    assert asyncio.run(_serve(responses, kwargs, calls)()) == 'ok'
+    elapsed = time.monotonic() - start
+
+    assert len(calls) == 3
+    assert calls[0]['model'] == 'test-model' and calls[0]['messages'] == MESSAGES
+    # 429 按 Retry-After 等待，不走退避；503 是第二次尝试，full jitter 在 [0, base * 2] 内
+    assert elapsed >= 0.3
+    assert len(delays) == 1
+    attempt, delay = delays[0]
+    assert attempt == 1 and 0 <= delay <= 0.1
+    assert 'retry 1/3 in 0.3s' in capsys.readouterr().out
+
+
+def test_raises_retry_budget_exceeded_when_retries_run_out(capsys):
+    calls = []
+    responses = [lambda: web.Response(status=502, text='bad gateway')]
+    with pytest.raises(RetryBudgetExceeded, match='3 attempts'):
+        asyncio.run(_serve(responses, dict(max_retries=2, base_delay=0.01), calls)())
+    assert len(calls) == 3
+
+
+def test_non_retryable_status_fails_immediately():
+    calls = []
+    responses = [lambda: web.Response(status=400, text='bad request')]
+    with pytest.raises(ChatCompletionError) as info:
+        asyncio.run(_serve(responses, dict(max_retries=5, base_delay=0.01), calls)())
+    assert info.value.status == 400
+    assert len(calls) == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({'retry-after-ms': '1500'}) == 1.5
+    assert parse_retry_after({'Retry-After': '2'}) == 2.0
+    assert parse_retry_after({'Retry-After': 'Thu, 01 Jan 1970 00:00:00 GMT'}) == 0.0
+    assert parse_retry_after({'Retry-After': 'soon'}) is None
+    assert parse_retry_after({}) is None
+
+
+def test_token_bucket_limits_rate():
+    async def main():
+        bucket = TokenBucket(600, capacity=2)  # 每秒补充 10 个
+        start = time.monotonic()
+        for _ in range(2):
+            await bucket.acquire()
+        burst = time.monotonic() - start
+        await bucket.acquire()
+        waited = time.monotonic() - start - burst
+        # 超过容量的请求按容量扣除，不会永远等待
+        await asyncio.wait_for(bucket.acquire(100), 1)
+        bucket.refund(1)
+        return burst, waited, bucket.tokens
+
+    burst, waited, tokens = asyncio.run(main())
+    assert burst < 0.05
+    assert 0.07 <= waited < 0.5
+    assert tokens <= 2
+
+
+def test_backoff_is_capped_full_jitter():
+    client = AsyncChatClient('http://127.0.0.1:9', 'test-key', base_delay=0.5, max_delay=2.0)
+    delays = [client._backoff(attempt) for attempt in range(10) for _ in range(20)]
+    assert all(0 <= d <= 2.0 for d in delays)
+    assert all(0 <= client._backoff(0) <= 0.5 for _ in range(50))
+    assert len(set(delays)) > 1
@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+
+from src.llm_cache import ResponseCache
+
+
+def test_key_depends_on_every_parameter():
+    key = ResponseCache.make_key(model='m', prompt='SELECT 1', max_tokens=800, stop=None)
+    assert key == ResponseCache.make_key(stop=None, max_tokens=800, prompt='SELECT 1', model='m')
+    assert key != ResponseCache.make_key(model='m', prompt='SELECT 1', max_tokens=800, stop=['\n'])
+    assert key != ResponseCache.make_key(model='other', prompt='SELECT 1', max_tokens=800, stop=None)
+
+
+def test_entries_persist_across_reopen(tmp_path):
+    path = str(tmp_path / 'llm_cache.sqlite')
+    cache = ResponseCache(path)
+    key = ResponseCache.make_key(prompt='q')
+    assert cache.get(key) is None
+    cache.put(key, 'm', 'answer')
+    cache.close()
+
+    cache = ResponseCache(path)
+    assert cache.get(key) == 'answer'
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert '1 hits' in cache.report()
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1000))
+    monkeypatch.setattr(time, 'time', lambda: next(clock))
+    cache = ResponseCache(str(tmp_path / 'llm_cache.sqlite'), max_entries=2, evict_every=1)
+    cache.put('a', 'm', 'A')
+    cache.put('b', 'm', 'B')
+    assert cache.get('a') == 'A'  # a 比 b 更近被访问
+    cache.put('c', 'm', 'C')
+    assert [cache.get(k) for k in 'abc'] == ['A', None, 'C']
+    cache.close()
+
+
+def test_expired_entries_miss(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = ResponseCache(str(tmp_path / 'llm_cache.sqlite'), max_age_days=1)
+    cache.put('a', 'm', 'A')
+    now[0] += 86400 - 1
+    assert cache.get('a') == 'A'
+    now[0] += 2
+    assert cache.get('a') is None
+    cache.close()
+
+
+def test_collect_response_hit_skips_the_client(tmp_path, monkeypatch, capsys):
+    pytest.importorskip('openai')
+    os.environ.setdefault('LLM_CACHE_PATH', '')  # 导入时不创建默认缓存文件
+    from src import llm
+
+    class Client:
+        calls = 0
+
+        def chat_sync(self, model, messages, **params):
+            Client.calls += 1
+            return ' SELECT 1 '
+
+    monkeypatch.setattr(llm, 'response_cache', ResponseCache(str(tmp_path / 'llm_cache.sqlite')))
+    monkeypatch.setattr(llm, 'llm_client', Client())
+    assert llm.collect_response('prompt', stop=['\n']) == 'SELECT 1'
+    assert llm.collect_response('prompt', stop=['\n']) == 'SELECT 1'
+    assert Client.calls == 1
+    # 参数不同的请求不能命中
+    assert llm.collect_response('prompt', max_tokens=100, stop=['\n']) == 'SELECT 1'
+    assert Client.calls == 2
+    llm.response_cache.close()
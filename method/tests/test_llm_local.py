@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+torch = pytest.importorskip('torch')
+transformers = pytest.importorskip('transformers')
+from tokenizers import Tokenizer, models, pre_tokenizers
+
+from src.llm_local import LocalLLM, MicroBatchQueue, PrefixCache
+
+PREFIX = 'you are a sql expert . answer with one query .'
+WORDS = ['[PAD]', '[UNK]', '<user>', '<end>'] + sorted(set((PREFIX + ' list all paid orders count students').split()))
+
+
+class TinyLLM(LocalLLM):
+    """随机初始化的小型 Llama 和词表分词器，代替磁盘上的模型"""
+
+    def _load_model(self):
+        tokenizer = Tokenizer(models.WordLevel({w: i for i, w in enumerate(WORDS)}, unk_token='[UNK]'))
+        tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+        self.tokenizer = transformers.PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token='[PAD]',
+                                                              eos_token='<end>', padding_side='left')
+        self.tokenizer.chat_template = "{% for m in messages %}<user> {{ m['content'] }} <end> {% endfor %}"
+        torch.manual_seed(0)
+        config = transformers.LlamaConfig(vocab_size=len(WORDS), hidden_size=32, intermediate_size=64,
+                                          num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=2,
+                                          max_position_embeddings=128)
+        self.model = transformers.LlamaForCausalLM(config).eval()
+
+
+class GatedLLM:
+    """接口同 LocalLLM.generate_batch：记录每一批的提示和参数，第一批阻塞到 gate 打开"""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def generate_batch(self, prompts, max_tokens, temperature, top_p, stop):
+        self.started.set()
+        assert self.gate.wait(5)
+        self.batches.append((list(prompts), max_tokens))
+        return [prompt.upper() for prompt in prompts]
+
+
+def _run(requests, max_batch_size):
+    llm = GatedLLM()
+    batch_queue = MicroBatchQueue(llm, max_batch_size=max_batch_size, max_wait_ms=50)
+    # 先让工作线程卡在一个批次里，保证之后的请求全部排好队再开始收集
+    futures = [batch_queue.submit('hold', 1, 0.5, 0.9, None)]
+    assert llm.started.wait(5)
+    futures += [batch_queue.submit(prompt, max_tokens, 0.5, 0.9, None) for prompt, max_tokens in requests]
+    llm.gate.set()
+    assert [future.result(timeout=5) for future in futures] == ['HOLD'] + [p.upper() for p, _ in requests]
+    return llm.batches[1:]
+
+
+def test_batches_by_params_in_arrival_order():
+    requests = [('a1', 10), ('b1', 20), ('a2', 10), ('b2', 20), ('c1', 30), ('a3', 10)]
+    assert _run(requests, max_batch_size=8) == [(['a1', 'a2', 'a3'], 10), (['b1', 'b2'], 20), (['c1'], 30)]
+
+
+def test_deferred_requests_are_served_before_later_arrivals():
+    # 第一批满了之后，先到的 b1 必须先于后到的 a3、a4 处理
+    requests = [('a1', 10), ('b1', 20), ('a2', 10), ('a3', 10), ('a4', 10)]
+    assert _run(requests, max_batch_size=2) == [(['a1', 'a2'], 10), (['b1'], 20), (['a3', 'a4'], 10)]
+
+
+def _prefill_lengths(model):
+    # 记录每次前向传入的 token 数；generate 的第一次前向就是预填充
+    lengths = []
+    model.register_forward_pre_hook(lambda _, args, kwargs: lengths.append(kwargs['input_ids'].shape[1]),
+                                    with_kwargs=True)
+    return lengths
+
+
+def test_prefix_cache_hit_skips_prefill_and_leaves_entry_unchanged(capsys):
+    llm = TinyLLM()
+    cold = llm.generate_batch([PREFIX + ' list all paid orders'], max_tokens=5, temperature=0.1)[0]
+    assert llm.prefix_cache.misses == 1
+
+    llm.register_prefix(PREFIX)
+    (prefix_ids, (stored, _)), = llm.prefix_cache._entries.items()
+    snapshot = [(k.clone(), v.clone()) for k, v in zip(stored.key_cache, stored.value_cache)]
+
+    lengths = _prefill_lengths(llm.model)
+    prompt = PREFIX + ' list all paid orders'
+    prompt_len = len(llm.tokenizer(llm._render(prompt), add_special_tokens=False)['input_ids'])
+    for _ in range(2):
+        lengths.clear()
+        assert llm.generate_batch([prompt], max_tokens=5, temperature=0.1)[0] == cold
+        # 只预填充前缀之后的部分
+        assert lengths[0] == prompt_len - len(prefix_ids)
+    assert llm.prefix_cache.hits == 2
+    assert 'reused' in capsys.readouterr().out
+
+    # 存储的前缀缓存没有被生成过程扩展或改写
+    assert stored.get_seq_length() == len(prefix_ids)
+    for (k, v), (k0, v0) in zip(zip(stored.key_cache, stored.value_cache), snapshot):
+        assert torch.equal(k, k0) and torch.equal(v, v0)
+
+
+def test_fork_shares_tensors_and_extends_independently():
+    cache = transformers.DynamicCache()
+    cache.update(torch.ones(1, 2, 3, 4), torch.ones(1, 2, 3, 4), layer_idx=0)
+    fork = PrefixCache._fork(cache)
+    assert fork.key_cache[0] is cache.key_cache[0]  # 不复制张量
+    fork.update(torch.zeros(1, 2, 1, 4), torch.zeros(1, 2, 1, 4), layer_idx=0)
+    assert fork.get_seq_length() == 4 and cache.get_seq_length() == 3
@@ -0,0 +1,141 @@
+import os
+import ast
+import csv
+import json
+import sqlite3
+
+import pytest
+
+pytest.importorskip('sentence_transformers')
+pytest.importorskip('sklearn')
+pytest.importorskip('openai')
+os.environ.setdefault('LLM_CACHE_PATH', '')  # 测试中不写 LLM 响应缓存
+
+from src import modules
+from src.modules import TASL, EnhancedTALOG
+
+
+# ---- 重构前的实现（逐字保留核心逻辑），作为行为一致性的参照 ----
+
+def _old_info_from_csv(db_root_path, table_json):
+    csv_info = {}
+    value_prompt = {}
+    for table_info in table_json:
+        db_id = table_info['db_id']
+        conn = sqlite3.connect(os.path.normpath(os.path.join(db_root_path, db_id, f'{db_id}.sqlite')))
+        conn.text_factory = lambda x: x.decode('latin1', errors='ignore')
+        cursor = conn.cursor()
+        csv_dir = os.path.join(db_root_path, db_id, 'database_description')
+        for otn, tn in zip(table_info['table_names_original'], table_info['table_names']):
+            if os.path.exists(os.path.join(csv_dir, f"{tn}.csv")):
+                csv_path = os.path.join(csv_dir, f"{tn}.csv")
+            else:
+                csv_path = os.path.join(csv_dir, f"{otn}.csv")
+            column_info = {}
+            with open(csv_path, newline='', encoding="latin1") as f:
+                for row in csv.DictReader(f):
+                    ocn_header = [h for h in row.keys() if 'original_column_name' in h][0]
+                    ocn, cn = row[ocn_header].strip(), row['column_name']
+                    column_type = row['data_format'].strip()
+                    column_info[ocn] = [cn if cn not in ['', ' '] else ocn, row['column_description'].strip(),
+                                        column_type, row['value_description'].strip()]
+                    if column_type in ['text', 'date', 'datetime']:
+                        values = cursor.execute(f'''SELECT DISTINCT "{ocn}" FROM `{otn}` where "{ocn}" IS NOT NULL '''
+                                                f'''ORDER BY RANDOM()''').fetchall()
+                        if values and isinstance(values[0][0], str) and len(values[0][0]) < 50:
+                            if len(values) <= 10:
+                                value_prompt[f"{db_id}|{otn}|{ocn}"] = f"all possible values are {[v[0] for v in values]}"
+                            else:
+                                value_prompt[f"{db_id}|{otn}|{ocn}"] = f"example values are {[v[0] for v in values[:3]]}"
+            csv_info[f"{db_id}|{otn}"] = column_info
+        conn.close()
+    return csv_info, value_prompt
+
+
+def _values(prompt):
+    """取值提示中的值列表（重构前按 RANDOM() 排序，只比较取值集合）"""
+    return ast.literal_eval(prompt[prompt.index('['):])
+
+
+@pytest.fixture
+def talog(db_root, capsys):
+    return EnhancedTALOG(db_root, 'dev')
+
+
+def test_csv_info_and_value_prompts_match_previous_loader(db_root, talog):
+    old_csv_info, old_value_prompts = _old_info_from_csv(db_root, talog.table_json)
+    assert talog.csv_info == old_csv_info
+    assert talog.value_prompts.keys() == old_value_prompts.keys()
+    for key, prompt in talog.value_prompts.items():
+        old = old_value_prompts[key]
+        assert prompt.split(' [')[0] == old.split(' [')[0]
+        if prompt.startswith('all possible values'):
+            assert sorted(_values(prompt)) == sorted(_values(old))
+        else:
+            # 高基数列：重构后是确定性抽样，示例值个数相同且都来自该列
+            otn, ocn = key.split('|')[1:]
+            with sqlite3.connect(os.path.join(db_root, key.split('|')[0], f"{key.split('|')[0]}.sqlite")) as conn:
+                column = {v for v, in conn.execute(f'SELECT "{ocn}" FROM `{otn}`')}
+            assert len(_values(prompt)) == len(_values(old)) == 3
+            assert set(_values(prompt)) <= column
+
+
+def test_schema_prompt_matches_previous_output(talog):
+    sl_schemas = [('student', 'name'), ('student', 'grade'), ('class info', 'title')]
+    prompt = talog.generate_schema_prompt(0, sl_schemas)
+    assert prompt.startswith('{\n\tstudent.name: text, the full column name is student name, '
+                             'column description is full name of the student, example values are [')
+    assert "student.grade: text, the full column name is grade, value description is A: best C: worst, " \
+           "all possible values are ['A', 'B', 'C']\n" in prompt
+    assert '`class info`.title: text, the full column name is title, column description is class title' in prompt
+    assert prompt.endswith('\n\t}')
+
+
+def test_generate_pk_fk_reads_from_catalog(talog):
+    assert talog.generate_pk_fk(0) == ({'student': ['id'], 'class info': ['id']},
+                                       {'student.class_id': 'class info.id'})
+    assert talog.generate_pk_fk(1) == ({'orders': ['order_id', 'line']}, {})
+    assert talog.generate_pk_fk(1)[0] is talog.catalog.pk_fk('shop')[0]
+
+
+def test_dummy_schema_matches_previous_reconstruction(db_root, monkeypatch, capsys):
+    monkeypatch.chdir(db_root)
+    tasl = TASL(db_root, 'dev', os.path.join(db_root, 'column_meaning.json'))
+    assert tasl.schema_item_dic == {
+        'school': {'student': {'name': ' the name of the student', 'grade': ' letter grade,   A is best'},
+                   'class info': {'title': ' class title'}},
+        'shop': {'orders': {'status': ' order status'}},
+    }
+    schema = tasl.catalog.schema_prompt('shop', 'database_schema',
+                                        lambda db: tasl._generate_database_schema(tasl.schema_item_dic[db]))
+    assert schema == '{\n orders:\n  {\n\tstatus:  order status\n\t\n\t}\n }'
+    tasl.close()
+
+
+def test_dummy_sql_renders_schema_once_per_db_and_buffers_audit_log(db_root, monkeypatch, capsys):
+    monkeypatch.chdir(db_root)
+    prompts = []
+    monkeypatch.setattr(modules, 'collect_response',
+                        lambda prompt, stop=None: prompts.append(prompt) or '```sql\nSELECT "name" FROM student\n```')
+    tasl = TASL(db_root, 'dev', os.path.join(db_root, 'column_meaning.json'))
+    rendered = []
+    render = tasl._generate_database_schema
+    monkeypatch.setattr(tasl, '_generate_database_schema', lambda schema: rendered.append(schema) or render(schema))
+
+    for question_id in (0, 0, 1):
+        _, sqls = tasl.generate_dummy_sql(question_id)
+    # 每个问题都校验失败并重试一次（max_retries=2）；模式提示每个数据库只渲染一次
+    assert sqls == ('SELECT "name" FROM student',) * 2 and len(prompts) == 6
+    assert len(rendered) == 2
+    assert 'student:' in prompts[0] and prompts[0] == prompts[2]
+    assert 'orders:' in prompts[4] and 'student:' not in prompts[4]
+
+    # 审计记录先进内存和追加日志，close() 时才压缩成 dummy_sql.json
+    assert not os.path.exists('dummy_sql.json')
+    assert tasl.dummy_log.records[1] == 'SELECT name FROM student\t----- spider -----\tshop'
+    tasl.close()
+    with open('dummy_sql.json', encoding='utf-8') as f:
+        assert json.load(f) == {'0': 'SELECT name FROM student\t----- spider -----\tschool',
+                                '1': 'SELECT name FROM student\t----- spider -----\tshop'}
+    with open('dummy_sql.jsonl', encoding='utf-8') as f:
+        assert f.read() == ''
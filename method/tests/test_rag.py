@@ -0,0 +1,101 @@
+import json
+import numpy as np
+import pytest
+
+pytest.importorskip('sentence_transformers')
+pytest.importorskip('sklearn')
+
+from src.rag import RAGModule
+
+
+def _prompt(*pairs):
+    return ''.join(f"/* Answer the following: {question} */\n#reason: x\n#SQL: {sql}\n" for question, sql in pairs)
+
+
+@pytest.fixture
+def example_db(tmp_path):
+    questions = [
+        {'question': 'how many students score above average', 'evidence': '', 'db_id': 'school',
+         'prompt': _prompt(('list student scores', 'SELECT score FROM student'),
+                           ('count students', 'SELECT COUNT(*) FROM student'))},
+        {'question': 'which movie has the highest rating', 'evidence': '', 'db_id': 'movie',
+         'prompt': _prompt(('top rated film', 'SELECT title FROM movie ORDER BY rating DESC LIMIT 1'))},
+        {'question': 'average salary of employees', 'evidence': '', 'db_id': 'hr',
+         'prompt': _prompt(('mean employee salary', 'SELECT AVG(salary) FROM employee'))},
+    ]
+    path = tmp_path / 'question.json'
+    path.write_text(json.dumps({'questions': questions}), encoding='utf-8')
+    return str(path)
+
+
+def test_retrieve_returns_independent_copy(example_db, hash_encoder, capsys):
+    rag = RAGModule(example_db, encoder=hash_encoder)
+    query = 'how many students score above average'
+    results = rag.retrieve(query, top_k=2, min_similarity=-1)
+    assert results and results[0]['db_id'] == 'school'
+
+    # 缓存未命中时的返回值也不能引用示例库中的对象
+    results[0]['sql_examples'][0]['sql'] = 'MUTATED'
+    results[0]['sql_examples'].append({'sql': 'EXTRA'})
+    assert rag.sub_examples[0][0]['sql'] == 'SELECT score FROM student'
+    assert len(rag.sub_examples[0]) == 2
+
+    cached = rag.retrieve(query, top_k=2, min_similarity=-1)
+    assert cached[0]['sql_examples'][0]['sql'] == 'SELECT score FROM student'
+    assert rag.cache.hits == 1
+
+
+def test_retrieve_many_matches_retrieve_and_copies(example_db, hash_encoder, capsys):
+    rag = RAGModule(example_db, encoder=hash_encoder)
+    queries = ['average salary of employees', 'which movie has the highest rating',
+               'average salary of employees']
+    batched = rag.retrieve_many(queries, top_k=2, min_similarity=-1)
+    batched[0][0]['sql_examples'][0]['sql'] = 'MUTATED'
+    assert rag.sub_examples[2][0]['sql'] == 'SELECT AVG(salary) FROM employee'
+    for query, results in zip(queries[1:], batched[1:]):
+        assert rag.retrieve(query, top_k=2, min_similarity=-1) == results
+
+
+def test_sub_example_similarity_matches_fresh_encoding(example_db, hash_encoder, capsys):
+    rag = RAGModule(example_db, encoder=hash_encoder)
+    # 子示例矩阵保持内存映射，不在加载时整体读入
+    assert isinstance(rag.sub_embeddings, np.memmap)
+    query = 'count students with scores'
+    stored = rag.evaluate_examples_similarity(query, rag.sub_examples[0])
+    # 复制出的示例不在示例库中，走现场编码 + cosine_similarity 的路径
+    fresh = rag.evaluate_examples_similarity(query, [dict(ex, question_part=ex['question_part'] + ' ')
+                                                     for ex in rag.sub_examples[0]])
+    assert [r['example']['sql'] for r in stored] == [r['example']['sql'] for r in fresh]
+    assert np.allclose([r['similarity'] for r in stored], [r['similarity'] for r in fresh])
+
+
+def test_hybrid_fusion_scores():
+    from src.rag_hybrid import HybridRAGModule
+    hybrid = HybridRAGModule.__new__(HybridRAGModule)
+    hybrid.rrf_k, hybrid.dense_weight = 60, 0.25
+    bm25_scores, dense_scores = np.array([3.0, 2.0, 1.0]), np.array([0.1, 0.9, 0.5])
+
+    hybrid.fusion = 'rrf'
+    # BM25 名次 0, 1, 2；稠密名次 2, 0, 1
+    assert np.allclose(hybrid._fuse(bm25_scores, dense_scores), [1 / 61 + 1 / 63, 1 / 62 + 1 / 61, 1 / 63 + 1 / 62])
+    hybrid.fusion = 'weighted'
+    assert np.allclose(hybrid._fuse(bm25_scores, dense_scores),
+                       0.75 * bm25_scores / 3 + 0.25 * dense_scores)
+
+
+def test_hybrid_retrieve_reranks_bm25_candidates(example_db, hash_encoder, capsys):
+    from src.rag_hybrid import HybridRAGModule
+    dense = RAGModule(example_db, encoder=hash_encoder)
+    hybrid = HybridRAGModule(example_db, encoder=hash_encoder, candidate_k=2)
+    query = 'average salary of employees'
+    results = hybrid.retrieve(query, top_k=2, min_similarity=-1)
+    assert 'Hybrid RAG query' in capsys.readouterr().out
+    # 结果结构与稠密检索相同，similarity 仍是稠密余弦相似度
+    assert results[0]['db_id'] == 'hr'
+    assert results[0] == dense.retrieve(query, top_k=1, min_similarity=-1)[0]
+    assert len(results) <= 2
+    # 没有可用关键词时退回纯稠密检索
+    assert hybrid.retrieve('?', top_k=3, min_similarity=-1) == dense.retrieve('?', top_k=3, min_similarity=-1)
+    # 融合参数不同的检索器不共用缓存
+    assert hybrid.cache.index_version != dense.cache.index_version
+    assert HybridRAGModule(example_db, encoder=hash_encoder, fusion='weighted').cache.index_version != hybrid.cache.index_version
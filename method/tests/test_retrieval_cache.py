@@ -0,0 +1,51 @@
+from src.retrieval_cache import RetrievalCache
+
+RESULTS = [{'db_id': 'school', 'similarity': 0.9, 'sql_examples': [{'sql': 'SELECT 1'}]}]
+
+
+def test_key_normalizes_whitespace_and_covers_parameters():
+    cache = RetrievalCache('v1')
+    key = cache.make_key('how many  students\n', 10, 0.3)
+    assert key == cache.make_key('  how many students', 10, 0.3)
+    assert key != cache.make_key('how many students', 5, 0.3)
+    assert key != cache.make_key('how many students', 10, 0.5)
+    assert key != RetrievalCache('v2').make_key('how many students', 10, 0.3)
+
+
+def test_hit_returns_fresh_copy():
+    cache = RetrievalCache('v1')
+    key = cache.make_key('q', 10, 0.3)
+    assert cache.get(key) is None
+    cache.put(key, RESULTS)
+    first = cache.get(key)
+    first[0]['sql_examples'].clear()
+    assert cache.get(key) == RESULTS
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_lru_eviction():
+    cache = RetrievalCache('v1', max_entries=2)
+    keys = [cache.make_key(f"q{i}", 10, 0.3) for i in range(3)]
+    cache.put(keys[0], RESULTS)
+    cache.put(keys[1], RESULTS)
+    cache.get(keys[0])  # 最近使用过，不被淘汰
+    cache.put(keys[2], RESULTS)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == RESULTS and cache.get(keys[2]) == RESULTS
+
+
+def test_disk_tier_persists_and_index_version_invalidates(tmp_path):
+    path = str(tmp_path / 'retrieval.sqlite')
+    cache = RetrievalCache('v1', path=path)
+    cache.put(cache.make_key('q', 10, 0.3), RESULTS)
+    cache.close()
+
+    reopened = RetrievalCache('v1', path=path)
+    assert reopened.get(reopened.make_key('q', 10, 0.3)) == RESULTS
+    assert reopened.disk_hits == 1
+    reopened.close()
+
+    # 嵌入模型或示例库变化后索引版本不同，旧结果不再命中
+    rebuilt = RetrievalCache('v2', path=path)
+    assert rebuilt.get(rebuilt.make_key('q', 10, 0.3)) is None
+    rebuilt.close()
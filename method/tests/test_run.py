@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import threading
+
+import pytest
+
+pytest.importorskip('sentence_transformers')
+pytest.importorskip('sklearn')
+pytest.importorskip('openai')
+os.environ.setdefault('LLM_CACHE_PATH', '')  # 测试中不写 LLM 响应缓存
+
+from src.run import generate_sql
+from src.llm_async import RetryBudgetExceeded
+
+
+class FakeTASL:
+    def __init__(self, n):
+        self.question_json = [{'db_id': f'db{i % 2}', 'question': f'q{i}', 'evidence': ''} for i in range(n)]
+
+    def get_schema(self, i):
+        return []
+
+
+class FakeTALOG:
+    """模拟 LLM 往返：每个问题耗时 delay 秒，记录同时在途的问题数"""
+
+    def __init__(self, delay=0.05, unavailable=()):
+        self.delay = delay
+        self.unavailable = set(unavailable)
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def sr2sql(self, i, sl_schemas):
+        with self._lock:
+            self.calls.append(i)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if i in self.unavailable:
+                raise RetryBudgetExceeded('gave up after 3 attempts')
+            return 'SR', f'SELECT {i}'
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def test_workers_bound_concurrency_and_keep_every_result(tmp_path, capsys):
+    output = str(tmp_path / 'predict_dev.json')
+    talog = FakeTALOG()
+    records = generate_sql(FakeTASL(12), talog, output, workers=3, fsync_every=4)
+
+    assert 1 < talog.max_in_flight <= 3
+    assert sorted(talog.calls) == list(range(12))
+    with open(output, encoding='utf-8') as f:
+        results = json.load(f)
+    # 并发完成顺序不定，压缩后的结果仍按索引排列
+    assert list(results) == [str(i) for i in range(12)]
+    assert results['5'] == 'SELECT 5\t----- bird -----\tdb1'
+    assert records[5] == results['5']
+    assert (tmp_path / 'predict_dev.jsonl').read_text(encoding='utf-8') == ''
+
+
+def test_resume_fills_holes_and_skips_unavailable(tmp_path, capsys):
+    output = str(tmp_path / 'predict_dev.json')
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'0': 'SELECT 0\t----- bird -----\tdb0', '2': 'SELECT 2\t----- bird -----\tdb0'}, f)
+
+    talog = FakeTALOG(delay=0, unavailable={3})
+    generate_sql(FakeTASL(5), talog, output, workers=2)
+    assert sorted(talog.calls) == [1, 3, 4]
+    with open(output, encoding='utf-8') as f:
+        assert sorted(json.load(f)) == ['0', '1', '2', '4']
+    assert 'left for resume' in capsys.readouterr().out
+
+    # 重试预算用尽的问题没有写兜底 SQL，续跑时只重新生成它
+    talog = FakeTALOG(delay=0)
+    generate_sql(FakeTASL(5), talog, output, workers=2)
+    assert talog.calls == [3]
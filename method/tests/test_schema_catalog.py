@@ -0,0 +1,83 @@
+import os
+import copy
+import json
+import threading
+
+import pytest
+
+from src.schema_catalog import SchemaCatalog
+
+
+@pytest.fixture
+def tables(db_root):
+    with open(os.path.join(db_root, 'dev_tables.json')) as f:
+        return json.load(f)
+
+
+def _scan_pk_fk(table):
+    # 原先每次调用时在 generate_pk_fk 中现算的主外键字典
+    table_names_original = table['table_names_original']
+    column_names_original = table['column_names_original']
+    pk_dict, fk_dict = {}, {}
+    for pk_idx in table['primary_keys']:
+        if type(pk_idx) == int:
+            pk_dict[str(table_names_original[column_names_original[pk_idx][0]])] = [column_names_original[pk_idx][-1]]
+        else:
+            pk_dict[str(table_names_original[column_names_original[pk_idx[0]][0]])] = [
+                column_names_original[idx][-1] for idx in pk_idx]
+    for src_col_idx, tgt_col_idx in table['foreign_keys']:
+        fk_dict[f"{table_names_original[column_names_original[src_col_idx][0]]}."
+                f"{column_names_original[src_col_idx][-1]}"] = \
+            f"{table_names_original[column_names_original[tgt_col_idx][0]]}.{column_names_original[tgt_col_idx][-1]}"
+    return pk_dict, fk_dict
+
+
+def test_matches_table_json_scans(tables):
+    catalog = SchemaCatalog(tables)
+    assert catalog.db_ids() == ['school', 'shop']
+    for table in tables:
+        db_id = table['db_id']
+        names = table['table_names_original']
+        assert catalog.pk_fk(db_id) == _scan_pk_fk(table)
+        assert catalog.columns(db_id) == [[names[t], c] for t, c in table['column_names_original'][1:]]
+    assert catalog.pk_fk('school') == ({'student': ['id'], 'class info': ['id']},
+                                       {'student.class_id': 'class info.id'})
+    assert catalog.pk_fk('shop') == ({'orders': ['order_id', 'line']}, {})
+    assert catalog.column_map('school') == {'student': {'id', 'name', 'grade', 'class_id'},
+                                            'class info': {'id', 'title'}}
+
+
+def test_duplicate_db_id_keeps_first_entry(tables):
+    duplicate = copy.deepcopy(tables[1])
+    duplicate['table_names_original'] = ['other']
+    catalog = SchemaCatalog(tables + [duplicate])
+    assert 'shop' in catalog and 'missing' not in catalog
+    assert catalog.table_names('shop') == ['orders']
+    assert catalog.get('shop') is tables[1]
+
+
+def test_schema_prompt_is_rendered_once_per_db_and_kind(tables):
+    catalog = SchemaCatalog(tables)
+    rendered = []
+    barrier = threading.Barrier(4)
+
+    def render(db_id):
+        rendered.append(db_id)
+        return f'schema of {db_id}'
+
+    def worker():
+        barrier.wait()
+        for _ in range(10):
+            assert catalog.schema_prompt('school', 'database_schema', render) == 'schema of school'
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 并发首次访问时可能重复渲染，但之后全部命中
+    assert 1 <= len(rendered) <= 4
+    count = len(rendered)
+    assert catalog.schema_prompt('school', 'database_schema', render) == 'schema of school'
+    assert catalog.schema_prompt('school', 'other', render) == 'schema of school'
+    assert len(rendered) == count + 1
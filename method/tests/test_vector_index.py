@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from src import vector_index
+from src.vector_index import BruteForceIndex, build_index, normalize, top_k_from_scores
+
+
+@pytest.fixture
+def vectors():
+    # 成簇的向量，近似后端在小规模上也能稳定召回
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    return (centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.normal(size=(2000, 32))).astype(np.float32)
+
+
+@pytest.fixture
+def queries(vectors):
+    rng = np.random.default_rng(1)
+    return vectors[rng.integers(0, len(vectors), size=20)] + 0.05 * rng.normal(size=(20, 32)).astype(np.float32)
+
+
+def _recall(index, vectors, queries, top_k=10):
+    expected = BruteForceIndex(vectors).search_many(queries, top_k)
+    found = index.search_many(queries, top_k)
+    hits = sum(len(set(e[0].tolist()) & set(f[0].tolist())) for e, f in zip(expected, found))
+    return hits / (top_k * len(queries))
+
+
+def test_top_k_from_scores_sorted_and_bounded():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+    ids, top = top_k_from_scores(scores, 2)
+    assert ids.tolist() == [1, 3]
+    np.testing.assert_allclose(top, [0.9, 0.7])
+    assert top_k_from_scores(scores, 10)[0].tolist() == [1, 3, 2, 0]
+    assert len(top_k_from_scores(scores, 0)[0]) == 0
+
+
+def test_exact_search_is_cosine_top_k(vectors, queries):
+    index = BruteForceIndex(vectors)
+    for query, (ids, scores) in zip(queries, index.search_many(queries, 5, chunk_size=7)):
+        cosine = normalize(vectors) @ normalize(query)
+        assert ids.tolist() == np.argsort(-cosine, kind='stable')[:5].tolist()
+        np.testing.assert_allclose(scores, cosine[ids], rtol=1e-5)
+        np.testing.assert_array_equal(index.search(query, 5)[0], ids)
+
+
+def test_auto_uses_exact_below_limit(vectors):
+    assert build_index(vectors, 'auto').name == 'exact'
+
+
+@pytest.mark.skipif(vector_index.hnswlib is None, reason='hnswlib not installed')
+def test_hnsw_recall(vectors, queries):
+    index = build_index(vectors, 'hnsw')
+    assert len(index) == len(vectors)
+    assert _recall(index, vectors, queries) >= 0.9
+
+
+@pytest.mark.skipif(vector_index.faiss is None, reason='faiss not installed')
+def test_faiss_ivf_recall(vectors, queries):
+    index = build_index(vectors, 'faiss-ivf')
+    assert len(index) == len(vectors)
+    assert _recall(index, vectors, queries) >= 0.9
+
+
+@pytest.mark.parametrize('backend', ['int8', 'float16'])
+def test_quantized_recall_and_memory(vectors, queries, backend):
+    index = build_index(vectors, backend)
+    assert index.nbytes < BruteForceIndex(vectors).nbytes
+    assert _recall(index, vectors, queries) >= 0.9
+
+
+@pytest.mark.parametrize('backend', ['int8+rescore', 'float16+rescore'])
+def test_rescore_returns_full_precision_scores(vectors, queries, backend):
+    index = build_index(vectors, backend)
+    exact = BruteForceIndex(vectors)
+    for (ids, scores), query in zip(index.search_many(queries, 10, chunk_size=3), queries):
+        np.testing.assert_allclose(scores, exact.vectors[ids] @ normalize(query), rtol=1e-5)
+        assert np.all(np.diff(scores) <= 0)
+    assert _recall(index, vectors, queries) >= 0.95
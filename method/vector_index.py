@@ -0,0 +1,287 @@
+import time
+import argparse
+import numpy as np
+from typing import Dict, List, Tuple
+
+# 近似最近邻后端为可选依赖，哪个可用就用哪个
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# 示例库小于该规模时 auto 模式直接用精确检索
+AUTO_EXACT_LIMIT = 50000
+# 量化索引分块反量化时每块的行数，限制临时 float32 矩阵的大小
+QUANT_CHUNK_ROWS = 8192
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_from_scores(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """argpartition 取前 k 个，再只对这 k 个排序（按相似度降序）"""
+    top_k = min(top_k, scores.shape[0])
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if top_k < scores.shape[0]:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    order = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return order, scores[order]
+
+
+class BruteForceIndex:
+    """精确检索：向量预先归一化，余弦相似度即为内积"""
+
+    name = 'exact'
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = normalize(vectors)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.vectors @ normalize(query).reshape(-1)
+        return top_k_from_scores(scores, top_k)
+
+    def search_many(self, queries: np.ndarray, top_k: int,
+                    chunk_size: int = 1024) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量检索：每 chunk_size 个查询做一次矩阵乘，再逐行取 top-k"""
+        queries = normalize(queries)
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            scores = queries[start:start + chunk_size] @ self.vectors.T
+            results.extend(top_k_from_scores(row, top_k) for row in scores)
+        return results
+
+
+class HNSWIndex:
+    """hnswlib 的 HNSW 图索引（余弦空间）"""
+
+    name = 'hnsw'
+
+    def __init__(self, vectors: np.ndarray, m: int = 32, ef_construction: int = 200, ef_search: int = 128):
+        assert hnswlib is not None, "hnswlib is not installed"
+        vectors = normalize(vectors)
+        self.size = vectors.shape[0]
+        self.index = hnswlib.Index(space='cosine', dim=vectors.shape[1])
+        self.index.init_index(max_elements=max(1, self.size), M=m, ef_construction=ef_construction)
+        self.index.add_items(vectors, np.arange(self.size))
+        self.index.set_ef(ef_search)
+
+    def __len__(self):
+        return self.size
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        top_k = min(top_k, self.size)
+        labels, distances = self.index.knn_query(normalize(query).reshape(1, -1), k=top_k)
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def search_many(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        labels, distances = self.index.knn_query(normalize(queries), k=min(top_k, self.size))
+        return [(row.astype(np.int64), (1.0 - dist).astype(np.float32)) for row, dist in zip(labels, distances)]
+
+
+class FaissIVFIndex:
+    """faiss 的倒排文件索引（内积度量，向量已归一化）"""
+
+    name = 'faiss-ivf'
+
+    def __init__(self, vectors: np.ndarray, nlist: int = None, nprobe: int = 16):
+        assert faiss is not None, "faiss is not installed"
+        vectors = normalize(vectors)
+        self.size = vectors.shape[0]
+        nlist = nlist or max(1, int(np.sqrt(self.size)))
+        quantizer = faiss.IndexFlatIP(vectors.shape[1])
+        self.index = faiss.IndexIVFFlat(quantizer, vectors.shape[1], nlist, faiss.METRIC_INNER_PRODUCT)
+        self.index.train(vectors)
+        self.index.add(vectors)
+        self.index.nprobe = min(nprobe, nlist)
+        self._quantizer = quantizer  # IndexIVFFlat 不持有 quantizer 的引用
+
+    def __len__(self):
+        return self.size
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search_many(normalize(query).reshape(1, -1), top_k)[0]
+
+    def search_many(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        scores, labels = self.index.search(normalize(queries), min(top_k, self.size))
+        keep = labels >= 0
+        return [(row[k].astype(np.int64), score[k].astype(np.float32)) for row, score, k in zip(labels, scores, keep)]
+
+
+class QuantizedIndex:
+    """
+    量化的精确检索：向量归一化后按行量化为 int8（每行一个缩放因子）或 float16，
+    检索时分块反量化做矩阵乘，不在内存中保留 float32 副本。
+
+    给出 rescore_vectors（通常是内存映射的全精度嵌入存储）时，先在量化矩阵上取
+    rescore_factor * top_k 个候选，再只读取这些行的全精度向量重新打分。
+    """
+
+    def __init__(self, vectors: np.ndarray, dtype: str = 'int8', rescore_vectors: np.ndarray = None,
+                 rescore_factor: int = 4):
+        assert dtype in ('int8', 'float16'), "dtype should be int8 or float16"
+        self.name = dtype + ('+rescore' if rescore_vectors is not None else '')
+        self.size, self.dim = vectors.shape
+        self.codes = np.empty((self.size, self.dim), dtype=dtype)
+        self.scales = np.ones(self.size, dtype=np.float32)
+        # 分块量化，避免一次性生成整个库的 float32 归一化副本
+        for start in range(0, self.size, QUANT_CHUNK_ROWS):
+            block = normalize(vectors[start:start + QUANT_CHUNK_ROWS])
+            if dtype == 'int8':
+                scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127.0
+                self.codes[start:start + len(block)] = np.round(block / scales[:, None])
+                self.scales[start:start + len(block)] = scales
+            else:
+                self.codes[start:start + len(block)] = block
+        self.rescore_vectors = rescore_vectors
+        self.rescore_factor = rescore_factor
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """(查询数, 库大小) 的近似余弦相似度"""
+        scores = np.empty((len(queries), self.size), dtype=np.float32)
+        for start in range(0, self.size, QUANT_CHUNK_ROWS):
+            block = self.codes[start:start + QUANT_CHUNK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = (queries @ block.T) * self.scales[start:start + len(block)]
+        return scores
+
+    def _rescore(self, query: np.ndarray, candidates: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.sort(candidates)  # 有序读取内存映射的行
+        scores = normalize(self.rescore_vectors[rows]) @ query
+        order, scores = top_k_from_scores(scores, top_k)
+        return rows[order], scores
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search_many(np.asarray(query).reshape(1, -1), top_k)[0]
+
+    def search_many(self, queries: np.ndarray, top_k: int,
+                    chunk_size: int = 64) -> List[Tuple[np.ndarray, np.ndarray]]:
+        queries = normalize(queries)
+        fetch_k = top_k * self.rescore_factor if self.rescore_vectors is not None else top_k
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            chunk = queries[start:start + chunk_size]
+            for query, row in zip(chunk, self._scores(chunk)):
+                candidates, scores = top_k_from_scores(row, fetch_k)
+                if self.rescore_vectors is not None:
+                    candidates, scores = self._rescore(query, candidates, top_k)
+                results.append((candidates, scores))
+        return results
+
+
+BACKENDS = {
+    'exact': BruteForceIndex,
+    'hnsw': HNSWIndex,
+    'faiss-ivf': FaissIVFIndex,
+    'int8': lambda vectors: QuantizedIndex(vectors, 'int8'),
+    'float16': lambda vectors: QuantizedIndex(vectors, 'float16'),
+    'int8+rescore': lambda vectors: QuantizedIndex(vectors, 'int8', rescore_vectors=vectors),
+    'float16+rescore': lambda vectors: QuantizedIndex(vectors, 'float16', rescore_vectors=vectors),
+}
+ANN_BACKENDS = ['hnsw', 'faiss-ivf']
+
+
+def available_backends() -> List[str]:
+    backends = ['exact', 'int8', 'int8+rescore', 'float16', 'float16+rescore']
+    if hnswlib is not None:
+        backends.append('hnsw')
+    if faiss is not None:
+        backends.append('faiss-ivf')
+    return backends
+
+
+def build_index(vectors: np.ndarray, backend: str = 'auto'):
+    """
+    构建向量索引
+
+    Args:
+        vectors: (n, dim) 嵌入矩阵（可以是内存映射数组；+rescore 后端从中读取候选行重新打分）
+        backend: exact / int8 / float16 / int8+rescore / float16+rescore / hnsw / faiss-ivf /
+                 auto（规模小于 AUTO_EXACT_LIMIT 时用精确检索，否则使用已安装的第一个近似后端）
+    """
+    if backend == 'auto':
+        approx = [b for b in ANN_BACKENDS if b in available_backends()]
+        backend = approx[0] if approx and len(vectors) >= AUTO_EXACT_LIMIT else 'exact'
+    return BACKENDS[backend](vectors)
+
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, top_k: int = 10,
+              backends: List[str] = None) -> Dict[str, Dict[str, float]]:
+    """以精确检索为基准，统计各后端的 recall@k、构建耗时、单次/批量查询延迟和内存占用"""
+    backends = backends or available_backends()
+    exact = BruteForceIndex(vectors)
+    truth = [set(exact.search(q, top_k)[0].tolist()) for q in queries]
+    report = {}
+    for backend in backends:
+        start = time.perf_counter()
+        index = build_index(vectors, backend)
+        build_seconds = time.perf_counter() - start
+        hits = 0
+        start = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            hits += len(expected & set(index.search(q, top_k)[0].tolist()))
+        latency = (time.perf_counter() - start) / max(1, len(queries))
+        start = time.perf_counter()
+        index.search_many(np.asarray(queries, dtype=np.float32), top_k)
+        batch_latency = (time.perf_counter() - start) / max(1, len(queries))
+        report[backend] = {
+            'recall': hits / max(1, sum(len(t) for t in truth)),
+            'latency_ms': latency * 1000,
+            'batch_latency_ms': batch_latency * 1000,
+            'build_s': build_seconds,
+            # 近似图索引的内存占用不易统计，记为 nan
+            'memory_mb': getattr(index, 'nbytes', float('nan')) / 2 ** 20
+        }
+    return report
+
+
+def print_benchmark(report: Dict[str, Dict[str, float]], top_k: int):
+    print("{:<16} {:<12} {:<16} {:<16} {:<12} {:<12}".format(
+        'backend', f'recall@{top_k}', 'latency (ms)', 'batched (ms)', 'build (s)', 'memory (MB)'))
+    for backend, row in report.items():
+        print("{:<16} {:<12.4f} {:<16.3f} {:<16.3f} {:<12.2f} {:<12.1f}".format(
+            backend, row['recall'], row['latency_ms'], row['batch_latency_ms'], row['build_s'], row['memory_mb']))
+
+
+if __name__ == '__main__':
+    # 示例：python -m src.vector_index --embeddings ./question_embeddings.npy --num_queries 200
+    parser = argparse.ArgumentParser("Vector index recall/latency benchmark")
+    parser.add_argument('--embeddings', type=str, default=None, help='EmbeddingStore 生成的 .npy；缺省时使用随机向量')
+    parser.add_argument('--synthetic_size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--num_queries', type=int, default=200)
+    parser.add_argument('--top_k', type=int, default=10)
+    parser.add_argument('--noise', type=float, default=0.05, help='查询 = 随机抽取的库内向量 + 高斯噪声')
+    opt = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if opt.embeddings:
+        bank = np.load(opt.embeddings, mmap_mode='r')  # 保持内存映射，+rescore 后端只读取候选行
+    else:
+        bank = normalize(rng.standard_normal((opt.synthetic_size, opt.dim), dtype=np.float32))
+    picks = np.sort(rng.choice(len(bank), size=min(opt.num_queries, len(bank)), replace=False))
+    queries = normalize(bank[picks]) + opt.noise * rng.standard_normal((len(picks), bank.shape[1]), dtype=np.float32)
+    print(f"{len(bank)} vectors, {len(queries)} queries, backends: {available_backends()}")
+    print_benchmark(benchmark(bank, queries, opt.top_k), opt.top_k)